@@ -59,7 +59,11 @@ CREATE TABLE Squad (
     competition_id INTEGER REFERENCES Competition(id),
     budget DECIMAL(15, 2) NOT NULL,
     nationality_id INTEGER REFERENCES Nationality(id),
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Rating aggregates maintained by the API on every rating write
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    rating_score DOUBLE PRECISION NOT NULL DEFAULT 3
 );
 
 -- Table for linking players to squads
@@ -67,7 +71,8 @@ CREATE TABLE Squad_Player (
     id SERIAL PRIMARY KEY,
     squad_id INTEGER REFERENCES Squad(id),
     player_id INTEGER REFERENCES Player(id),
-    position_in_squad VARCHAR(50) NOT NULL
+    position_in_squad VARCHAR(50) NOT NULL,
+    CONSTRAINT uq_squad_player_squad_player UNIQUE (squad_id, player_id)
 );
 
 -- Table for storing ratings given to squads by users
@@ -80,6 +85,23 @@ CREATE TABLE Rating (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Change log of the catalog read by /catalog/changes: the version of the last change of every changed
+-- player, team (row_id) and team-competition link (row_id = team_id, related_id = competition_id)
+CREATE SEQUENCE catalog_change_version_seq;
+CREATE TABLE Catalog_Change (
+    table_name VARCHAR(50),
+    row_id INTEGER,
+    related_id INTEGER DEFAULT 0,
+    version BIGINT NOT NULL UNIQUE DEFAULT nextval('catalog_change_version_seq'),
+    PRIMARY KEY (table_name, row_id, related_id)
+);
+
+-- Version of every table cached in the API processes, bumped with each cache invalidation NOTIFY
+CREATE TABLE Cache_Version (
+    table_name VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL
+);
+
 -- Create views
 CREATE VIEW SquadDetails AS
 SELECT
@@ -124,15 +146,43 @@ CREATE VIEW Squad_Average_Rating AS
 SELECT
     s.id AS squad_id,
     u.username,
-    AVG(r.rating) AS average_rating
+    s.rating_sum::NUMERIC / s.rating_count AS average_rating
 FROM
     Squad s
-    JOIN Rating r ON s.id = r.squad_id
     JOIN "User" u ON s.user_id = u.id
-GROUP BY
-    s.id,
-    u.username;
+WHERE
+    s.rating_count > 0;
 
 -- Create indexes
 CREATE INDEX idx_player_name_position ON Player (name, position);
 CREATE INDEX idx_rating_squad ON Rating (squad_id);
+
+-- Accent-insensitive name search (pg_trgm + unaccent)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- unaccent() is only STABLE, this wrapper can be used in index expressions
+CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text AS
+$$ SELECT public.unaccent('public.unaccent', $1) $$
+LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+
+CREATE INDEX idx_player_name_trgm ON Player USING gin (f_unaccent(name) gin_trgm_ops);
+CREATE INDEX idx_squad_name_trgm ON Squad USING gin (f_unaccent(name) gin_trgm_ops);
+
+-- Leaderboard of squads by Bayesian rating score
+CREATE INDEX idx_squad_rating_score ON Squad (rating_score DESC, id);
+CREATE INDEX idx_squad_competition_rating_score ON Squad (competition_id, rating_score DESC, id);
+CREATE INDEX idx_squad_nationality_rating_score ON Squad (nationality_id, rating_score DESC, id);
+
+-- Backfill of the rating aggregates for existing databases (prior: 5 ratings of 3)
+-- ALTER TABLE Squad ADD COLUMN rating_count INTEGER NOT NULL DEFAULT 0,
+--     ADD COLUMN rating_sum INTEGER NOT NULL DEFAULT 0,
+--     ADD COLUMN rating_score DOUBLE PRECISION NOT NULL DEFAULT 3;
+-- UPDATE Squad s SET rating_count = r.count, rating_sum = r.sum, rating_score = (5 * 3 + r.sum)::DOUBLE PRECISION / (5 + r.count)
+-- FROM (SELECT squad_id, COUNT(*) AS count, SUM(rating) AS sum FROM Rating GROUP BY squad_id) r
+-- WHERE s.id = r.squad_id;
+
+-- One row per player and squad for existing databases: keep the oldest row of each duplicate, then add the constraint
+-- DELETE FROM Squad_Player a USING Squad_Player b
+-- WHERE a.squad_id = b.squad_id AND a.player_id = b.player_id AND a.id > b.id;
+-- ALTER TABLE Squad_Player ADD CONSTRAINT uq_squad_player_squad_player UNIQUE (squad_id, player_id);
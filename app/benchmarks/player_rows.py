@@ -0,0 +1,61 @@
+# Time and memory of reading and serializing a large player page as ORM instances and as Core rows.
+# Run from the app folder against DATABASE_URL: python -m benchmarks.player_rows [players] [--seed]
+# --seed first adds synthetic players (without team or nationality) until the table has that many.
+import asyncio
+import sys
+import tracemalloc
+from time import perf_counter
+from pydantic import TypeAdapter
+from sqlalchemy import func, insert
+from sqlalchemy.future import select
+from db import SessionLocal, engine
+from models.models import Player, PlayerPage
+from crud.pagination import get_page
+from core.responses import FastJSONResponse
+
+POSITIONS = ["GK", "LB", "CB", "RB", "CDM", "CM", "CAM", "LM", "RM", "LW", "RW", "ST"]
+SEED_BATCH = 10000
+
+async def seed(count: int):
+    async with SessionLocal() as db:
+        existing = (await db.execute(select(func.count()).select_from(Player))).scalar_one()
+        for start in range(existing, count, SEED_BATCH):
+            rows = [{"name": "Seed player %d" % i, "market_value": i % 100000, "position": POSITIONS[i % 12],
+                     "alternate_position": POSITIONS[(i + 1) % 12] if i % 2 else None}
+                    for i in range(start, min(start + SEED_BATCH, count))]
+            await db.execute(insert(Player), rows)
+        await db.commit()
+
+async def read_and_serialize(count: int, as_rows: bool, adapter: TypeAdapter):
+    async with SessionLocal() as db:
+        start = perf_counter()
+        players, next_cursor = await get_page(db, select(Player), Player, None, count, None, as_rows)
+        loaded = perf_counter()
+        content = adapter.dump_python(adapter.validate_python({"players": players, "next_cursor": next_cursor}),
+                                      mode="json", exclude_unset=True)
+        body = FastJSONResponse(content).body
+        return len(players), loaded - start, perf_counter() - loaded, len(body)
+
+# Timed without tracemalloc (it slows allocations down a lot), then run again to get the peak memory
+async def measure(count: int, as_rows: bool, adapter: TypeAdapter):
+    rows, load, serialize, size = await read_and_serialize(count, as_rows, adapter)
+    tracemalloc.start()
+    await read_and_serialize(count, as_rows, adapter)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return rows, load, serialize, peak, size
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 1000000
+    if "--seed" in sys.argv:
+        await seed(count)
+
+    adapter = TypeAdapter(PlayerPage)
+    print("%-10s %8s %10s %12s %12s %12s" % ("mode", "rows", "load (s)", "serialize (s)", "peak (MB)", "body (MB)"))
+    for label, as_rows in [("orm", False), ("core rows", True)]:
+        rows, load, serialize, peak, size = await measure(count, as_rows, adapter)
+        print("%-10s %8d %10.2f %12.2f %12.1f %12.1f" % (label, rows, load, serialize, peak / 2 ** 20, size / 2 ** 20))
+    await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+# Serialization time of a /players/ page, before and after the response models.
+# Run from the app folder: python -m benchmarks.serialization [players] [repeats]
+import json
+import sys
+from decimal import Decimal
+from time import perf_counter
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from models.models import Player, PlayerPage
+from core.responses import FastJSONResponse, orjson
+
+POSITIONS = ["GK", "LB", "CB", "RB", "CDM", "CM", "CAM", "LM", "RM", "LW", "RW", "ST"]
+
+def build_page(count: int) -> dict:
+    players = [
+        Player(id=i, name="Player %d" % i, nationality_id=i % 50 + 1, team_id=i % 500 + 1,
+               market_value=Decimal(i * 1000) / 100, position=POSITIONS[i % 12],
+               alternate_position=POSITIONS[(i + 1) % 12] if i % 2 else None)
+        for i in range(1, count + 1)
+    ]
+    return {"players": players, "next_cursor": None}
+
+# Before: no response model, jsonable_encoder walks every ORM object and json.dumps renders it
+def serialize_before(page: dict) -> bytes:
+    return json.dumps(jsonable_encoder(page), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+# After: what FastAPI does with response_model=PlayerPage and FastJSONResponse
+def serialize_after(page: dict, adapter: TypeAdapter) -> bytes:
+    content = adapter.dump_python(adapter.validate_python(page), mode="json", exclude_unset=True)
+    return FastJSONResponse(content).body
+
+# Cached reference routes skip the Python objects and dump straight to JSON bytes
+def serialize_dump_json(page: dict, adapter: TypeAdapter) -> bytes:
+    return adapter.dump_json(adapter.validate_python(page), exclude_unset=True)
+
+def best_time(function, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = perf_counter()
+        function()
+        best = min(best, perf_counter() - start)
+    return best
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    page = build_page(count)
+    adapter = TypeAdapter(PlayerPage)
+    assert json.loads(serialize_before(page)) == json.loads(serialize_after(page, adapter))
+
+    print("%d players, best of %d, orjson %s" % (count, repeats, "installed" if orjson is not None else "not installed"))
+    before = best_time(lambda: serialize_before(page), repeats)
+    print("jsonable_encoder + json.dumps:    %8.1f ms" % (before * 1000))
+    for label, function in [("response model + FastJSONResponse", lambda: serialize_after(page, adapter)),
+                            ("response model dump_json", lambda: serialize_dump_json(page, adapter))]:
+        elapsed = best_time(function, repeats)
+        print("%-33s %8.1f ms  (%.1fx)" % (label + ":", elapsed * 1000, before / elapsed))
+
+if __name__ == "__main__":
+    main()
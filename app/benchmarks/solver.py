@@ -0,0 +1,42 @@
+# Time of the lineup search on a large synthetic pool, and a check that it stays within the time limit.
+# Run from the app folder: python -m benchmarks.solver [players] [time limit]
+# Exits with an error when a search runs well past the limit.
+import random
+import sys
+from time import perf_counter
+from crud.squad_solver import FORMATION_SLOTS, find_best_lineup
+
+POSITIONS = ["GK", "LB", "CB", "RB", "CDM", "CM", "CAM", "LM", "RM", "LW", "RW", "ST"]
+ALTERNATE_POSITIONS = [None, "CB", "CM", "ST,LW", "LB,LM"]
+# Seconds a search may run over the limit (the candidates are prepared before the first clock check)
+TOLERANCE = 0.25
+
+def build_players(count: int) -> list:
+    generator = random.Random(count)
+    return [{"id": i, "cost": generator.randrange(100, 10 ** 9), "position": generator.choice(POSITIONS),
+             "alternate_position": generator.choice(ALTERNATE_POSITIONS)} for i in range(1, count + 1)]
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    time_limit = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    players = build_players(count)
+
+    print("%d players, time limit %.2f s" % (count, time_limit))
+    late = []
+    # Without a budget (Squad.budget is nullable) and with a tight one, maximizing and minimizing
+    for formation in ("4-3-3", "4-4-2"):
+        for budget in (None, 5 * 10 ** 8):
+            for maximize in (True, False):
+                start = perf_counter()
+                lineup, cost, optimal = find_best_lineup(FORMATION_SLOTS[formation], players, budget, maximize, time_limit)
+                elapsed = perf_counter() - start
+                label = "%s budget=%s %s" % (formation, budget, "max" if maximize else "min")
+                print("%-32s %8.1f ms  cost %d  %s" % (label + ":", elapsed * 1000, cost, "optimal" if optimal else "timed out"))
+                if elapsed > time_limit + TOLERANCE:
+                    late.append(label)
+
+    if late:
+        sys.exit("Searches over the time limit: " + ", ".join(late))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import asyncio
+import gzip
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from db import DB_REPLICA_STICKY_SECONDS, engine, read_engine, wrote_recently
+from core.metrics import record_cache
+from core.responses import dumps
+
+# brotli is optional: without it snapshots are offered gzip compressed only
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses kept per worker, least recently used are dropped first
+REFERENCE_CACHE_MAX_ENTRIES = int(os.getenv("REFERENCE_CACHE_MAX_ENTRIES", "1000"))
+# Entries also expire after this many seconds, in case an invalidation of another worker was lost
+REFERENCE_CACHE_TTL = float(os.getenv("REFERENCE_CACHE_TTL", "300"))
+# Compression of snapshots, paid once per rebuild instead of once per response
+SNAPSHOT_GZIP_LEVEL = int(os.getenv("SNAPSHOT_GZIP_LEVEL", "9"))
+SNAPSHOT_BROTLI_QUALITY = int(os.getenv("SNAPSHOT_BROTLI_QUALITY", "9"))
+# Identical reads running at the same time share one query (single-flight)
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "true").lower() == "true"
+# Seconds a finished response still answers the identical requests that arrive after it, 0 to share it only while in flight
+SINGLE_FLIGHT_WINDOW = float(os.getenv("SINGLE_FLIGHT_WINDOW", "0.05"))
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    versions: Tuple[int, ...]
+    expires: float
+
+# In-process cache of JSON responses built from tables that rarely change.
+# Each table has a version that the crud write functions bump. An entry remembers the versions of its
+# tables when its data was read and is only served while they are unchanged.
+class ReferenceCache:
+    def __init__(self):
+        self.entries: "OrderedDict[Tuple[str, Tuple[str, ...]], CachedResponse]" = OrderedDict()
+        self.versions: Dict[str, int] = {}
+        # Right after a write a lagging replica can still return the old rows, so nothing is stored until then
+        self.settle_until: Dict[str, float] = {}
+
+    def current_versions(self, tables: Tuple[str, ...]) -> Tuple[int, ...]:
+        return tuple(self.versions.get(table, 0) for table in tables)
+
+    def get(self, key: str, tables: Tuple[str, ...]) -> Optional[CachedResponse]:
+        entry = self.entries.get((key, tables))
+        if entry is None:
+            return None
+        if entry.versions != self.current_versions(tables) or entry.expires < time.monotonic():
+            del self.entries[(key, tables)]
+            return None
+        self.entries.move_to_end((key, tables))
+        return entry
+
+    # True when data read at these versions can be stored: no write happened meanwhile and the replica has settled
+    def storable(self, tables: Tuple[str, ...], versions: Tuple[int, ...]) -> bool:
+        now = time.monotonic()
+        return versions == self.current_versions(tables) and all(self.settle_until.get(table, 0) <= now for table in tables)
+
+    # Store a response read at the given versions, unless a write happened meanwhile
+    def put(self, key: str, tables: Tuple[str, ...], versions: Tuple[int, ...], body: bytes) -> CachedResponse:
+        entry = CachedResponse(body, _etag(body), versions, time.monotonic() + REFERENCE_CACHE_TTL)
+        if self.storable(tables, versions):
+            self.entries[(key, tables)] = entry
+            while len(self.entries) > REFERENCE_CACHE_MAX_ENTRIES:
+                self.entries.popitem(last=False)
+        return entry
+
+    # Called by the crud functions after a committed write
+    def invalidate(self, *tables: str):
+        settle = time.monotonic() + (DB_REPLICA_STICKY_SECONDS if read_engine is not engine else 0)
+        for table in tables:
+            self.versions[table] = self.versions.get(table, 0) + 1
+            self.settle_until[table] = settle
+
+reference_cache = ReferenceCache()
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+def _cache_key(request: Request) -> str:
+    return request.url.path + "?" + "&".join(sorted("%s=%s" % item for item in request.query_params.multi_items()))
+
+def _matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    return if_none_match is not None and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")])
+
+@lru_cache(maxsize=None)
+def _adapter(model: Any) -> TypeAdapter:
+    return TypeAdapter(model)
+
+# Answer a GET from the cache, or with load() when the entry is missing or stale.
+# The content is serialized with the route's response model.
+# Responses carry a strong ETag and a matching If-None-Match gets a 304 without a body.
+async def cached_response(request: Request, tables: Iterable[str], model: Any, load: Callable[[], Awaitable]) -> Response:
+    tables = tuple(tables)
+    key = _cache_key(request)
+    entry = reference_cache.get(key, tables)
+    record_cache("reference", entry is not None)
+    if entry is None:
+        versions = reference_cache.current_versions(tables)
+        content = await load()
+        adapter = _adapter(model)
+        body = adapter.dump_json(adapter.validate_python(content), exclude_unset=True)
+        entry = reference_cache.put(key, tables, versions, body)
+
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if _matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+# Raised to the requests waiting on a read whose own request was cancelled: they read on their own
+class _Abandoned(Exception):
+    pass
+
+# Reads in flight by key. The first request of a key runs the read, the identical ones arriving before it ends
+# (or less than a window after) wait for its serialized body instead of each taking a connection of the pool.
+# Errors are shared too (a 404 is a 404 for all of them) but never kept for the window.
+class SingleFlight:
+    def __init__(self):
+        self.flights: Dict[str, asyncio.Future] = {}
+
+    async def run(self, key: str, window: float, load: Callable[[], Awaitable[bytes]]) -> bytes:
+        flight = self.flights.get(key)
+        record_cache("single_flight", flight is not None)
+        if flight is not None:
+            try:
+                # Shielded: a waiting request that is cancelled must not cancel the read of the others
+                return await asyncio.shield(flight)
+            except _Abandoned:
+                return await load()
+
+        loop = asyncio.get_running_loop()
+        flight = self.flights[key] = loop.create_future()
+        try:
+            body = await load()
+        except BaseException as e:
+            self._forget(key, flight)
+            flight.set_exception(e if isinstance(e, Exception) else _Abandoned())
+            # Marks the exception as retrieved, there may be no request waiting for it
+            flight.exception()
+            raise
+        flight.set_result(body)
+        if window > 0:
+            loop.call_later(window, self._forget, key, flight)
+        else:
+            self._forget(key, flight)
+        return body
+
+    def _forget(self, key: str, flight: asyncio.Future):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+single_flight = SingleFlight()
+
+# Answer a read with the body of an identical request (same route and query parameters) in flight, or finished
+# less than window seconds ago (SINGLE_FLIGHT_WINDOW by default), or else with load() serialized by the route's
+# response model. Clients that just wrote always read on their own, they must see their write.
+async def coalesced_response(request: Request, model: Any, load: Callable[[], Awaitable], window: Optional[float] = None,
+                             exclude_unset: bool = False) -> Response:
+    adapter = _adapter(model)
+    async def serialize() -> bytes:
+        return adapter.dump_json(adapter.validate_python(await load()), exclude_unset=exclude_unset)
+
+    if not SINGLE_FLIGHT or wrote_recently(request):
+        body = await serialize()
+    else:
+        body = await single_flight.run(_cache_key(request), SINGLE_FLIGHT_WINDOW if window is None else window, serialize)
+    return Response(body, media_type="application/json")
+
+class Snapshot(NamedTuple):
+    # Body per content coding: "identity", "gzip" and, with brotli installed, "br"
+    bodies: Dict[str, bytes]
+    etag: str
+    versions: Tuple[int, ...]
+    expires: float
+
+# Serialize and compress a snapshot, run off the event loop
+def _encode_snapshot(content: Any, versions: Tuple[int, ...]) -> Snapshot:
+    body = dumps(content)
+    bodies = {"identity": body, "gzip": gzip.compress(body, SNAPSHOT_GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        bodies["br"] = brotli.compress(body, quality=SNAPSHOT_BROTLI_QUALITY)
+    return Snapshot(bodies, _etag(body), versions, time.monotonic() + REFERENCE_CACHE_TTL)
+
+# A single response built from several tables, kept serialized and compressed in memory.
+# It is rebuilt when a write bumps the version of one of its tables (or after REFERENCE_CACHE_TTL), by one
+# request at a time: concurrent requests wait for that rebuild instead of reading the tables again.
+class SnapshotCache:
+    def __init__(self, tables: Tuple[str, ...]):
+        self.tables = tables
+        self.snapshot: Optional[Snapshot] = None
+        self.lock = asyncio.Lock()
+
+    def _current(self) -> Optional[Snapshot]:
+        snapshot = self.snapshot
+        if snapshot is None or snapshot.versions != reference_cache.current_versions(self.tables) or snapshot.expires < time.monotonic():
+            return None
+        return snapshot
+
+    async def get(self, load: Callable[[], Awaitable]) -> Snapshot:
+        snapshot = self._current()
+        record_cache("snapshot", snapshot is not None)
+        if snapshot is not None:
+            return snapshot
+
+        async with self.lock:
+            snapshot = self._current()
+            if snapshot is None:
+                versions = reference_cache.current_versions(self.tables)
+                snapshot = await asyncio.to_thread(_encode_snapshot, await load(), versions)
+                if reference_cache.storable(self.tables, versions):
+                    self.snapshot = snapshot
+            return snapshot
+
+# Content codings accepted by the client, from the Accept-Encoding header
+def accepted_encodings(request: Request) -> set:
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, *params = [value.strip() for value in part.split(";")]
+        quality = next((param[2:] for param in params if param.startswith("q=")), "1")
+        try:
+            if float(quality) > 0:
+                accepted.add(coding.lower())
+        except ValueError:
+            pass
+    return accepted
+
+# Answer a GET with a snapshot, in the best coding the client accepts, without serializing or compressing anything.
+# Every coding has its own strong ETag and a matching If-None-Match gets a 304 without a body.
+async def snapshot_response(request: Request, cache: SnapshotCache, load: Callable[[], Awaitable]) -> Response:
+    snapshot = await cache.get(load)
+    accepted = accepted_encodings(request)
+    coding = next((coding for coding in ("br", "gzip") if coding in snapshot.bodies and coding in accepted), "identity")
+    etag = snapshot.etag if coding == "identity" else snapshot.etag[:-1] + "-" + coding + '"'
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if _matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    if coding != "identity":
+        headers["Content-Encoding"] = coding
+    return Response(snapshot.bodies[coding], media_type="application/json", headers=headers)
@@ -0,0 +1,23 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+
+# Thread pool for blocking work (password hashing, lineup searches) that keeps it off the event loop.
+# At most max_pending calls run or wait at once, over that requests get a 503 with the given detail
+# instead of queueing behind the others.
+class BoundedExecutor:
+    def __init__(self, name: str, pool_size: int, max_pending: int, busy_detail: str):
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix=name)
+        self.max_pending = max_pending
+        self.busy_detail = busy_detail
+        self.pending = 0
+
+    async def run(self, function, *args):
+        if self.pending >= self.max_pending:
+            raise HTTPException(status_code=503, detail=self.busy_detail, headers={"Retry-After": "1"})
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        finally:
+            self.pending -= 1
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import engine
+from core.cache import reference_cache
+
+# Channel of the invalidation messages
+INVALIDATION_CHANNEL = os.getenv("INVALIDATION_CHANNEL", "cache_invalidation")
+# Listen to the writes of the other workers and pods (Postgres only)
+INVALIDATION_LISTEN = os.getenv("INVALIDATION_LISTEN", "true").lower() == "true"
+# Seconds between reconnection attempts, and of silence after which the connection is checked
+INVALIDATION_RECONNECT_SECONDS = float(os.getenv("INVALIDATION_RECONNECT_SECONDS", "1"))
+INVALIDATION_PING_SECONDS = float(os.getenv("INVALIDATION_PING_SECONDS", "30"))
+# Keys sent in one message, a write of more rows makes the other workers reload the whole table
+INVALIDATION_MAX_KEYS = int(os.getenv("INVALIDATION_MAX_KEYS", "100"))
+
+logger = logging.getLogger("cache.invalidation")
+
+# Tells the messages of this worker apart
+WORKER_ID = uuid.uuid4().hex
+
+# Handlers of a table get the changed keys, or None when the whole table has to be reloaded
+Handler = Callable[[Optional[List[Any]]], Awaitable[None]]
+_handlers: Dict[str, List[Handler]] = {}
+
+# Bump the version of the table and send the message. NOTIFY is only delivered when the transaction commits.
+_PUBLISH = ("WITH bumped AS (INSERT INTO cache_version (table_name, version) VALUES ({table}, 1) "
+            "ON CONFLICT (table_name) DO UPDATE SET version = cache_version.version + 1 RETURNING version) "
+            "SELECT pg_notify({channel}, json_build_object('worker', {worker}, 'table', {table}, 'keys', {keys}, "
+            "'version', version)::text) FROM bumped")
+_PUBLISH_SQL = text(_PUBLISH.format(table="CAST(:table AS text)", channel="CAST(:channel AS text)",
+                                    worker="CAST(:worker AS text)", keys="CAST(:keys AS json)"))
+_PUBLISH_ASYNCPG_SQL = _PUBLISH.format(table="$1::text", channel="$2::text", worker="$3::text", keys="$4::json")
+
+def _keys(keys: Optional[Iterable]) -> str:
+    keys = list(keys) if keys is not None else None
+    return json.dumps(keys if keys is not None and len(keys) <= INVALIDATION_MAX_KEYS else None)
+
+# Announce a write to the other workers, inside the caller's transaction (before its commit).
+# keys are the changed ids, (team_id, competition_id) pairs for team_competition, None for a whole table.
+async def publish(db: AsyncSession, table: str, keys: Optional[Iterable] = None) -> None:
+    await db.execute(_PUBLISH_SQL, {"table": table, "channel": INVALIDATION_CHANNEL, "worker": WORKER_ID, "keys": _keys(keys)})
+
+# The same on a raw asyncpg connection (bulk imports)
+async def publish_raw(connection: asyncpg.Connection, table: str, keys: Optional[Iterable] = None) -> None:
+    await connection.execute(_PUBLISH_ASYNCPG_SQL, table, INVALIDATION_CHANNEL, WORKER_ID, _keys(keys))
+
+# Register what to patch in this worker when another one writes to a table.
+# The reference cache (and the snapshots built on it) is always invalidated, it needs no handler.
+def subscribe(table: str, handler: Handler):
+    _handlers.setdefault(table, []).append(handler)
+
+async def _invalidate(table: str, keys: Optional[List[Any]]):
+    reference_cache.invalidate(table)
+    for handler in _handlers.get(table, ()):
+        # A failing handler does not keep the others (or the next messages) from running
+        try:
+            await handler(keys)
+        except Exception:
+            logger.exception("Invalidation handler of %s failed", table)
+
+# Applies the writes of the other workers to the caches of this one, from a dedicated connection that LISTENs.
+# Versions of a table come without gaps: a skipped one means messages were lost and the table is reloaded
+# as a whole, like the tables whose version moved while the connection was down.
+class InvalidationListener:
+    def __init__(self):
+        self.versions: Dict[str, int] = {}
+        self.synced = False
+        self.connected = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    # Start listening and wait (a few seconds at most) until it does, so caches loaded after this miss no write
+    async def start(self, timeout: float = 5):
+        if not INVALIDATION_LISTEN or engine.dialect.name != "postgresql":
+            return
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._run())
+        try:
+            await asyncio.wait_for(self.connected.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Invalidation listener not connected yet, still trying")
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self._listen()
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                logger.warning("Invalidation listener disconnected, reconnecting: %s", e)
+            except Exception:
+                # Anything else would end the task and leave the caches of this worker stale for good
+                logger.exception("Invalidation listener failed, reconnecting")
+            self.connected.clear()
+            await asyncio.sleep(INVALIDATION_RECONNECT_SECONDS)
+
+    async def _listen(self):
+        connection = await asyncpg.connect(engine.url.set(drivername="postgresql").render_as_string(hide_password=False),
+                                           server_settings={"application_name": "cache-invalidation-listener"})
+        try:
+            messages: asyncio.Queue = asyncio.Queue()
+            connection.add_termination_listener(lambda _connection: messages.put_nowait(None))
+            await connection.add_listener(INVALIDATION_CHANNEL, lambda _connection, _pid, _channel, payload: messages.put_nowait(payload))
+
+            # Read after LISTEN: a write in between is counted here and received again, not lost
+            versions = {record["table_name"]: record["version"] for record in await connection.fetch("SELECT table_name, version FROM cache_version")}
+            if self.synced:
+                for table in set(versions) | set(self.versions):
+                    if versions.get(table) != self.versions.get(table):
+                        await _invalidate(table, None)
+            self.versions = versions
+            self.synced = True
+            self.connected.set()
+
+            while True:
+                try:
+                    payload = await asyncio.wait_for(messages.get(), INVALIDATION_PING_SECONDS)
+                except asyncio.TimeoutError:
+                    # Nothing heard for a while: make sure the connection is still alive
+                    await connection.fetchval("SELECT 1", timeout=INVALIDATION_PING_SECONDS)
+                    continue
+                if payload is None:
+                    raise ConnectionError("connection closed")
+                try:
+                    await self._apply(json.loads(payload))
+                except (ValueError, KeyError, TypeError):
+                    logger.exception("Malformed invalidation message ignored: %s", payload)
+        finally:
+            connection.terminate()
+
+    async def _apply(self, message: dict):
+        table, version = message["table"], message["version"]
+        known = self.versions.get(table, 0)
+        if version <= known:
+            return
+        self.versions[table] = version
+        if version > known + 1:
+            logger.warning("Missed invalidations of %s (version %d after %d), reloading it", table, version, known)
+            await _invalidate(table, None)
+        elif message["worker"] != WORKER_ID:
+            await _invalidate(table, message["keys"])
+
+invalidation_listener = InvalidationListener()
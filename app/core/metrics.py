@@ -0,0 +1,206 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+from db import engine, get_pool_status, read_engine
+
+# Directory shared by the uvicorn workers: each one writes its counters there and /metrics adds them up.
+# Without it /metrics only reports the worker that answers.
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+# Files of workers that stopped writing for this long are ignored
+METRICS_STALE_SECONDS = float(os.getenv("METRICS_STALE_SECONDS", str(METRICS_FLUSH_SECONDS * 10)))
+
+logger = logging.getLogger("metrics")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+# name: (type, help, label names, buckets)
+METRICS = {
+    "http_requests_total": ("counter", "Requests by route template, method and status", ("method", "route", "status"), None),
+    "http_requests_in_flight": ("gauge", "Requests being served", (), None),
+    "http_request_duration_seconds": ("histogram", "Request latency by route template", ("method", "route"), LATENCY_BUCKETS),
+    "http_response_size_bytes": ("histogram", "Response body size by route template", ("method", "route"), SIZE_BUCKETS),
+    "db_pool_size": ("gauge", "Connections kept by the pool", ("pool",), None),
+    "db_pool_checked_out": ("gauge", "Connections in use", ("pool",), None),
+    "db_pool_overflow": ("gauge", "Connections open over the pool size", ("pool",), None),
+    "db_pool_waits_total": ("counter", "Checkouts that waited for a connection", ("pool",), None),
+    "db_pool_wait_seconds_total": ("counter", "Time spent waiting for connections", ("pool",), None),
+    "db_pool_timeouts_total": ("counter", "Checkouts that timed out", ("pool",), None),
+    "cache_requests_total": ("counter", "Cache lookups by cache and result (hit or miss)", ("cache", "result"), None),
+}
+
+# Values of this worker. Everything runs on the event loop thread, so plain dicts need no locks.
+# Counters and gauges map label values to a number, histograms to [bucket counts..., +Inf count, sum].
+_values: Dict[str, Dict[Tuple[str, ...], object]] = {name: {} for name in METRICS}
+_flush_task: Optional[asyncio.Task] = None
+
+def inc(name: str, labels: Tuple[str, ...] = (), value: float = 1):
+    series = _values[name]
+    series[labels] = series.get(labels, 0) + value
+
+def set_gauge(name: str, labels: Tuple[str, ...], value: float):
+    _values[name][labels] = value
+
+def observe(name: str, labels: Tuple[str, ...], value: float):
+    buckets = METRICS[name][3]
+    series = _values[name]
+    counts = series.get(labels)
+    if counts is None:
+        counts = series[labels] = [0] * (len(buckets) + 2)
+    counts[bisect_left(buckets, value)] += 1
+    counts[-1] += value
+
+# Record a hit or a miss of a cache
+def record_cache(cache: str, hit: bool):
+    inc("cache_requests_total", (cache, "hit" if hit else "miss"))
+
+# Record a finished request under its route template
+def record_request(method: str, route: str, status_code: int, duration: float, size: Optional[int]):
+    inc("http_requests_total", (method, route, str(status_code)))
+    observe("http_request_duration_seconds", (method, route), duration)
+    if size is not None:
+        observe("http_response_size_bytes", (method, route), size)
+
+def _collect_pools():
+    pools = [("primary", engine)] + ([("replica", read_engine)] if read_engine is not engine else [])
+    for pool_name, pool_engine in pools:
+        status = get_pool_status(pool_engine)
+        labels = (pool_name,)
+        set_gauge("db_pool_size", labels, status["size"])
+        set_gauge("db_pool_checked_out", labels, status["checked_out"])
+        set_gauge("db_pool_overflow", labels, status["overflow"])
+        set_gauge("db_pool_waits_total", labels, status["wait_count"])
+        set_gauge("db_pool_wait_seconds_total", labels, status["wait_time"])
+        set_gauge("db_pool_timeouts_total", labels, status["timeout_count"])
+
+def _snapshot() -> Dict[str, List]:
+    _collect_pools()
+    return {name: [[list(labels), value] for labels, value in series.items()] for name, series in _values.items()}
+
+def _worker_file() -> str:
+    return os.path.join(METRICS_DIR, "worker-%d.json" % os.getpid())
+
+# Write the counters of this worker for the others to read
+def flush_metrics():
+    if METRICS_DIR is None:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    temporary = _worker_file() + ".tmp"
+    with open(temporary, "w") as file:
+        json.dump(_snapshot(), file)
+    os.replace(temporary, _worker_file())
+
+# Snapshots of every live worker, this one included. This worker is taken from memory, so a directory
+# that cannot be written or read only loses the other workers for this scrape.
+def _read_snapshots() -> List[Dict[str, List]]:
+    snapshots = [_snapshot()]
+    if METRICS_DIR is None:
+        return snapshots
+
+    try:
+        flush_metrics()
+    except OSError as e:
+        logger.warning("Could not write the metrics of this worker: %s", e)
+    try:
+        file_names = os.listdir(METRICS_DIR)
+    except OSError as e:
+        logger.warning("Could not read the metrics directory %s: %s", METRICS_DIR, e)
+        return snapshots
+    now = time.time()
+    own_file = _worker_file()
+    for file_name in file_names:
+        path = os.path.join(METRICS_DIR, file_name)
+        if not file_name.endswith(".json") or path == own_file:
+            continue
+        try:
+            if now - os.path.getmtime(path) > METRICS_STALE_SECONDS:
+                continue
+            with open(path) as file:
+                snapshots.append(json.load(file))
+        except (OSError, ValueError):
+            # The worker stopped or is rewriting its file, skip it for this scrape
+            continue
+    return snapshots
+
+def _merge(snapshots: List[Dict[str, List]]) -> Dict[str, Dict[Tuple[str, ...], object]]:
+    merged: Dict[str, Dict[Tuple[str, ...], object]] = {name: {} for name in METRICS}
+    for snapshot in snapshots:
+        for name, series in snapshot.items():
+            if name not in merged:
+                continue
+            for labels, value in series:
+                labels = tuple(labels)
+                current = merged[name].get(labels)
+                if current is None:
+                    merged[name][labels] = list(value) if isinstance(value, list) else value
+                elif isinstance(value, list):
+                    merged[name][labels] = [a + b for a, b in zip(current, value)]
+                else:
+                    merged[name][labels] = current + value
+    return merged
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = ['%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"')) for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+# Every metric of every worker in the Prometheus text format
+def render_metrics() -> str:
+    merged = _merge(_read_snapshots())
+    lines = []
+    for name, (metric_type, description, label_names, buckets) in METRICS.items():
+        lines.append("# HELP %s %s" % (name, description))
+        lines.append("# TYPE %s %s" % (name, metric_type))
+        for labels, value in sorted(merged[name].items()):
+            if metric_type != "histogram":
+                lines.append("%s%s %s" % (name, _format_labels(label_names, labels), value))
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ("+Inf",), value[:-1]):
+                cumulative += count
+                lines.append("%s_bucket%s %d" % (name, _format_labels(label_names, labels, 'le="%s"' % bound), cumulative))
+            lines.append("%s_sum%s %s" % (name, _format_labels(label_names, labels), value[-1]))
+            lines.append("%s_count%s %d" % (name, _format_labels(label_names, labels), cumulative))
+
+    # Hit ratio of every cache, from the merged lookups
+    lines.append("# HELP cache_hit_ratio Hits over lookups of every cache")
+    lines.append("# TYPE cache_hit_ratio gauge")
+    lookups: Dict[str, List[float]] = {}
+    for (cache, result), count in merged["cache_requests_total"].items():
+        totals = lookups.setdefault(cache, [0, 0])
+        totals[0 if result == "hit" else 1] += count
+    for cache, (hits, misses) in sorted(lookups.items()):
+        lines.append('cache_hit_ratio{cache="%s"} %s' % (cache, hits / (hits + misses) if hits + misses else 0))
+    return "\n".join(lines) + "\n"
+
+async def _flush_loop():
+    while True:
+        await asyncio.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            flush_metrics()
+        except OSError as e:
+            logger.warning("Could not write the metrics of this worker: %s", e)
+
+# Start writing the worker file in the background (only with METRICS_DIR)
+def start_metrics_flush():
+    global _flush_task
+    if METRICS_DIR is not None and _flush_task is None:
+        _flush_task = asyncio.get_running_loop().create_task(_flush_loop())
+
+# Stop writing and remove the worker file, so a stopped worker is not counted
+def stop_metrics_flush():
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        _flush_task = None
+    if METRICS_DIR is not None:
+        try:
+            os.remove(_worker_file())
+        except OSError:
+            pass
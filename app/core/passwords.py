@@ -0,0 +1,27 @@
+import os
+import bcrypt
+from core.executors import BoundedExecutor
+
+# bcrypt work factor and size of the hashing pool (bcrypt releases the GIL, so threads run in parallel)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_POOL_SIZE = int(os.getenv("HASH_POOL_SIZE", "4"))
+# Hashes allowed running or waiting at once, over this requests get a 503 instead of queueing
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", str(HASH_POOL_SIZE * 4)))
+
+_executor = BoundedExecutor("bcrypt", HASH_POOL_SIZE, HASH_MAX_PENDING, "Too many password operations, try again later")
+
+# Hash a password with the configured work factor
+async def hash_password(password: str) -> str:
+    hashed = await _executor.run(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+    return hashed.decode('utf-8')
+
+# Check a password against its hash
+async def check_password(password: str, hashed_password: str) -> bool:
+    return await _executor.run(bcrypt.checkpw, password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+# True when a hash was made with another work factor than the configured one ("$2b$<rounds>$...")
+def needs_rehash(hashed_password: str) -> bool:
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
@@ -0,0 +1,111 @@
+import json
+import logging
+import os
+import re
+from collections import Counter
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, Optional
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Requests slower than this (milliseconds) are written to the slow request log
+SQL_SLOW_REQUEST_MS = float(os.getenv("SQL_SLOW_REQUEST_MS", "500"))
+# Warn when the same statement shape runs more than this many times in one request (N+1 queries)
+SQL_REPEAT_THRESHOLD = int(os.getenv("SQL_REPEAT_THRESHOLD", "10"))
+
+logger = logging.getLogger("sql.profiling")
+
+_NUMBER = re.compile(r"\b\d+(\.\d+)?\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDER_LIST = re.compile(r"\((\s*(\?|\$\d+|%\(\w+\)s|:\w+)\s*,)+\s*(\?|\$\d+|%\(\w+\)s|:\w+)\s*\)")
+_SPACES = re.compile(r"\s+")
+
+# Statements run by one request
+class RequestProfile:
+    def __init__(self):
+        self.start = perf_counter()
+        self.statement_count = 0
+        self.db_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement: Optional[str] = None
+        self.fingerprints: Counter = Counter()
+
+    def add(self, statement: str, elapsed: float):
+        self.statement_count += 1
+        self.db_time += elapsed
+        self.fingerprints[fingerprint(statement)] += 1
+        if elapsed > self.slowest_time:
+            self.slowest_time, self.slowest_statement = elapsed, statement
+
+    # Statement shapes that ran more than SQL_REPEAT_THRESHOLD times
+    def repeated(self) -> Dict[str, int]:
+        return {shape: count for shape, count in self.fingerprints.items() if count > SQL_REPEAT_THRESHOLD}
+
+    # Value of the Server-Timing header (durations in milliseconds)
+    def server_timing(self) -> str:
+        total = (perf_counter() - self.start) * 1000
+        return 'db;dur=%.2f;desc="%d statements", db-slowest;dur=%.2f, total;dur=%.2f' % (
+            self.db_time * 1000, self.statement_count, self.slowest_time * 1000, total)
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+# Shape of a statement: literals and placeholder lists collapsed, so "IN (?, ?)" and "IN (?, ?, ?)" match
+def fingerprint(statement: str) -> str:
+    statement = _STRING.sub("?", statement)
+    statement = _PLACEHOLDER_LIST.sub("(...)", statement)
+    statement = _NUMBER.sub("?", statement)
+    return _SPACES.sub(" ", statement).strip()
+
+# Start collecting the statements of the current request
+def start_request_profile() -> RequestProfile:
+    profile = RequestProfile()
+    _current.set(profile)
+    return profile
+
+# Log slow requests and repeated statements of a finished request
+def log_request_profile(profile: RequestProfile, method: str, path: str, status_code: int):
+    elapsed_ms = (perf_counter() - profile.start) * 1000
+    repeated = profile.repeated()
+    if elapsed_ms < SQL_SLOW_REQUEST_MS and not repeated:
+        return
+
+    record = {
+        "method": method,
+        "path": path,
+        "status": status_code,
+        "duration_ms": round(elapsed_ms, 2),
+        "db_ms": round(profile.db_time * 1000, 2),
+        "statements": profile.statement_count,
+        "slowest_ms": round(profile.slowest_time * 1000, 2),
+        "slowest_statement": profile.slowest_statement,
+        "repeated_statements": repeated,
+    }
+    if repeated:
+        logger.warning("Repeated statements (possible N+1): %s", json.dumps(record))
+    else:
+        logger.warning("Slow request: %s", json.dumps(record))
+
+# Time every statement of an engine and add it to the profile of the request running it
+def install_sql_profiling(engine: AsyncEngine):
+    sync_engine = engine.sync_engine
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("statement_start", []).append(perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = perf_counter() - conn.info["statement_start"].pop()
+    profile = _current.get()
+    if profile is not None:
+        profile.add(statement, elapsed)
+
+# A failed statement never reaches after_cursor_execute
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("statement_start"):
+        connection.info["statement_start"].pop()
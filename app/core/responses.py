@@ -0,0 +1,31 @@
+import json
+from datetime import date
+from decimal import Decimal
+from typing import Any
+from fastapi.responses import JSONResponse
+
+# orjson is optional: without it responses are rendered by the standard library
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Column values json does not know about (DECIMAL market values and budgets, timestamps)
+def _default(value: Any):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError("Type is not JSON serializable: " + type(value).__name__)
+
+# Compact JSON bytes of a value
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+# Default response class of the app. With response models FastAPI hands it plain JSON data already
+# serialized by pydantic, so rendering is a single orjson call.
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
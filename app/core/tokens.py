@@ -0,0 +1,86 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+# Signing key. Set TOKEN_SECRET when running several workers, otherwise each one signs with its own random key
+TOKEN_SECRET = os.getenv("TOKEN_SECRET", secrets.token_hex(32)).encode('utf-8')
+ACCESS_TOKEN_TTL = int(os.getenv("ACCESS_TOKEN_TTL", str(15 * 60)))
+REFRESH_TOKEN_TTL = int(os.getenv("REFRESH_TOKEN_TTL", str(7 * 24 * 60 * 60)))
+# Revoked token ids kept in memory, oldest are dropped first
+REVOKED_TOKENS_MAX = int(os.getenv("REVOKED_TOKENS_MAX", "10000"))
+# Users allowed to call the admin endpoints, comma separated ids
+ADMIN_USER_IDS = {int(user_id) for user_id in os.getenv("ADMIN_USER_IDS", "").split(",") if user_id.strip()}
+
+ACCESS_TOKEN = "access"
+REFRESH_TOKEN = "refresh"
+
+_revoked: "OrderedDict[str, int]" = OrderedDict()
+_bearer = HTTPBearer(auto_error=False)
+
+def _encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode('ascii')
+
+def _decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def _sign(payload: str) -> str:
+    return _encode(hmac.new(TOKEN_SECRET, payload.encode('ascii'), hashlib.sha256).digest())
+
+# Create a signed token "<payload>.<signature>" for a user
+def create_token(user_id: int, token_type: str = ACCESS_TOKEN) -> str:
+    ttl = ACCESS_TOKEN_TTL if token_type == ACCESS_TOKEN else REFRESH_TOKEN_TTL
+    claims = {"sub": user_id, "typ": token_type, "exp": int(time.time()) + ttl, "jti": secrets.token_hex(8)}
+    payload = _encode(json.dumps(claims, separators=(",", ":")).encode('utf-8'))
+    return payload + "." + _sign(payload)
+
+# Access and refresh token pair returned on login
+def create_token_pair(user_id: int) -> Dict:
+    return {
+        "user_id": user_id,
+        "access_token": create_token(user_id, ACCESS_TOKEN),
+        "refresh_token": create_token(user_id, REFRESH_TOKEN),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_TTL,
+    }
+
+# Check signature, type, expiry and revocation of a token and return its claims
+def decode_token(token: str, token_type: str = ACCESS_TOKEN) -> Dict:
+    try:
+        payload, signature = token.split(".")
+        if not hmac.compare_digest(signature, _sign(payload)):
+            raise ValueError("bad signature")
+        claims = json.loads(_decode(payload))
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+
+    if claims.get("typ") != token_type or claims.get("exp", 0) < time.time() or claims.get("jti") in _revoked:
+        raise HTTPException(status_code=401, detail="Expired or revoked token", headers={"WWW-Authenticate": "Bearer"})
+    return claims
+
+# Revoke a token until it expires
+def revoke_token(claims: Dict):
+    now = time.time()
+    _revoked[claims["jti"]] = claims["exp"]
+    # Drop expired entries at the front and keep the size bounded
+    while _revoked and (len(_revoked) > REVOKED_TOKENS_MAX or next(iter(_revoked.values())) < now):
+        _revoked.popitem(last=False)
+
+# Dependency: id of the user of the bearer access token
+async def get_current_user_id(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)) -> int:
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    return decode_token(credentials.credentials, ACCESS_TOKEN)["sub"]
+
+# Dependency: id of the user of the bearer access token, who must be an admin
+async def get_admin_user_id(user_id: int = Depends(get_current_user_id)) -> int:
+    if user_id not in ADMIN_USER_IDS:
+        raise HTTPException(status_code=403, detail="Admin only")
+    return user_id
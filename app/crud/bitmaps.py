@@ -0,0 +1,158 @@
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, Optional, Union
+
+# Ids are split in chunks of 65536 (the high bits of the id pick the chunk, the low 16 bits are stored)
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+# Chunks with more ids than this are stored as a 65536 bit int (8 KiB), smaller ones as a sorted array of
+# 16 bit values (2 bytes per id), whichever is smaller
+ARRAY_MAX_IDS = 4096
+
+Container = Union[array, int]
+
+def _count(container: Container) -> int:
+    return len(container) if isinstance(container, array) else container.bit_count()
+
+def _to_int(values: Iterable[int]) -> int:
+    buffer = bytearray(CHUNK_SIZE // 8)
+    for value in values:
+        buffer[value >> 3] |= 1 << (value & 7)
+    return int.from_bytes(buffer, "little")
+
+def _to_array(bits: int) -> array:
+    return array("H", _iter_bits(bits, 0))
+
+def _iter_bits(bits: int, start: int) -> Iterator[int]:
+    digits = format(bits >> start, "b")[::-1]
+    position = digits.find("1")
+    while position >= 0:
+        yield start + position
+        position = digits.find("1", position + 1)
+
+# Smallest form of a chunk, None when it is empty
+def _compact(container: Container) -> Optional[Container]:
+    count = _count(container)
+    if not count:
+        return None
+    if isinstance(container, int):
+        return _to_array(container) if count <= ARRAY_MAX_IDS else container
+    return _to_int(container) if count > ARRAY_MAX_IDS else container
+
+def _and(left: Container, right: Container) -> Optional[Container]:
+    if isinstance(left, int) and isinstance(right, int):
+        return _compact(left & right)
+    if isinstance(left, int):
+        left, right = right, left
+    if isinstance(right, int):
+        return _compact(array("H", [value for value in left if right >> value & 1]))
+    if len(left) > len(right):
+        left, right = right, left
+    others = set(right)
+    return _compact(array("H", [value for value in left if value in others]))
+
+def _or(left: Container, right: Container) -> Container:
+    if isinstance(left, array) and isinstance(right, array):
+        return _compact(array("H", sorted(set(left).union(right))))
+    return (left if isinstance(left, int) else _to_int(left)) | (right if isinstance(right, int) else _to_int(right))
+
+# Compressed set of ids in the way of roaring bitmaps: ids are grouped in chunks of 65536 and each chunk is a
+# sorted array or a bitmap depending on how many ids it has. Memory follows the number of ids instead of the
+# largest one, and operations only visit the chunks that hold ids.
+# Containers are never changed in place (add and discard replace them), so the sets returned by & and | can
+# share containers with their operands.
+class ChunkedBitmap:
+    __slots__ = ("chunks",)
+
+    def __init__(self, chunks: Optional[Dict[int, Container]] = None):
+        self.chunks: Dict[int, Container] = chunks if chunks is not None else {}
+
+    # Build a set from many ids at once
+    @classmethod
+    def from_ids(cls, ids: Iterable[int]) -> "ChunkedBitmap":
+        grouped: Dict[int, list] = {}
+        for value in ids:
+            grouped.setdefault(value >> CHUNK_BITS, []).append(value & (CHUNK_SIZE - 1))
+        chunks = {}
+        for high, values in grouped.items():
+            chunks[high] = _to_int(values) if len(values) > ARRAY_MAX_IDS else array("H", sorted(set(values)))
+        return cls(chunks)
+
+    def add(self, value: int):
+        high, low = value >> CHUNK_BITS, value & (CHUNK_SIZE - 1)
+        container = self.chunks.get(high)
+        if container is None:
+            self.chunks[high] = array("H", [low])
+        elif isinstance(container, int):
+            self.chunks[high] = container | (1 << low)
+        else:
+            position = bisect_left(container, low)
+            if position == len(container) or container[position] != low:
+                self.chunks[high] = _compact(container[:position] + array("H", [low]) + container[position:])
+
+    def discard(self, value: int):
+        high, low = value >> CHUNK_BITS, value & (CHUNK_SIZE - 1)
+        container = self.chunks.get(high)
+        if container is None:
+            return
+        if isinstance(container, int):
+            container = _compact(container & ~(1 << low))
+        else:
+            position = bisect_left(container, low)
+            if position == len(container) or container[position] != low:
+                return
+            container = _compact(container[:position] + container[position + 1:])
+        if container is None:
+            del self.chunks[high]
+        else:
+            self.chunks[high] = container
+
+    def __and__(self, other: "ChunkedBitmap") -> "ChunkedBitmap":
+        smaller, larger = (self.chunks, other.chunks) if len(self.chunks) <= len(other.chunks) else (other.chunks, self.chunks)
+        chunks = {}
+        for high, container in smaller.items():
+            if high in larger:
+                common = _and(container, larger[high])
+                if common is not None:
+                    chunks[high] = common
+        return ChunkedBitmap(chunks)
+
+    def __or__(self, other: "ChunkedBitmap") -> "ChunkedBitmap":
+        chunks = dict(self.chunks)
+        for high, container in other.chunks.items():
+            chunks[high] = _or(chunks[high], container) if high in chunks else container
+        return ChunkedBitmap(chunks)
+
+    def __len__(self) -> int:
+        return sum(_count(container) for container in self.chunks.values())
+
+    def __bool__(self) -> bool:
+        return bool(self.chunks)
+
+    def __contains__(self, value: int) -> bool:
+        container = self.chunks.get(value >> CHUNK_BITS)
+        if container is None:
+            return False
+        low = value & (CHUNK_SIZE - 1)
+        if isinstance(container, int):
+            return bool(container >> low & 1)
+        position = bisect_left(container, low)
+        return position < len(container) and container[position] == low
+
+    def __iter__(self) -> Iterator[int]:
+        return self.iter_from(0)
+
+    # Ids from start on, in ascending order
+    def iter_from(self, start: int) -> Iterator[int]:
+        first = start >> CHUNK_BITS
+        for high in sorted(self.chunks):
+            if high < first:
+                continue
+            container, base = self.chunks[high], high << CHUNK_BITS
+            low = start - base if high == first else 0
+            if isinstance(container, int):
+                for value in _iter_bits(container, low):
+                    yield base + value
+            else:
+                for position in range(bisect_left(container, low), len(container)):
+                    yield base + container[position]
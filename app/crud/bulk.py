@@ -0,0 +1,116 @@
+import os
+from typing import Any, Dict, List, Tuple, Type
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from core.cache import reference_cache
+from core.invalidation import publish
+from crud.catalog import CHANGE_LOG_TABLES, log_changes
+
+# Rows accepted by one bulk request
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", "1000"))
+
+def _error(index: int, detail: str) -> Dict:
+    return {"index": index, "detail": detail}
+
+# Error of the database on a row, raised again when it is not about the row but the connection
+def _row_error(e: DBAPIError) -> str:
+    if e.connection_invalidated:
+        raise e
+    return str(e.orig.__cause__ or e.orig)
+
+# Validate every row of a bulk request on its own: invalid rows are reported instead of failing the request
+def validate_rows(rows: List[Any], schema: Type[BaseModel], errors: List[Dict]) -> List[Tuple[int, BaseModel]]:
+    valid = []
+    for index, row in enumerate(rows):
+        try:
+            valid.append((index, schema.model_validate(row)))
+        except ValidationError as e:
+            errors.append(_error(index, "; ".join("%s: %s" % (".".join(str(part) for part in error["loc"]) or "row", error["msg"])
+                                                  for error in e.errors())))
+    return valid
+
+# Drop the rows whose foreign keys point to missing rows, with one query per referenced table.
+# The referenced rows are locked (FOR KEY SHARE) so they cannot be deleted before the insert.
+async def check_references(db: AsyncSession, valid: List[Tuple[int, BaseModel]], references: Dict[str, Any],
+                           errors: List[Dict]) -> List[Tuple[int, BaseModel]]:
+    missing = {}
+    for column, model in references.items():
+        ids = {getattr(row, column) for _, row in valid if getattr(row, column) is not None}
+        existing = set((await db.execute(select(model.id).where(model.id.in_(ids)).with_for_update(key_share=True))).scalars()) if ids else set()
+        missing[column] = ids - existing
+
+    checked = []
+    for index, row in valid:
+        not_found = [column for column in references if getattr(row, column) in missing[column]]
+        if not_found:
+            errors.append(_error(index, " ".join("%s %s not found." % (column, getattr(row, column)) for column in not_found)))
+        else:
+            checked.append((index, row))
+    return checked
+
+# Insert rows with a single multi row INSERT ... RETURNING and return the created ones.
+# With a unique key the rows that already exist (or repeat an earlier row) are skipped through ON CONFLICT DO NOTHING
+# and reported.
+async def _insert_rows(db: AsyncSession, table, valid: List[Tuple[int, BaseModel]], key: Tuple[str, ...], errors: List[Dict]) -> List[Dict]:
+    values = [row.model_dump() for _, row in valid]
+    if not key:
+        statement = insert(table).returning(*table.columns, sort_by_parameter_order=True)
+        return [dict(row) for row in (await db.execute(statement, values)).mappings()]
+
+    statement = pg_insert(table).on_conflict_do_nothing(index_elements=list(key)).returning(*table.columns)
+    inserted = {tuple(row[column] for column in key): row for row in (await db.execute(statement, values)).mappings()}
+    created = []
+    for (index, _), value in zip(valid, values):
+        row = inserted.pop(tuple(value[column] for column in key), None)
+        if row is None:
+            errors.append(_error(index, "Already exists."))
+        else:
+            created.append(dict(row))
+    return created
+
+# Create the valid rows of a bulk request in one transaction, with a single INSERT.
+# A row the database rejects (a constraint the schema does not check) fails that INSERT inside a SAVEPOINT:
+# the rows are then inserted one by one, each in its own SAVEPOINT, and the rejected ones reported.
+async def bulk_create(db: AsyncSession, model, schema: Type[BaseModel], rows: List[Any], key: Tuple[str, ...] = (),
+                      references: Dict[str, Any] = None) -> Dict:
+    table = model.__table__
+    errors: List[Dict] = []
+    created: List[Dict] = []
+    try:
+        valid = validate_rows(rows, schema, errors)
+        if references and valid:
+            valid = await check_references(db, valid, references, errors)
+
+        if valid:
+            try:
+                async with db.begin_nested():
+                    created = await _insert_rows(db, table, valid, key, errors)
+            except DBAPIError as e:
+                _row_error(e)
+                for index, row in valid:
+                    try:
+                        async with db.begin_nested():
+                            created += await _insert_rows(db, table, [(index, row)], key, errors)
+                    except DBAPIError as e:
+                        errors.append(_error(index, _row_error(e)))
+
+        if created:
+            primary_key = [column.key for column in table.primary_key.columns]
+            keys = [tuple(row[column] for column in primary_key) if len(primary_key) > 1 else row[primary_key[0]] for row in created]
+            if table.name in CHANGE_LOG_TABLES:
+                await log_changes(db, table.name, keys)
+            await publish(db, table.name, keys)
+        await db.commit()
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if created:
+        reference_cache.invalidate(table.name)
+    errors.sort(key=lambda error: error["index"])
+    return {"created": created, "errors": errors}
@@ -0,0 +1,101 @@
+from typing import Dict, Iterable, Union, Tuple
+from fastapi import HTTPException
+from sqlalchemy import and_, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from models.models import CatalogChange, Competition, Nationality, Player, Team, TeamCompetition
+from core.cache import SnapshotCache
+
+# Tables of the catalog snapshot, by their key in the bundle
+CATALOG_MODELS = {
+    "players": Player,
+    "nationalities": Nationality,
+    "teams": Team,
+    "competitions": Competition,
+    "team_competitions": TeamCompetition,
+}
+CATALOG_TABLES = tuple(model.__tablename__ for model in CATALOG_MODELS.values())
+
+# Tables with a change log, by their key in /catalog/changes
+CHANGE_LOG_MODELS = {
+    "players": Player,
+    "teams": Team,
+    "team_competitions": TeamCompetition,
+}
+CHANGE_LOG_TABLES = tuple(model.__tablename__ for model in CHANGE_LOG_MODELS.values())
+
+# Transaction level advisory lock taken before writing to the change log. Catalog writes hold it until they
+# commit, so versions become visible in order and a client never skips a version committed late.
+CHANGE_LOG_LOCK = 7301
+
+catalog_snapshot = SnapshotCache(CATALOG_TABLES)
+
+# Record changed rows of a catalog table in the change log, inside the caller's transaction.
+# Keys are ids, or (team_id, competition_id) pairs for team_competition.
+async def log_changes(db: AsyncSession, table: str, keys: Iterable[Union[int, Tuple[int, int]]]) -> None:
+    values = [{"table_name": table, "row_id": key[0], "related_id": key[1]} if isinstance(key, tuple)
+              else {"table_name": table, "row_id": key, "related_id": 0} for key in keys]
+    if not values:
+        return
+    await db.execute(select(func.pg_advisory_xact_lock(CHANGE_LOG_LOCK)))
+    statement = pg_insert(CatalogChange)
+    statement = statement.on_conflict_do_update(index_elements=["table_name", "row_id", "related_id"],
+                                                set_={"version": statement.excluded.version})
+    await db.execute(statement, values)
+
+# The same for a set based INSERT or UPDATE written in SQL: it becomes a single statement that also logs the
+# keys it returns. The command status then counts the logged rows, which are the rows written.
+def logged_statement(table: str, statement: str, keys: str) -> str:
+    related = "" if ", " not in keys else ", related_id"
+    return ("WITH written AS (%s RETURNING %s) "
+            "INSERT INTO catalog_change (table_name, row_id%s) SELECT '%s', * FROM written "
+            "ON CONFLICT (table_name, row_id, related_id) DO UPDATE SET version = excluded.version" % (statement, keys, related, table))
+
+# Latest change log version, 0 before the first catalog write
+async def get_catalog_version(db: AsyncSession) -> int:
+    return (await db.execute(select(func.coalesce(func.max(CatalogChange.version), 0)))).scalar_one()
+
+# Every row of the catalog tables. Each table is sent as its column names and a list of value rows,
+# so the keys are not repeated for every player.
+# The version is read first: rows changed after it may already be included, replaying them is harmless.
+async def get_catalog(db: AsyncSession) -> Dict:
+    try:
+        catalog = {"version": await get_catalog_version(db)}
+        for key, model in CATALOG_MODELS.items():
+            table = model.__table__
+            result = await db.execute(select(*table.columns).order_by(*table.primary_key.columns))
+            catalog[key] = {"columns": [column.key for column in table.columns], "rows": [tuple(row) for row in result]}
+        return catalog
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Rows changed after a version, compacted to their current state: the rows that still exist are sent like in
+# the snapshot and the deleted ones as tombstones (ids, or [team_id, competition_id] pairs).
+async def get_catalog_changes(db: AsyncSession, since: int) -> Dict:
+    try:
+        version = await get_catalog_version(db)
+        changes = {"version": version}
+        for key, model in CHANGE_LOG_MODELS.items():
+            table = model.__table__
+            primary_key = list(table.primary_key.columns)
+            joined = [primary_key[0] == CatalogChange.row_id]
+            if len(primary_key) > 1:
+                joined.append(primary_key[1] == CatalogChange.related_id)
+            result = await db.execute(
+                select(CatalogChange.row_id, CatalogChange.related_id, *table.columns)
+                .select_from(CatalogChange.__table__.outerjoin(table, and_(*joined)))
+                .where(CatalogChange.table_name == table.name, CatalogChange.version > since, CatalogChange.version <= version)
+                .order_by(CatalogChange.version)
+            )
+            rows, deleted = [], []
+            for row in result:
+                if row[2] is None:
+                    deleted.append(row[0] if len(primary_key) == 1 else row[0:2])
+                else:
+                    rows.append(row[2:])
+            changes[key] = {"columns": [column.key for column in table.columns], "rows": rows, "deleted": deleted}
+        return changes
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
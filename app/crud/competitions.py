@@ -2,14 +2,19 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from fastapi import HTTPException
 from sqlalchemy.exc import SQLAlchemyError
-from typing import List, Dict
+from typing import Any, List, Dict, Optional, Tuple
 from models.models import Competition, CompetitionCreate
+from core.cache import reference_cache
+from core.invalidation import publish
+from crud.bulk import bulk_create
+from crud.pagination import DEFAULT_PAGE_SIZE, get_page
+from crud.writes import delete_row, insert_row, update_row
 
 # Get all competitions
-async def get_competitions(db: AsyncSession) -> List[Competition]:
+async def get_competitions(db: AsyncSession, after_id: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                           fields: Optional[str] = None) -> Tuple[List[Competition], Optional[int]]:
     try:
-        result = await db.execute(select(Competition))
-        return result.scalars().all()
+        return await get_page(db, select(Competition), Competition, after_id, limit, fields)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -27,60 +32,49 @@ async def get_competition_by_id(db: AsyncSession, comp_id: int) -> Competition:
 # Create a new competition
 async def create_competition(db: AsyncSession, new_competition: CompetitionCreate) -> Dict[str, int]:
     try:
-        competition = Competition(name=new_competition.name, region=new_competition.region)
-        db.add(competition)
+        competition = await insert_row(db, Competition, {"name": new_competition.name, "region": new_competition.region})
+        await publish(db, "competition", [competition["id"]])
         await db.commit()
-        await db.refresh(competition)
+        reference_cache.invalidate("competition")
         return competition
     except SQLAlchemyError as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+# Create many competitions in one statement, invalid rows are reported by their index
+async def create_competitions(db: AsyncSession, new_competitions: List[Any]) -> Dict:
+    return await bulk_create(db, Competition, CompetitionCreate, new_competitions)
+
 # Update an existing competition
 async def update_competition(db: AsyncSession, competition: CompetitionCreate, competition_id: int) -> Competition:
     try:
-        # Find the competition by ID
-        competition_update = await get_competition_by_id(db, competition_id)
-
-        # Check if the competition exists
-        if competition_update is None:
-            raise HTTPException(status_code=404, detail="Not found competition")
-
-        # Update only the provided fields
-        competition_update.name = competition.name
-        competition_update.region = competition.region
-
-        # Save changes
+        competition_update = await update_row(db, Competition, Competition.id == competition_id, {"name": competition.name, "region": competition.region}, "Not found competition")
+        await publish(db, "competition", [competition_id])
         await db.commit()
-        
-        await db.refresh(competition_update)
-        # Return the updated competition
+        reference_cache.invalidate("competition")
         return competition_update
     except SQLAlchemyError as e:
-        # Rollback in case of error
         await db.rollback()
         raise HTTPException(status_code=500, detail="Could not update competition: " + str(e))
 
 # Delete a competition
 async def delete_competition(db: AsyncSession, comp_id: int) -> None:
     try:
-        competition = await get_competition_by_id(db, comp_id)
-        if competition is None:
-            raise HTTPException(status_code=404, detail="Not found competition")
-
-        await db.delete(competition)
+        await delete_row(db, Competition, Competition.id == comp_id, "Not found competition")
+        await publish(db, "competition", [comp_id])
         await db.commit()
+        reference_cache.invalidate("competition")
         return {"detail": "Competition with id " + str(comp_id) + " deleted successfully"}
     except SQLAlchemyError as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    
 
 # Other get functions
 # Get competitions by name
-async def get_competition_by_name(db: AsyncSession, name: str) -> Competition:
+async def get_competition_by_name(db: AsyncSession, name: str, after_id: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                                  fields: Optional[str] = None) -> Tuple[List[Competition], Optional[int]]:
     try:
-        result = await db.execute(select(Competition).where(Competition.name.ilike(f"%{name}%")))
-        return result.scalars().all()
+        query = select(Competition).where(Competition.name.ilike(f"%{name}%"))
+        return await get_page(db, query, Competition, after_id, limit, fields)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,67 @@
+import csv
+import io
+import zlib
+from datetime import date
+from typing import AsyncIterator, List, Optional
+from sqlalchemy import Select
+from sqlalchemy.orm import sessionmaker
+from models.models import ExportFormatEnum
+from crud.pagination import get_projected_columns
+from core.responses import dumps
+
+# Rows fetched from the server side cursor at a time, memory stays around one chunk whatever the export size
+EXPORT_CHUNK_SIZE = 1000
+
+MEDIA_TYPES = {
+    ExportFormatEnum.NDJSON: "application/x-ndjson",
+    ExportFormatEnum.CSV: "text/csv; charset=utf-8",
+}
+
+# Columns of an export: the "fields" projection or every column of the table
+def get_export_columns(model, fields: Optional[str] = None) -> List:
+    return get_projected_columns(model, fields) or list(model.__table__.columns)
+
+# Stream the rows of a query in id order, one chunk of dicts at a time.
+# The export opens its own session: the request session is closed before a streamed body is sent.
+async def stream_rows(session_factory: sessionmaker, query: Select, model, columns: List) -> AsyncIterator[List[dict]]:
+    query = query.with_only_columns(*columns).order_by(model.id).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    async with session_factory() as db:
+        result = await db.stream(query)
+        keys = list(result.keys())
+        async for partition in result.partitions():
+            yield [dict(zip(keys, row)) for row in partition]
+
+def _csv_value(value):
+    return value.isoformat() if isinstance(value, date) else value
+
+# Encode the rows as NDJSON or CSV (with a header line), optionally gzip compressed
+async def encode_export(chunks: AsyncIterator[List[dict]], columns: List, export_format: ExportFormatEnum,
+                        compress: bool = False) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compress else None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    keys = [column.key for column in columns]
+
+    if export_format == ExportFormatEnum.CSV:
+        writer.writerow(keys)
+
+    async for rows in chunks:
+        if export_format == ExportFormatEnum.CSV:
+            writer.writerows([_csv_value(row[key]) for key in keys] for row in rows)
+            data = buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        else:
+            data = b"".join(dumps(row) + b"\n" for row in rows)
+
+        if compressor is not None:
+            data = compressor.compress(data)
+        if data:
+            yield data
+
+    # Whatever is left: the CSV header of an empty export and the end of the gzip stream
+    data = buffer.getvalue().encode("utf-8")
+    if compressor is not None:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
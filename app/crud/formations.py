@@ -2,14 +2,19 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from fastapi import HTTPException
 from sqlalchemy.exc import SQLAlchemyError
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional, Tuple
 from models.models import Formation, FormationCreate
+from core.cache import reference_cache
+from core.invalidation import publish
+from crud.bulk import bulk_create
+from crud.pagination import DEFAULT_PAGE_SIZE, get_page
+from crud.writes import delete_row, insert_row, update_row
 
 # Get all formations
-async def get_formations(db: AsyncSession) -> List[Formation]:
+async def get_formations(db: AsyncSession, after_id: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                         fields: Optional[str] = None) -> Tuple[List[Formation], Optional[int]]:
     try:
-        result = await db.execute(select(Formation))
-        return result.scalars().all()
+        return await get_page(db, select(Formation), Formation, after_id, limit, fields)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -27,27 +32,26 @@ async def get_formation_by_id(db: AsyncSession, formation_id: int) -> Formation:
 # Create a new formation
 async def create_formation(db: AsyncSession, new_formation: FormationCreate) -> Dict[str, int]:
     try:
-        formation = Formation(name=new_formation.name, description=new_formation.description)
-        db.add(formation)
+        formation = await insert_row(db, Formation, {"name": new_formation.name, "description": new_formation.description})
+        await publish(db, "formation", [formation["id"]])
         await db.commit()
-        await db.refresh(formation)
+        reference_cache.invalidate("formation")
         return formation
     except SQLAlchemyError as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+# Create many formations in one statement, invalid rows are reported by their index
+async def create_formations(db: AsyncSession, new_formations: List[Any]) -> Dict:
+    return await bulk_create(db, Formation, FormationCreate, new_formations)
+
 # Update an existing formation
 async def update_formation(db: AsyncSession, updated_formation: FormationCreate, formation_id: int) -> None:
     try:
-        formation = await get_formation_by_id(db, formation_id)
-        if formation is None:
-            raise HTTPException(status_code=404, detail="Not found formation")
-
-        formation.name = updated_formation.name
-        formation.description = updated_formation.description
+        formation = await update_row(db, Formation, Formation.id == formation_id, {"name": updated_formation.name, "description": updated_formation.description}, "Not found formation")
+        await publish(db, "formation", [formation_id])
         await db.commit()
-        
-        await db.refresh(formation)
+        reference_cache.invalidate("formation")
         return formation
     except SQLAlchemyError as e:
         await db.rollback()
@@ -56,13 +60,11 @@ async def update_formation(db: AsyncSession, updated_formation: FormationCreate,
 # Delete a formation
 async def delete_formation(db: AsyncSession, formation_id: int) -> None:
     try:
-        formation = await get_formation_by_id(db, formation_id)
-        if formation is None:
-            raise HTTPException(status_code=404, detail="Not found formation")
-
-        await db.delete(formation)
+        await delete_row(db, Formation, Formation.id == formation_id, "Not found formation")
+        await publish(db, "formation", [formation_id])
         await db.commit()
+        reference_cache.invalidate("formation")
         return {"detail": "Formation with id " + str(formation_id) + " deleted successfully"}
     except SQLAlchemyError as e:
         await db.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,272 @@
+import asyncio
+import csv
+import io
+import os
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from itertools import islice
+from time import perf_counter
+from typing import IO, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+import asyncpg
+from fastapi import HTTPException
+from sqlalchemy.exc import SQLAlchemyError
+from db import SessionLocal, engine
+from models.models import Competition, ImportFormatEnum, ImportKindEnum, Nationality, Player, PositionEnum, Team
+from core.cache import reference_cache
+from core.invalidation import publish_raw
+from crud.catalog import CHANGE_LOG_LOCK, CHANGE_LOG_TABLES, logged_statement
+from crud.player_index import player_index
+
+# openpyxl is optional: without it only CSV files can be imported
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# Rejected rows listed in the report, the rest are only counted
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "100"))
+# Rows parsed and validated per chunk, each chunk is sent with its own COPY
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "10000"))
+
+Lookups = Dict[str, Dict[str, int]]
+
+# Column sizes, longer values reject their row instead of failing the whole COPY
+NATIONALITY_NAME_LENGTH = Nationality.__table__.c.name.type.length
+COMPETITION_NAME_LENGTH = Competition.__table__.c.name.type.length
+COMPETITION_REGION_LENGTH = Competition.__table__.c.region.type.length
+TEAM_NAME_LENGTH = Team.__table__.c.name.type.length
+PLAYER_NAME_LENGTH = Player.__table__.c.name.type.length
+POSITIONS = {position.value for position in PositionEnum}
+
+# How a kind of file is loaded: the staging columns, the converter of a file row to a staging record,
+# the name lookups it needs and the set based statements that merge the staging table into the catalog
+class ImportSpec(NamedTuple):
+    table: str
+    staging: Tuple[Tuple[str, str], ...]
+    required: Tuple[str, ...]
+    lookups: Tuple[str, ...]
+    convert: Callable[[dict, Lookups], tuple]
+    upserts: Tuple[Tuple[str, str], ...]
+
+# Names are matched ignoring case and repeated spaces
+@lru_cache(maxsize=4096)
+def _key(name: str) -> str:
+    return " ".join(name.split()).casefold()
+
+def _text(row: dict, column: str, max_length: int, required: bool = True) -> Optional[str]:
+    value = row.get(column)
+    value = str(value).strip() if value is not None else ""
+    if not value:
+        if required:
+            raise ValueError("missing %s" % column)
+        return None
+    if len(value) > max_length:
+        raise ValueError("%s longer than %d characters" % (column, max_length))
+    return value
+
+# Id of a team, nationality or competition given by name
+def _reference(row: dict, column: str, lookups: Lookups, required: bool = False) -> Optional[int]:
+    name = _text(row, column, 200, required)
+    if name is None:
+        return None
+    reference = lookups[column].get(_key(name))
+    if reference is None:
+        raise ValueError("unknown %s '%s'" % (column, name))
+    return reference
+
+def _market_value(row: dict) -> Decimal:
+    value = _text(row, "market_value", 32)
+    try:
+        market_value = Decimal(value).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        raise ValueError("market_value '%s' is not a number" % value)
+    if not market_value.is_finite() or market_value < 0 or market_value >= 10 ** 13:
+        raise ValueError("market_value '%s' out of range" % value)
+    return market_value
+
+def _position(row: dict, column: str, required: bool = True) -> Optional[str]:
+    position = _text(row, column, 50, required)
+    if position is None:
+        return None
+    if position.upper() not in POSITIONS:
+        raise ValueError("unknown %s '%s'" % (column, position))
+    return position.upper()
+
+# Id of the existing row with the same name (None for a new one), name key and name
+def _named(row: dict, table: str, lookups: Lookups, max_length: int) -> tuple:
+    name = _text(row, "name", max_length)
+    key = _key(name)
+    return lookups[table].get(key), key, name
+
+def _convert_nationality(row: dict, lookups: Lookups) -> tuple:
+    return _named(row, "nationality", lookups, NATIONALITY_NAME_LENGTH)
+
+def _convert_competition(row: dict, lookups: Lookups) -> tuple:
+    return _named(row, "competition", lookups, COMPETITION_NAME_LENGTH) + (_text(row, "region", COMPETITION_REGION_LENGTH),)
+
+def _convert_team(row: dict, lookups: Lookups) -> tuple:
+    return _named(row, "team", lookups, TEAM_NAME_LENGTH)
+
+def _convert_team_competition(row: dict, lookups: Lookups) -> tuple:
+    return (_reference(row, "team", lookups, True), _reference(row, "competition", lookups, True))
+
+def _convert_player(row: dict, lookups: Lookups) -> tuple:
+    return (_text(row, "name", PLAYER_NAME_LENGTH), _reference(row, "nationality", lookups), _reference(row, "team", lookups),
+            _market_value(row), _position(row, "position"), _position(row, "alternate_position", False))
+
+# Last row of the file for each player, players are matched by name and team
+_LATEST_PLAYERS = ("WITH latest AS (SELECT DISTINCT ON (name, coalesce(team_id, 0)) * FROM import_rows "
+                   "ORDER BY name, coalesce(team_id, 0), line DESC) ")
+
+# Rows of new names, the last one of the file when a name is repeated
+_NEW_NAMES = "FROM import_rows WHERE id IS NULL ORDER BY key, line DESC"
+_NAMED = (("id", "integer"), ("key", "text"), ("name", "text"))
+
+IMPORT_SPECS: Dict[ImportKindEnum, ImportSpec] = {
+    ImportKindEnum.NATIONALITIES: ImportSpec(
+        "nationality", _NAMED, ("name",), ("nationality",), _convert_nationality,
+        (("INSERT INTO nationality (name) SELECT DISTINCT ON (key) name " + _NEW_NAMES + " ON CONFLICT (name) DO NOTHING", "inserted"),)),
+    ImportKindEnum.COMPETITIONS: ImportSpec(
+        "competition", _NAMED + (("region", "text"),), ("name", "region"), ("competition",), _convert_competition,
+        (("UPDATE competition c SET region = s.region "
+          "FROM (SELECT DISTINCT ON (id) id, region FROM import_rows WHERE id IS NOT NULL ORDER BY id, line DESC) s "
+          "WHERE c.id = s.id AND c.region <> s.region", "updated"),
+         ("INSERT INTO competition (name, region) SELECT DISTINCT ON (key) name, region " + _NEW_NAMES, "inserted"))),
+    ImportKindEnum.TEAMS: ImportSpec(
+        "team", _NAMED, ("name",), ("team",), _convert_team,
+        ((logged_statement("team", "INSERT INTO team (name) SELECT DISTINCT ON (key) name " + _NEW_NAMES, "id"), "inserted"),)),
+    ImportKindEnum.TEAM_COMPETITIONS: ImportSpec(
+        "team_competition", (("team_id", "integer"), ("competition_id", "integer")), ("team", "competition"), ("team", "competition"),
+        _convert_team_competition,
+        ((logged_statement("team_competition", "INSERT INTO team_competition (team_id, competition_id) "
+                           "SELECT DISTINCT team_id, competition_id FROM import_rows ON CONFLICT DO NOTHING", "team_id, competition_id"),
+          "inserted"),)),
+    ImportKindEnum.PLAYERS: ImportSpec(
+        "player", (("name", "text"), ("nationality_id", "integer"), ("team_id", "integer"), ("market_value", "numeric(15, 2)"),
+                   ("position", "text"), ("alternate_position", "text")),
+        ("name", "market_value", "position"), ("nationality", "team"), _convert_player,
+        ((logged_statement("player", _LATEST_PLAYERS + "UPDATE player p SET nationality_id = s.nationality_id, "
+                           "market_value = s.market_value, position = s.position, alternate_position = s.alternate_position FROM latest s "
+                           "WHERE p.name = s.name AND coalesce(p.team_id, 0) = coalesce(s.team_id, 0) "
+                           "AND (p.nationality_id, p.market_value, p.position, p.alternate_position) "
+                           "IS DISTINCT FROM (s.nationality_id, s.market_value, s.position, s.alternate_position)", "p.id"), "updated"),
+         (logged_statement("player", _LATEST_PLAYERS + "INSERT INTO player (name, nationality_id, team_id, market_value, position, "
+                           "alternate_position) SELECT name, nationality_id, team_id, market_value, position, alternate_position FROM latest s "
+                           "WHERE NOT EXISTS (SELECT 1 FROM player p WHERE p.name = s.name AND coalesce(p.team_id, 0) = coalesce(s.team_id, 0))",
+                           "id"),
+          "inserted"))),
+}
+
+def _header(cells) -> List[str]:
+    return [str(cell).strip().lower() if cell is not None else "" for cell in cells]
+
+# Header and an iterator of (line, row) of a CSV file, read as it goes
+def read_csv(file: IO[bytes]) -> Tuple[List[str], Iterator[Tuple[int, dict]]]:
+    reader = csv.reader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+    header = _header(next(reader, []))
+
+    def rows():
+        for values in reader:
+            if any(value.strip() for value in values):
+                yield reader.line_num, dict(zip(header, values))
+    return header, rows()
+
+# Header and an iterator of (line, row) of a worksheet, the workbook is opened read only so rows are not all loaded
+def read_xlsx(file: IO[bytes], sheet: Optional[str] = None) -> Tuple[List[str], Iterator[Tuple[int, dict]]]:
+    if openpyxl is None:
+        raise HTTPException(status_code=400, detail="Reading .xlsx files needs openpyxl, install it or send a CSV file.")
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    if sheet is not None and sheet not in workbook.sheetnames:
+        workbook.close()
+        raise HTTPException(status_code=400, detail="Unknown sheet '%s'." % sheet)
+    cells = (workbook[sheet] if sheet is not None else workbook.active).iter_rows(values_only=True)
+    header = _header(next(cells, []))
+
+    def rows():
+        try:
+            for line, values in enumerate(cells, start=2):
+                if any(value is not None and str(value).strip() for value in values):
+                    yield line, dict(zip(header, values))
+        finally:
+            workbook.close()
+    return header, rows()
+
+def read_rows(file: IO[bytes], file_format: ImportFormatEnum, sheet: Optional[str] = None):
+    return read_xlsx(file, sheet) if file_format == ImportFormatEnum.XLSX else read_csv(file)
+
+# Name -> id maps of the referenced tables (the lookup columns are named after them), the first row wins when a name is repeated
+async def _load_lookups(connection: asyncpg.Connection, columns: Tuple[str, ...]) -> Lookups:
+    lookups = {}
+    for column in columns:
+        lookups[column] = {}
+        for record in await connection.fetch("SELECT id, name FROM %s ORDER BY id" % column):
+            lookups[column].setdefault(_key(record["name"]), record["id"])
+    return lookups
+
+# Staging records of the valid rows, the invalid ones are counted in the report
+def _records(spec: ImportSpec, rows: Iterator[Tuple[int, dict]], lookups: Lookups, report: dict) -> Iterator[tuple]:
+    for line, row in rows:
+        report["rows"] += 1
+        try:
+            yield (line, *spec.convert(row, lookups))
+        except ValueError as e:
+            report["rejected"] += 1
+            if len(report["errors"]) < IMPORT_MAX_ERRORS:
+                report["errors"].append("line %d: %s" % (line, e))
+
+def _next_chunk(records: Iterator[tuple]) -> List[tuple]:
+    return list(islice(records, IMPORT_CHUNK_ROWS))
+
+# COPY the records chunk by chunk. Reading, parsing and validating the file runs on a thread, one chunk ahead
+# of the COPY of the previous one, so a large file never blocks the event loop.
+# The thread is the only one moving the iterator (and filling the report) while the import runs.
+async def _copy_records(connection: asyncpg.Connection, records: Iterator[tuple], columns: List[str]):
+    chunk = await asyncio.to_thread(_next_chunk, records)
+    while chunk:
+        following = asyncio.ensure_future(asyncio.to_thread(_next_chunk, records))
+        try:
+            await connection.copy_records_to_table("import_rows", records=chunk, columns=columns)
+        except BaseException:
+            # Let the thread finish its chunk before the file is closed
+            await asyncio.gather(following, return_exceptions=True)
+            raise
+        chunk = await following
+
+# Load a CSV or XLSX file into a catalog table in one transaction.
+# The rows are streamed through a binary COPY into a temporary staging table and merged with a few set based
+# statements, instead of one INSERT per row.
+async def import_catalog(kind: ImportKindEnum, file: IO[bytes], file_format: ImportFormatEnum, sheet: Optional[str] = None) -> dict:
+    start = perf_counter()
+    spec = IMPORT_SPECS[kind]
+    header, rows = await asyncio.to_thread(read_rows, file, file_format, sheet)
+    missing = [column for column in spec.required if column not in header]
+    if missing:
+        raise HTTPException(status_code=400, detail="Missing columns: %s." % ", ".join(missing))
+
+    report = {"kind": kind, "rows": 0, "inserted": 0, "updated": 0, "rejected": 0, "errors": []}
+    try:
+        async with engine.connect() as connection:
+            driver_connection = (await connection.get_raw_connection()).driver_connection
+            async with driver_connection.transaction():
+                lookups = await _load_lookups(driver_connection, spec.lookups)
+                staging = ", ".join("%s %s" % column for column in spec.staging)
+                await driver_connection.execute("CREATE TEMPORARY TABLE import_rows (line integer, %s) ON COMMIT DROP" % staging)
+                columns = ["line"] + [column for column, _ in spec.staging]
+                await _copy_records(driver_connection, _records(spec, rows, lookups, report), columns)
+                # Temporary tables are never analyzed by autovacuum, the merge plans need the row count
+                await driver_connection.execute("ANALYZE import_rows")
+                if spec.table in CHANGE_LOG_TABLES:
+                    await driver_connection.execute("SELECT pg_advisory_xact_lock($1)", CHANGE_LOG_LOCK)
+                for statement, counter in spec.upserts:
+                    status = await driver_connection.execute(statement)
+                    report[counter] += int(status.split()[-1])
+                await publish_raw(driver_connection, spec.table)
+    except (asyncpg.PostgresError, SQLAlchemyError) as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    reference_cache.invalidate(spec.table)
+    if player_index.ready and kind in (ImportKindEnum.PLAYERS, ImportKindEnum.TEAM_COMPETITIONS):
+        async with SessionLocal() as db:
+            await player_index.load(db)
+    report["seconds"] = round(perf_counter() - start, 3)
+    return report
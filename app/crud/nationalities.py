@@ -2,14 +2,21 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from fastapi import HTTPException
 from sqlalchemy.exc import SQLAlchemyError
-from typing import List, Dict
+from typing import Any, List, Dict, Optional, Tuple
 from models.models import Nationality, NationalityCreate
+from core.cache import reference_cache
+from core.invalidation import publish
+from crud.bulk import bulk_create
+from crud.catalog import log_changes
+from crud.player_index import player_index
+from crud.pagination import DEFAULT_PAGE_SIZE, get_page
+from crud.writes import delete_row_detaching, insert_row, update_row
 
 # Get all nationalities
-async def get_nationalities(db: AsyncSession) -> List[Nationality]:
+async def get_nationalities(db: AsyncSession, after_id: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                            fields: Optional[str] = None) -> Tuple[List[Nationality], Optional[int]]:
     try:
-        result = await db.execute(select(Nationality))
-        return result.scalars().all()
+        return await get_page(db, select(Nationality), Nationality, after_id, limit, fields)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -27,27 +34,26 @@ async def get_nationality_by_id(db: AsyncSession, nationality_id: int) -> Nation
 # Create a new nationality
 async def create_nationality(db: AsyncSession, new_nationality: NationalityCreate) -> Dict[str, int]:
     try:
-        nationality = Nationality(name=new_nationality.name)
-        db.add(nationality)
+        nationality = await insert_row(db, Nationality, {"name": new_nationality.name})
+        await publish(db, "nationality", [nationality["id"]])
         await db.commit()
-        await db.refresh(nationality)
+        reference_cache.invalidate("nationality")
         return nationality
     except SQLAlchemyError as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+# Create many nationalities in one statement, invalid rows and names that already exist are reported by their index
+async def create_nationalities(db: AsyncSession, new_nationalities: List[Any]) -> Dict:
+    return await bulk_create(db, Nationality, NationalityCreate, new_nationalities, key=("name",))
+
 # Update an existing nationality
 async def update_nationality(db: AsyncSession, updated_nationality: NationalityCreate, nationality_id: int) -> None:
     try:
-        nationality = await get_nationality_by_id(db, nationality_id)
-        if nationality is None:
-            raise HTTPException(status_code=404, detail="Not found nationality")
-
-        nationality.name = updated_nationality.name
-
+        nationality = await update_row(db, Nationality, Nationality.id == nationality_id, {"name": updated_nationality.name}, "Not found nationality")
+        await publish(db, "nationality", [nationality_id])
         await db.commit()
-        
-        await db.refresh(nationality)
+        reference_cache.invalidate("nationality")
         return nationality
     except SQLAlchemyError as e:
         await db.rollback()
@@ -56,12 +62,15 @@ async def update_nationality(db: AsyncSession, updated_nationality: NationalityC
 # Delete a nationality
 async def delete_nationality(db: AsyncSession, nationality_id: int) -> None:
     try:
-        nationality = await get_nationality_by_id(db, nationality_id)
-        if nationality is None:
-            raise HTTPException(status_code=404, detail="Not found nationality")
-
-        await db.delete(nationality)
+        # Its players are left without a nationality, they are logged as changed
+        _nationality, detached = await delete_row_detaching(db, Nationality, Nationality.id == nationality_id, "Not found nationality")
+        players = detached.get("player", [])
+        await log_changes(db, "player", players)
+        await publish(db, "nationality", [nationality_id])
+        await publish(db, "player", players)
         await db.commit()
+        reference_cache.invalidate("nationality", "player")
+        await player_index.refresh_players(db, players)
         return {"detail": "Nationality with id " + str(nationality_id) + " deleted successfully"}
     except SQLAlchemyError as e:
         await db.rollback()
@@ -70,9 +79,10 @@ async def delete_nationality(db: AsyncSession, nationality_id: int) -> None:
 
 # Other get functions
 # Get nationalities by name
-async def get_nationalities_by_name(db: AsyncSession, name: str) -> Nationality:
+async def get_nationalities_by_name(db: AsyncSession, name: str, after_id: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                                    fields: Optional[str] = None) -> Tuple[List[Nationality], Optional[int]]:
     try:
-        result = await db.execute(select(Nationality).where(Nationality.name.ilike(f"%{name}%")))
-        return result.scalars().all()
+        query = select(Nationality).where(Nationality.name.ilike(f"%{name}%"))
+        return await get_page(db, query, Nationality, after_id, limit, fields)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,50 @@
+from fastapi import HTTPException
+from typing import List, Optional, Tuple
+
+# Page size limits for list endpoints
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Resolve a comma separated "fields" parameter into model columns (id is always included for the cursor)
+def get_projected_columns(model, fields: Optional[str] = None) -> List:
+    if not fields:
+        return []
+
+    names = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [name for name in names if name not in model.__table__.columns]
+    if unknown:
+        raise HTTPException(status_code=400, detail="Unknown fields: " + ", ".join(unknown))
+
+    if "id" not in names:
+        names.insert(0, "id")
+    return [getattr(model, name) for name in names]
+
+# Execute a query as a keyset page ordered by id, returning the rows and the cursor for the next page.
+# With as_rows (or a projection) the page holds plain dicts built from Core rows instead of ORM instances:
+# no identity map, no instance state and no relationship loaders, which is all a list that is only serialized needs.
+async def get_page(db, query, model, after_id: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                   fields: Optional[str] = None, as_rows: bool = False) -> Tuple[List, Optional[int]]:
+    columns = get_projected_columns(model, fields)
+    if not columns and as_rows:
+        columns = list(model.__table__.columns)
+    if columns:
+        query = query.with_only_columns(*columns)
+
+    if after_id is not None:
+        query = query.where(model.id > after_id)
+
+    # Ask for one extra row to know if there is a next page
+    query = query.order_by(model.id).limit(limit + 1)
+    result = await db.execute(query)
+    if columns:
+        # dicts validate much faster than Row objects in the response models
+        keys = list(result.keys())
+        rows = [dict(zip(keys, row)) for row in result]
+    else:
+        rows = result.scalars().all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]["id"] if columns else rows[-1].id
+    return rows, next_cursor
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Mapping, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from db import SessionLocal, engine
+from models.models import CacheVersion, Player
+
+# Directory of the shared player catalog. Unset, every worker keeps its own copy of the players in the index.
+PLAYER_CATALOG_DIR = os.getenv("PLAYER_CATALOG_DIR")
+# Seconds a worker waits for another one building the same generation before building it itself
+PLAYER_CATALOG_BUILD_TIMEOUT = float(os.getenv("PLAYER_CATALOG_BUILD_TIMEOUT", "120"))
+# Generations kept in the directory, older files are removed by the worker that writes a new one
+PLAYER_CATALOG_KEEP = int(os.getenv("PLAYER_CATALOG_KEEP", "2"))
+
+# magic, format, generation, player count, metadata offset, metadata length
+_HEADER = struct.Struct("<4sIQQQQ")
+_MAGIC = b"PLYC"
+_FORMAT = 1
+_FILE_NAME = re.compile(r"^players-(\d+)\.bin$")
+
+# Case and accent insensitive form of a name, like f_unaccent() + ilike in the database
+def normalize_name(name: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", name)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+# A generation of the catalog mapped read only. The columns are memoryviews over the mapping, nothing is copied:
+# the pages are shared with every other worker of the host through the page cache.
+# Players are sorted by id, team and nationality ids are -1 for NULL and positions are codes into self.codes.
+class PlayerColumns:
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self.mapping)
+        magic, file_format, self.generation, self.count, meta_offset, meta_length = _HEADER.unpack_from(buffer)
+        if magic != _MAGIC or file_format != _FORMAT:
+            raise ValueError("Not a player catalog file: " + path)
+        meta = json.loads(bytes(buffer[meta_offset:meta_offset + meta_length]))
+        if meta["byteorder"] != sys.byteorder:
+            raise ValueError("Player catalog written on another architecture: " + path)
+
+        sections = meta["sections"]
+        def column(name: str) -> memoryview:
+            offset, length, typecode = sections[name]
+            return buffer[offset:offset + length].cast(typecode)
+
+        self.codes: List[Optional[str]] = meta["codes"]
+        self.ids = column("ids")
+        self.team_ids = column("team_ids")
+        self.nationality_ids = column("nationality_ids")
+        self.market_values = column("market_values")
+        self.positions = column("positions")
+        self.alternate_positions = column("alternate_positions")
+        self.name_offsets = column("name_offsets")
+        self.names = column("names")
+        self.search_offsets = column("search_offsets")
+        self.search_names = column("search_names")
+        # Positions of the players by market value (then id)
+        self.by_market_value = column("by_market_value")
+
+    def __len__(self) -> int:
+        return self.count
+
+    # Position of a player in the columns, None when it is not in this generation
+    def find(self, player_id: int) -> Optional[int]:
+        position = bisect_left(self.ids, player_id)
+        return position if position < self.count and self.ids[position] == player_id else None
+
+    def search_name(self, position: int) -> str:
+        return bytes(self.search_names[self.search_offsets[position]:self.search_offsets[position + 1]]).decode()
+
+    # The player at a position, as a row of the player columns
+    def row(self, position: int) -> dict:
+        team_id, nationality_id = self.team_ids[position], self.nationality_ids[position]
+        return {
+            "id": self.ids[position],
+            "name": bytes(self.names[self.name_offsets[position]:self.name_offsets[position + 1]]).decode(),
+            "nationality_id": nationality_id if nationality_id >= 0 else None,
+            "team_id": team_id if team_id >= 0 else None,
+            "market_value": self.market_values[position],
+            "position": self.codes[self.positions[position]],
+            "alternate_position": self.codes[self.alternate_positions[position]],
+        }
+
+# Collects the players (in id order) into compact arrays and writes them as a catalog file
+class PlayerColumnsWriter:
+    def __init__(self):
+        self.ids, self.team_ids, self.nationality_ids = array("i"), array("i"), array("i")
+        self.market_values = array("d")
+        self.positions, self.alternate_positions = array("H"), array("H")
+        self.name_offsets, self.search_offsets = array("I", [0]), array("I", [0])
+        self.names, self.search_names = bytearray(), bytearray()
+        self.codes: Dict[Optional[str], int] = {None: 0}
+
+    def add(self, player: Mapping):
+        self.ids.append(player["id"])
+        self.team_ids.append(player["team_id"] if player["team_id"] is not None else -1)
+        self.nationality_ids.append(player["nationality_id"] if player["nationality_id"] is not None else -1)
+        self.market_values.append(float(player["market_value"]))
+        self.positions.append(self.codes.setdefault(player["position"], len(self.codes)))
+        self.alternate_positions.append(self.codes.setdefault(player["alternate_position"], len(self.codes)))
+        self.names += player["name"].encode()
+        self.name_offsets.append(len(self.names))
+        self.search_names += normalize_name(player["name"]).encode()
+        self.search_offsets.append(len(self.search_names))
+
+    # Write to a temporary file and rename it, so a generation is never seen half written
+    def write(self, path: str, generation: int):
+        market_values = self.market_values
+        by_market_value = array("i", sorted(range(len(self.ids)), key=lambda position: (market_values[position], self.ids[position])))
+        columns = (("ids", self.ids), ("team_ids", self.team_ids), ("nationality_ids", self.nationality_ids),
+                   ("market_values", market_values), ("positions", self.positions), ("alternate_positions", self.alternate_positions),
+                   ("name_offsets", self.name_offsets), ("names", self.names), ("search_offsets", self.search_offsets),
+                   ("search_names", self.search_names), ("by_market_value", by_market_value))
+
+        temporary = "%s.%d.tmp" % (path, os.getpid())
+        with open(temporary, "wb") as file:
+            file.write(bytes(_HEADER.size))
+            sections = {}
+            for name, values in columns:
+                # Sections start on 8 byte boundaries, like the arrays they are read as
+                file.write(bytes(-file.tell() % 8))
+                offset = file.tell()
+                if isinstance(values, bytearray):
+                    file.write(values)
+                    sections[name] = (offset, len(values), "B")
+                else:
+                    values.tofile(file)
+                    sections[name] = (offset, len(values) * values.itemsize, values.typecode)
+
+            codes = [None] * len(self.codes)
+            for value, code in self.codes.items():
+                codes[code] = value
+            meta = json.dumps({"byteorder": sys.byteorder, "codes": codes, "sections": sections}).encode()
+            meta_offset = file.tell()
+            file.write(meta)
+            file.seek(0)
+            file.write(_HEADER.pack(_MAGIC, _FORMAT, generation, len(self.ids), meta_offset, len(meta)))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+
+def _path(generation: int) -> str:
+    return os.path.join(PLAYER_CATALOG_DIR, "players-%d.bin" % generation)
+
+def _remove_old_generations():
+    generations = sorted((int(match.group(1)) for match in map(_FILE_NAME.match, os.listdir(PLAYER_CATALOG_DIR)) if match), reverse=True)
+    for generation in generations[PLAYER_CATALOG_KEEP:]:
+        try:
+            # Workers still mapping it keep their pages (on Windows the file stays until they let it go)
+            os.remove(_path(generation))
+        except OSError:
+            pass
+
+async def _build(db: AsyncSession, path: str, generation: int):
+    writer = PlayerColumnsWriter()
+    result = await db.stream(select(*Player.__table__.columns).order_by(Player.id))
+    async for player in result.mappings():
+        writer.add(player)
+    await asyncio.to_thread(writer.write, path, generation)
+
+# Map the generation of the current player table, building it first if no other worker has.
+# The generation is the version of the player table in cache_version, read in the same REPEATABLE READ
+# snapshot as the players, so a file always holds exactly the table at its version.
+async def open_player_catalog() -> PlayerColumns:
+    async with SessionLocal() as db:
+        if engine.dialect.name == "postgresql":
+            await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        generation = (await db.execute(select(CacheVersion.version).where(CacheVersion.table_name == "player"))).scalar() or 0
+        return await _open(db, generation)
+
+async def _open(db: AsyncSession, generation: int) -> PlayerColumns:
+    os.makedirs(PLAYER_CATALOG_DIR, exist_ok=True)
+    path = _path(generation)
+    marker = path + ".building"
+    deadline = time.monotonic() + PLAYER_CATALOG_BUILD_TIMEOUT
+    while True:
+        try:
+            return PlayerColumns(path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.close(os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            owns_marker = True
+        except FileExistsError:
+            # Another worker is building it, unless it died doing so
+            if time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+                continue
+            owns_marker = False
+        try:
+            await _build(db, path, generation)
+        finally:
+            # The marker of a worker still building (only slower than the timeout) stays its own
+            if owns_marker:
+                try:
+                    os.remove(marker)
+                except OSError:
+                    pass
+        _remove_old_generations()
@@ -0,0 +1,290 @@
+import asyncio
+import os
+from bisect import bisect_left, insort
+from typing import Any, Callable, Dict, List, Mapping, Optional, Set, Tuple
+from sqlalchemy import tuple_
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from db import SessionLocal
+from models.models import Player, TeamCompetition
+from core.invalidation import subscribe
+from crud.bitmaps import ChunkedBitmap
+from crud.pagination import DEFAULT_PAGE_SIZE, get_projected_columns
+from crud.player_catalog import PLAYER_CATALOG_DIR, PlayerColumns, normalize_name, open_player_catalog
+
+PLAYER_COLUMNS = [column.key for column in Player.__table__.columns]
+# Players changed since the shared generation was mapped, after which the next generation is mapped instead
+PLAYER_CATALOG_MAX_CHANGES = int(os.getenv("PLAYER_CATALOG_MAX_CHANGES", "5000"))
+
+# Shared by the lookups of values that have no players, never changed
+EMPTY = ChunkedBitmap()
+
+# In-memory index of the player catalog used to answer /players_filtered/ without the database.
+# Each filter value keeps a compressed bitmap of player ids (crud/bitmaps.py), so a query is an
+# intersection of bitmaps followed by a cut on the sorted market value array.
+# With PLAYER_CATALOG_DIR the rows are not held here but read from the shared columnar catalog
+# (crud/player_catalog.py); only the players changed since its generation are kept, over it.
+class PlayerIndex:
+    def __init__(self):
+        self.ready = False
+        # Loads and refreshes read the database, they run one at a time so an older read never wins
+        self.lock = asyncio.Lock()
+        # Pending move to a newer generation of the shared catalog
+        self.remap: Optional[asyncio.Task] = None
+        # Changes made by this worker while a load reads the database, applied again over the loaded index.
+        # Their notifications are skipped by the listener, nothing else would bring them back.
+        self.writes: Optional[List[Tuple[Callable, tuple]]] = None
+        self.clear()
+
+    def clear(self, columns: Optional[PlayerColumns] = None):
+        self.columns = columns
+        # Players of the columns removed or replaced since, and the rows added or replacing them
+        self.hidden: Set[int] = set()
+        self.players: Dict[int, dict] = {}
+        self.search_names: Dict[int, str] = {}
+        self.all_players = ChunkedBitmap()
+        self.by_nationality: Dict[int, ChunkedBitmap] = {}
+        self.by_team: Dict[int, ChunkedBitmap] = {}
+        self.by_position: Dict[str, ChunkedBitmap] = {}
+        self.by_alternate_position: Dict[str, ChunkedBitmap] = {}
+        self.competition_teams: Dict[int, Set[int]] = {}
+        self.market_values: List[Tuple[float, int]] = []
+
+    # Build the whole index from the database, or from the current generation of the shared catalog
+    async def load(self, db: AsyncSession):
+        async with self.lock:
+            self.writes = []
+            try:
+                columns = await open_player_catalog() if PLAYER_CATALOG_DIR else None
+                players = (await db.execute(select(*Player.__table__.columns))).mappings().all() if columns is None else []
+                team_competitions = (await db.execute(select(TeamCompetition))).scalars().all()
+                writes, self.writes = self.writes, None
+
+                self.clear(columns)
+                if columns is not None:
+                    self._index_columns(columns)
+                for player in players:
+                    self.add_player(player)
+                for team_competition in team_competitions:
+                    self.add_team_competition(team_competition.team_id, team_competition.competition_id)
+                # Already in what was read or not, applying them again gives the same result
+                for write, args in writes:
+                    write(*args)
+                self.ready = True
+            finally:
+                self.writes = None
+
+    # Bitmaps of the players of a generation, built from its columns in one pass
+    def _index_columns(self, columns: PlayerColumns):
+        groups = [(self.by_nationality, columns.nationality_ids, None), (self.by_team, columns.team_ids, None),
+                  (self.by_position, columns.positions, columns.codes), (self.by_alternate_position, columns.alternate_positions, columns.codes)]
+        for bitmaps, values, codes in groups:
+            grouped: Dict[int, List[int]] = {}
+            for player_id, value in zip(columns.ids, values):
+                grouped.setdefault(value, []).append(player_id)
+            for value, ids in grouped.items():
+                # -1 and code 0 stand for NULL
+                key = codes[value] if codes is not None else value
+                if key is not None and key != -1:
+                    bitmaps[key] = ChunkedBitmap.from_ids(ids)
+        self.all_players = ChunkedBitmap.from_ids(columns.ids)
+
+    # Read some players again after a write that did not go through add_player/remove_player
+    async def refresh_players(self, db: AsyncSession, player_ids: List[int]):
+        async with self.lock:
+            if not self.ready or not player_ids:
+                return
+            players = (await db.execute(select(*Player.__table__.columns).where(Player.id.in_(player_ids)))).mappings().all()
+            for player_id in player_ids:
+                self.remove_player(player_id)
+            for player in players:
+                self.add_player(player)
+
+    # The same for team-competition links, given as (team_id, competition_id) pairs
+    async def refresh_team_competitions(self, db: AsyncSession, keys: List[Tuple[int, int]]):
+        async with self.lock:
+            if not self.ready or not keys:
+                return
+            keys = [tuple(key) for key in keys]
+            result = await db.execute(select(TeamCompetition.team_id, TeamCompetition.competition_id)
+                                      .where(tuple_(TeamCompetition.team_id, TeamCompetition.competition_id).in_(keys)))
+            existing = set(tuple(row) for row in result)
+            for team_id, competition_id in keys:
+                if (team_id, competition_id) in existing:
+                    self.add_team_competition(team_id, competition_id)
+                else:
+                    self.remove_team_competition(team_id, competition_id)
+
+    # Add or replace a player, given as a row (mapping of the player columns)
+    def add_player(self, player: Mapping):
+        row = {column: player[column] for column in PLAYER_COLUMNS}
+        player_id = row["id"]
+        self.remove_player(player_id)
+        self._record(self.add_player, player)
+
+        self.players[player_id] = row
+        self.search_names[player_id] = normalize_name(row["name"])
+        self.all_players.add(player_id)
+        self._set_bit(self.by_nationality, row["nationality_id"], player_id)
+        self._set_bit(self.by_team, row["team_id"], player_id)
+        self._set_bit(self.by_position, row["position"], player_id)
+        self._set_bit(self.by_alternate_position, row["alternate_position"], player_id)
+        insort(self.market_values, (row["market_value"], player_id))
+        self._check_changes()
+
+    # Remove a player if it is indexed
+    def remove_player(self, player_id: int):
+        self._record(self.remove_player, player_id)
+        row = self.players.pop(player_id, None)
+        if row is not None:
+            del self.search_names[player_id]
+        else:
+            position = self._column_position(player_id)
+            if position is None:
+                return
+            self.hidden.add(player_id)
+            row = self.columns.row(position)
+
+        self.all_players.discard(player_id)
+        self._clear_bit(self.by_nationality, row["nationality_id"], player_id)
+        self._clear_bit(self.by_team, row["team_id"], player_id)
+        self._clear_bit(self.by_position, row["position"], player_id)
+        self._clear_bit(self.by_alternate_position, row["alternate_position"], player_id)
+        position = bisect_left(self.market_values, (row["market_value"], player_id))
+        if position < len(self.market_values) and self.market_values[position][1] == player_id:
+            del self.market_values[position]
+        self._check_changes()
+
+    # Too many players held over the shared catalog: map its current generation instead, in the background
+    def _check_changes(self):
+        if self.columns is None or self.remap is not None or len(self.players) + len(self.hidden) <= PLAYER_CATALOG_MAX_CHANGES:
+            return
+        self.remap = asyncio.get_running_loop().create_task(self._remap())
+
+    async def _remap(self):
+        try:
+            await _refresh("player", None)
+        finally:
+            self.remap = None
+
+    def add_team_competition(self, team_id: int, competition_id: int):
+        self._record(self.add_team_competition, team_id, competition_id)
+        self.competition_teams.setdefault(competition_id, set()).add(team_id)
+
+    def remove_team_competition(self, team_id: int, competition_id: int):
+        self._record(self.remove_team_competition, team_id, competition_id)
+        self.competition_teams.get(competition_id, set()).discard(team_id)
+
+    # Same filters as get_players_with_filters, returned as a keyset page
+    def get_page(self, nation: Optional[int] = None, name: Optional[str] = None, team: Optional[int] = None,
+                 competition: Optional[int] = None, market_value: Optional[float] = None, position: Optional[str] = None,
+                 after_id: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                 fields: Optional[str] = None) -> Tuple[List[dict], Optional[int]]:
+        columns = [column.key for column in get_projected_columns(Player, fields)] or PLAYER_COLUMNS
+        bitmap = self._filter_bitmap(nation, team, competition, market_value, position)
+
+        search_name = normalize_name(name) if name is not None else None
+        rows = []
+        for player_id in bitmap.iter_from(after_id + 1 if after_id is not None else 0):
+            row = self.players.get(player_id)
+            position = self.columns.find(player_id) if row is None else None
+            # Names have no bitmap, they are checked only on the candidates
+            if search_name is not None:
+                candidate = self.search_names[player_id] if row is not None else self.columns.search_name(position)
+                if search_name not in candidate:
+                    continue
+            rows.append(row if row is not None else self.columns.row(position))
+            if len(rows) > limit:
+                break
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1]["id"]
+        return [{column: row[column] for column in columns} for row in rows], next_cursor
+
+    def _filter_bitmap(self, nation, team, competition, market_value, position) -> ChunkedBitmap:
+        bitmap = self.all_players
+        if nation is not None:
+            bitmap &= self.by_nationality.get(nation, EMPTY)
+        if team is not None:
+            bitmap &= self.by_team.get(team, EMPTY)
+        if competition is not None:
+            competition_bitmap = EMPTY
+            for team_id in self.competition_teams.get(competition, ()):
+                competition_bitmap |= self.by_team.get(team_id, EMPTY)
+            bitmap &= competition_bitmap
+        if position is not None:
+            # Primary position must match exactly, alternate position only has to contain it
+            position_bitmap = self.by_position.get(position, EMPTY)
+            for alternate_position, alternate_bitmap in self.by_alternate_position.items():
+                if position in alternate_position:
+                    position_bitmap |= alternate_bitmap
+            bitmap &= position_bitmap
+        if market_value is not None:
+            bitmap &= self._market_value_bitmap(bitmap, market_value)
+        return bitmap
+
+    # Players with a market value strictly below the given one
+    def _market_value_bitmap(self, candidates: ChunkedBitmap, market_value: float) -> ChunkedBitmap:
+        cut = bisect_left(self.market_values, (market_value, 0))
+        column_cut = 0
+        if self.columns is not None:
+            values = self.columns.market_values
+            column_cut = bisect_left(self.columns.by_market_value, market_value, key=lambda position: values[position])
+        if cut + column_cut <= len(candidates):
+            ids = [player_id for _, player_id in self.market_values[:cut]]
+            if column_cut:
+                column_ids = self.columns.ids
+                ids += [column_ids[position] for position in self.columns.by_market_value[:column_cut]
+                        if column_ids[position] not in self.hidden]
+            return ChunkedBitmap.from_ids(ids)
+
+        # Fewer candidates than players under the cut: check their values directly
+        return ChunkedBitmap.from_ids(player_id for player_id in candidates
+                                      if self._market_value(player_id) < market_value)
+
+    def _market_value(self, player_id: int) -> float:
+        row = self.players.get(player_id)
+        return row["market_value"] if row is not None else self.columns.market_values[self.columns.find(player_id)]
+
+    # Position of a player in the shared columns, None when it is not there or no longer current
+    def _column_position(self, player_id: int) -> Optional[int]:
+        if self.columns is None or player_id in self.hidden:
+            return None
+        return self.columns.find(player_id)
+
+    def _record(self, write: Callable, *args):
+        if self.writes is not None:
+            self.writes.append((write, args))
+
+    @staticmethod
+    def _set_bit(bitmaps: dict, key, player_id: int):
+        if key is not None:
+            bitmaps.setdefault(key, ChunkedBitmap()).add(player_id)
+
+    @staticmethod
+    def _clear_bit(bitmaps: dict, key, player_id: int):
+        if key in bitmaps:
+            bitmaps[key].discard(player_id)
+            if not bitmaps[key]:
+                del bitmaps[key]
+
+player_index = PlayerIndex()
+
+# Writes of the other workers, received through the invalidation bus
+async def _refresh(table: str, keys: Optional[List[Any]]):
+    try:
+        async with SessionLocal() as db:
+            if keys is None:
+                await player_index.load(db)
+            elif table == "player":
+                await player_index.refresh_players(db, keys)
+            else:
+                await player_index.refresh_team_competitions(db, keys)
+    except (SQLAlchemyError, OSError):
+        player_index.ready = False
+
+subscribe("player", lambda keys: _refresh("player", keys))
+subscribe("team_competition", lambda keys: _refresh("team_competition", keys))
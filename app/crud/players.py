@@ -1,16 +1,23 @@
-from sqlalchemy import and_, or_
+from sqlalchemy import Select, and_, func, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from fastapi import HTTPException
 from sqlalchemy.exc import SQLAlchemyError
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from models.models import Player, PlayerCreate, TeamCompetition
+from crud.pagination import DEFAULT_PAGE_SIZE, get_page
+from crud.catalog import log_changes
+from crud.player_index import player_index
+from crud.writes import delete_row, insert_row, update_row
+from core.cache import reference_cache
+from core.invalidation import publish
+from core.metrics import record_cache
 
 # Get all players
-async def get_players(db: AsyncSession) -> List[Player]:
+async def get_players(db: AsyncSession, after_id: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                      fields: Optional[str] = None, as_rows: bool = False) -> Tuple[List[Player], Optional[int]]:
     try:
-        result = await db.execute(select(Player))
-        return result.scalars().all()
+        return await get_page(db, select(Player), Player, after_id, limit, fields, as_rows)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -28,17 +35,19 @@ async def get_player_by_id(db: AsyncSession, player_id: int) -> Player:
 # Create a new player
 async def create_player(db: AsyncSession, new_player: PlayerCreate) -> Dict[str, int]:
     try:
-        player = Player(
-            name=new_player.name, 
-            team_id=new_player.team_id, 
-            nationality_id=new_player.nationality_id, 
-            market_value=new_player.market_value,
-            position=new_player.position, 
-            alternate_position=new_player.alternate_position
-        )
-        db.add(player)
+        player = await insert_row(db, Player, {
+            "name": new_player.name,
+            "team_id": new_player.team_id,
+            "nationality_id": new_player.nationality_id,
+            "market_value": new_player.market_value,
+            "position": new_player.position,
+            "alternate_position": new_player.alternate_position
+        })
+        await log_changes(db, "player", [player["id"]])
+        await publish(db, "player", [player["id"]])
         await db.commit()
-        await db.refresh(player)
+        reference_cache.invalidate("player")
+        player_index.add_player(player)
         return player
     except SQLAlchemyError as e:
         await db.rollback()
@@ -47,20 +56,19 @@ async def create_player(db: AsyncSession, new_player: PlayerCreate) -> Dict[str,
 # Update an existing player
 async def update_player(db: AsyncSession, updated_player: PlayerCreate, player_id: int) -> None:
     try:
-        player = await get_player_by_id(db, player_id)
-        if player is None:
-            raise HTTPException(status_code=404, detail="Not found player")
-
-        player.name = updated_player.name
-        player.team_id = updated_player.team_id
-        player.nationality_id = updated_player.nationality_id
-        player.market_value = updated_player.market_value
-        player.position = updated_player.position
-        player.alternate_position = updated_player.alternate_position
-
+        player = await update_row(db, Player, Player.id == player_id, {
+            "name": updated_player.name,
+            "team_id": updated_player.team_id,
+            "nationality_id": updated_player.nationality_id,
+            "market_value": updated_player.market_value,
+            "position": updated_player.position,
+            "alternate_position": updated_player.alternate_position
+        }, "Not found player")
+        await log_changes(db, "player", [player_id])
+        await publish(db, "player", [player_id])
         await db.commit()
-        
-        await db.refresh(player)
+        reference_cache.invalidate("player")
+        player_index.add_player(player)
         return player
     except SQLAlchemyError as e:
         await db.rollback()
@@ -69,12 +77,12 @@ async def update_player(db: AsyncSession, updated_player: PlayerCreate, player_i
 # Delete a player
 async def delete_player(db: AsyncSession, player_id: int) -> None:
     try:
-        player = await get_player_by_id(db, player_id)
-        if player is None:
-            raise HTTPException(status_code=404, detail="Not found player")
-
-        await db.delete(player)
+        await delete_row(db, Player, Player.id == player_id, "Not found player")
+        await log_changes(db, "player", [player_id])
+        await publish(db, "player", [player_id])
         await db.commit()
+        reference_cache.invalidate("player")
+        player_index.remove_player(player_id)
         return {"detail": "Player with id " + str(player_id) + " deleted successfully"}
     except SQLAlchemyError as e:
         await db.rollback()
@@ -88,17 +96,38 @@ async def get_players_with_filters(
     team: Optional[int] = None, 
     competition: Optional[int] = None,
     market_value: Optional[float] = None,
-    position: Optional[str] = None
-) -> List[Player]:
+    position: Optional[str] = None,
+    after_id: Optional[int] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    fields: Optional[str] = None,
+    as_rows: bool = False
+) -> Tuple[List[Player], Optional[int]]:
+    # Serve from the in-memory index once it has been loaded. Until then, or after a failed load or refresh,
+    # the filters keep running on the database.
+    record_cache("player_index", player_index.ready)
+    if player_index.ready:
+        return player_index.get_page(nation, name, team, competition, market_value, position, after_id, limit, fields)
+
+    query = filter_players_query(nation, name, team, competition, market_value, position)
+    try:
+        # Execute the query as a keyset page
+        return await get_page(db, query, Player, after_id, limit, fields, as_rows)
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Query of the players matching the filters (shared by the paged list and the export)
+def filter_players_query(nation: Optional[int] = None, name: Optional[str] = None, team: Optional[int] = None,
+                         competition: Optional[int] = None, market_value: Optional[float] = None,
+                         position: Optional[str] = None) -> Select:
     # Start the base query
     query = select(Player)
     
     # List of dynamic conditions
     conditions = []
     
-    # Filter by name (ilike for case-insensitive search)
+    # Filter by name (case and accent insensitive, served by idx_player_name_trgm)
     if name is not None:
-        conditions.append(Player.name.ilike(f"%{name}%"))
+        conditions.append(func.f_unaccent(Player.name).ilike(func.f_unaccent(f"%{name}%")))
     
     # Filter by nationality
     if nation is not None:
@@ -127,11 +156,21 @@ async def get_players_with_filters(
     # Apply all dynamic conditions
     if conditions:
         query = query.where(and_(*conditions))
-    
+    return query
+
+# Search players by name for autocomplete, best matches first
+async def search_players(db: AsyncSession, q: str, limit: int = 10) -> List[Player]:
+    name = func.f_unaccent(Player.name)
+    term = func.f_unaccent(q)
+    # Substring matches plus fuzzy word matches (pg_trgm "<%"), both served by idx_player_name_trgm
+    query = (
+        select(Player)
+        .where(or_(name.ilike(func.f_unaccent(f"%{q}%")), term.op("<%")(name)))
+        .order_by(func.word_similarity(term, name).desc(), func.length(Player.name), Player.id)
+        .limit(limit)
+    )
     try:
-        # Execute the query
         result = await db.execute(query)
-        players = result.scalars().all()
-        return players
+        return result.scalars().all()
     except SQLAlchemyError as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,15 +1,38 @@
+from sqlalchemy import Float, cast, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from fastapi import HTTPException
 from sqlalchemy.exc import SQLAlchemyError
-from typing import List, Dict
-from models.models import Rating, RatingCreate
+from typing import List, Dict, Optional, Tuple
+from models.models import Rating, RatingCreate, Squad
+from crud.pagination import DEFAULT_PAGE_SIZE, get_page
+from crud.writes import delete_row, insert_row, update_row
+
+# Bayesian prior of the squad rating score: every squad starts as if it had RATING_PRIOR_COUNT ratings of RATING_PRIOR_MEAN
+RATING_PRIOR_COUNT = 5
+RATING_PRIOR_MEAN = 3
+
+# Add ratings to the aggregates of a squad (negative values take them out), inside the caller's transaction
+async def update_squad_rating(db: AsyncSession, squad_id: Optional[int], count: int, total: float) -> None:
+    if squad_id is None or (count == 0 and total == 0):
+        return
+    await db.execute(
+        update(Squad)
+        .where(Squad.id == squad_id)
+        .values(
+            rating_count=Squad.rating_count + count,
+            rating_sum=Squad.rating_sum + total,
+            rating_score=cast(RATING_PRIOR_COUNT * RATING_PRIOR_MEAN + Squad.rating_sum + total, Float)
+            / (RATING_PRIOR_COUNT + Squad.rating_count + count),
+        )
+        .execution_options(synchronize_session=False)
+    )
 
 # Get all ratings
-async def get_ratings(db: AsyncSession) -> List[Rating]:
+async def get_ratings(db: AsyncSession, after_id: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                      fields: Optional[str] = None, as_rows: bool = False) -> Tuple[List[Rating], Optional[int]]:
     try:
-        result = await db.execute(select(Rating))
-        return result.scalars().all()
+        return await get_page(db, select(Rating), Rating, after_id, limit, fields, as_rows)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -24,18 +47,24 @@ async def get_rating_by_id(db: AsyncSession, rating_id: int) -> Rating:
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Get a rating written by a user, 403 when another user wrote it
+async def get_owned_rating(db: AsyncSession, rating_id: int, user_id: int) -> Rating:
+    rating = await get_rating_by_id(db, rating_id)
+    if rating.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Only the author can change this rating")
+    return rating
+
 # Create a new rating
 async def create_rating(db: AsyncSession, new_rating: RatingCreate) -> Dict[str, int]:
     try:
-        rating = Rating(
-            rating=new_rating.rating, 
-            comment=new_rating.comment, 
-            squad_id=new_rating.squad_id, 
-            user_id=new_rating.user_id
-        )
-        db.add(rating)
+        rating = await insert_row(db, Rating, {
+            "rating": new_rating.rating,
+            "comment": new_rating.comment,
+            "squad_id": new_rating.squad_id,
+            "user_id": new_rating.user_id
+        })
+        await update_squad_rating(db, rating["squad_id"], 1, rating["rating"])
         await db.commit()
-        await db.refresh(rating)
         return rating
     except SQLAlchemyError as e:
         await db.rollback()
@@ -44,18 +73,27 @@ async def create_rating(db: AsyncSession, new_rating: RatingCreate) -> Dict[str,
 # Update an existing rating
 async def update_rating(db: AsyncSession, updated_rating: RatingCreate, rating_id: int) -> None:
     try:
-        rating = await get_rating_by_id(db, rating_id)
-        if rating is None:
+        # The old value is read under a row lock, so concurrent updates cannot both take it out of the aggregates
+        result = await db.execute(select(Rating.squad_id, Rating.rating).where(Rating.id == rating_id).with_for_update())
+        old = result.one_or_none()
+        if old is None:
             raise HTTPException(status_code=404, detail="Not found rating")
 
-        rating.rating = updated_rating.rating
-        rating.comment = updated_rating.comment
-        rating.squad_id = updated_rating.squad_id
-        rating.user_id = updated_rating.user_id
+        rating = await update_row(db, Rating, Rating.id == rating_id, {
+            "rating": updated_rating.rating,
+            "comment": updated_rating.comment,
+            "squad_id": updated_rating.squad_id,
+            "user_id": updated_rating.user_id
+        }, "Not found rating")
 
-        await db.commit()
+        # Move the old value out of the aggregates and the new one in
+        if old.squad_id == rating["squad_id"]:
+            await update_squad_rating(db, old.squad_id, 0, rating["rating"] - old.rating)
+        else:
+            await update_squad_rating(db, old.squad_id, -1, -old.rating)
+            await update_squad_rating(db, rating["squad_id"], 1, rating["rating"])
 
-        await db.refresh(rating)
+        await db.commit()
         return rating
     except SQLAlchemyError as e:
         await db.rollback()
@@ -64,12 +102,8 @@ async def update_rating(db: AsyncSession, updated_rating: RatingCreate, rating_i
 # Delete a rating
 async def delete_rating(db: AsyncSession, rating_id: int) -> None:
     try:
-        result = await get_rating_by_id(db, rating_id)
-        rating = result.scalar_one_or_none()
-        if rating is None:
-            raise HTTPException(status_code=404, detail="Not found rating")
-
-        await db.delete(rating)
+        rating = await delete_row(db, Rating, Rating.id == rating_id, "Not found rating")
+        await update_squad_rating(db, rating["squad_id"], -1, -rating["rating"])
         await db.commit()
         return {"detail": "Rating with id " + str(rating_id) + " deleted successfully"}
     except SQLAlchemyError as e:
@@ -78,9 +112,9 @@ async def delete_rating(db: AsyncSession, rating_id: int) -> None:
 
 # Other gets
 # Get ratings for a squad
-async def get_rating_for_squad(db: AsyncSession, squad_id: int) -> Rating:
+async def get_rating_for_squad(db: AsyncSession, squad_id: int, after_id: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                               fields: Optional[str] = None, as_rows: bool = False) -> Tuple[List[Rating], Optional[int]]:
     try:
-        result = await db.execute(select(Rating).where(Rating.squad_id == squad_id))
-        return result.scalars().all()
+        return await get_page(db, select(Rating).where(Rating.squad_id == squad_id), Rating, after_id, limit, fields, as_rows)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -1,15 +1,24 @@
+from sqlalchemy import delete, insert, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from fastapi import HTTPException
-from sqlalchemy.exc import SQLAlchemyError
-from typing import List, Dict
-from models.models import SquadPlayer, SquadPlayerCreate
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from typing import List, Dict, Optional, Tuple
+from models.models import Squad, SquadLineupPlayer, SquadPlayer, SquadPlayerCreate
+from crud.pagination import DEFAULT_PAGE_SIZE, get_page
+from crud.writes import delete_row, insert_row, update_row
+
+DUPLICATE_PLAYER = "A player can only be once in a squad"
+
+# Unique violation of (squad_id, player_id): the player is already in the squad
+def _is_duplicate(e: IntegrityError) -> bool:
+    return getattr(e.orig, "sqlstate", None) == "23505" or "UNIQUE constraint failed" in str(e.orig)
 
 # Get all squad players
-async def get_squad_players(db: AsyncSession) -> List[SquadPlayer]:
+async def get_squad_players(db: AsyncSession, after_id: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                            fields: Optional[str] = None, as_rows: bool = False) -> Tuple[List[SquadPlayer], Optional[int]]:
     try:
-        result = await db.execute(select(SquadPlayer))
-        return result.scalars().all()
+        return await get_page(db, select(SquadPlayer), SquadPlayer, after_id, limit, fields, as_rows)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -27,11 +36,14 @@ async def get_squad_player_by_id(db: AsyncSession, squad_player_id: int) -> Squa
 # Create a squad player
 async def create_squad_player(db: AsyncSession, new_squad: SquadPlayerCreate) -> Dict[str, int]:
     try:
-        squad_player = SquadPlayer(squad_id=new_squad.squad_id, player_id=new_squad.player_id, position=new_squad.position)
-        db.add(squad_player)
+        squad_player = await insert_row(db, SquadPlayer, {"squad_id": new_squad.squad_id, "player_id": new_squad.player_id, "position": new_squad.position})
         await db.commit()
-        await db.refresh(squad_player)
         return squad_player
+    except IntegrityError as e:
+        await db.rollback()
+        if _is_duplicate(e):
+            raise HTTPException(status_code=400, detail=DUPLICATE_PLAYER)
+        raise HTTPException(status_code=500, detail=str(e))
     except SQLAlchemyError as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
@@ -39,18 +51,18 @@ async def create_squad_player(db: AsyncSession, new_squad: SquadPlayerCreate) ->
 # Update a squad player
 async def update_squad_player(db: AsyncSession, updated_squad_player: SquadPlayerCreate, squad_player_id: int) -> None:
     try:
-        squad_player = await get_squad_player_by_id(db, squad_player_id)
-        if squad_player is None:
-            raise HTTPException(status_code=404, detail="Not found player-squad")
-
-        squad_player.squad_id = updated_squad_player.squad_id
-        squad_player.player_id = updated_squad_player.player_id
-        squad_player.position = updated_squad_player.position
-
+        squad_player = await update_row(db, SquadPlayer, SquadPlayer.id == squad_player_id, {
+            "squad_id": updated_squad_player.squad_id,
+            "player_id": updated_squad_player.player_id,
+            "position": updated_squad_player.position
+        }, "Not found player-squad")
         await db.commit()
-        
-        await db.refresh(squad_player)
         return squad_player
+    except IntegrityError as e:
+        await db.rollback()
+        if _is_duplicate(e):
+            raise HTTPException(status_code=400, detail=DUPLICATE_PLAYER)
+        raise HTTPException(status_code=500, detail="Could not update player-squad: " + str(e))
     except SQLAlchemyError as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail="Could not update player-squad: " + str(e))
@@ -58,11 +70,7 @@ async def update_squad_player(db: AsyncSession, updated_squad_player: SquadPlaye
 # Delete a squad player
 async def delete_squad_player(db: AsyncSession, squad_player_id: int) -> None:
     try:
-        squad_player = await get_squad_player_by_id(db, squad_player_id)
-        if squad_player is None:
-            raise HTTPException(status_code=404, detail="Not found player-squad")
-
-        await db.delete(squad_player)
+        await delete_row(db, SquadPlayer, SquadPlayer.id == squad_player_id, "Not found player-squad")
         await db.commit()
         return {"detail": "Squad-player with id " + str(squad_player_id) + " deleted successfully"}
     except SQLAlchemyError as e:
@@ -75,4 +83,42 @@ async def get_squad_player_by_squad_id(db: AsyncSession, squad_id: int) -> Squad
         result = await db.execute(select(SquadPlayer).where(SquadPlayer.squad_id == squad_id))
         return result.scalars().all()
     except SQLAlchemyError as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Replace the lineup of a squad: one diff against the saved rows applied in a single transaction.
+# The squad row is locked first, so two saves of the same lineup run one after the other instead of
+# both diffing against the same rows.
+async def set_squad_lineup(db: AsyncSession, squad_id: int, lineup: List[SquadLineupPlayer]) -> List[SquadPlayer]:
+    desired = {player.player_id: player.position for player in lineup}
+    if len(desired) != len(lineup):
+        raise HTTPException(status_code=400, detail=DUPLICATE_PLAYER)
+
+    try:
+        await db.execute(select(Squad.id).where(Squad.id == squad_id).with_for_update())
+        result = await db.execute(select(SquadPlayer.id, SquadPlayer.player_id, SquadPlayer.position).where(SquadPlayer.squad_id == squad_id))
+        saved = {row.player_id: row for row in result}
+
+        removed = [row.id for player_id, row in saved.items() if player_id not in desired]
+        moved = [{"id": saved[player_id].id, "position": position} for player_id, position in desired.items()
+                 if player_id in saved and saved[player_id].position != position]
+        added = [{"squad_id": squad_id, "player_id": player_id, "position": position} for player_id, position in desired.items()
+                 if player_id not in saved]
+
+        if removed:
+            await db.execute(delete(SquadPlayer).where(SquadPlayer.id.in_(removed)))
+        if moved:
+            await db.execute(update(SquadPlayer), moved)
+        if added:
+            await db.execute(insert(SquadPlayer), added)
+        await db.commit()
+
+        result = await db.execute(select(SquadPlayer).where(SquadPlayer.squad_id == squad_id).order_by(SquadPlayer.id))
+        return result.scalars().all()
+    except IntegrityError as e:
+        await db.rollback()
+        if _is_duplicate(e):
+            raise HTTPException(status_code=400, detail=DUPLICATE_PLAYER)
+        raise HTTPException(status_code=500, detail="Could not save squad lineup: " + str(e))
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail="Could not save squad lineup: " + str(e))
@@ -0,0 +1,205 @@
+import heapq
+import os
+from bisect import bisect_left
+from itertools import groupby, islice
+from math import gcd
+from operator import itemgetter
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from fastapi import HTTPException
+from sqlalchemy.exc import SQLAlchemyError
+from core.executors import BoundedExecutor
+from models.models import Formation, Player, PositionEnum, SolveObjectiveEnum, TeamCompetition
+from crud.squads import get_squad_by_id
+from crud.formations import get_formation_by_id
+
+# Positions of the eleven for the usual formations
+FORMATION_SLOTS = {
+    "4-4-2": ["GK", "LB", "CB", "CB", "RB", "LM", "CM", "CM", "RM", "ST", "ST"],
+    "4-3-3": ["GK", "LB", "CB", "CB", "RB", "CM", "CM", "CM", "LW", "ST", "RW"],
+    "4-2-3-1": ["GK", "LB", "CB", "CB", "RB", "CDM", "CDM", "LM", "CAM", "RM", "ST"],
+    "4-5-1": ["GK", "LB", "CB", "CB", "RB", "LM", "CM", "CDM", "CM", "RM", "ST"],
+    "3-5-2": ["GK", "CB", "CB", "CB", "LM", "CDM", "CM", "CM", "RM", "ST", "ST"],
+    "3-4-3": ["GK", "CB", "CB", "CB", "LM", "CM", "CM", "RM", "LW", "ST", "RW"],
+    "5-3-2": ["GK", "LB", "CB", "CB", "CB", "RB", "CM", "CM", "CM", "ST", "ST"],
+}
+
+# The search stops after this many seconds and returns the best lineup found so far
+SOLVER_TIME_LIMIT = float(os.getenv("SOLVER_TIME_LIMIT", "0.5"))
+# Searches run on their own threads, off the event loop. They are pure Python and hold the GIL, so a few are enough.
+SOLVER_POOL_SIZE = int(os.getenv("SOLVER_POOL_SIZE", "2"))
+# Solves allowed running or waiting at once, over this requests get a 503 instead of queueing
+SOLVER_MAX_PENDING = int(os.getenv("SOLVER_MAX_PENDING", str(SOLVER_POOL_SIZE * 2)))
+
+_executor = BoundedExecutor("solver", SOLVER_POOL_SIZE, SOLVER_MAX_PENDING, "Too many squads being solved, try again later")
+
+# Slots of a formation: an explicit comma separated list of positions in the description, or a known name
+def get_formation_slots(formation: Formation) -> List[str]:
+    positions = {position.value for position in PositionEnum}
+    if formation.description:
+        slots = [slot.strip().upper() for slot in formation.description.split(",")]
+        if len(slots) > 1 and all(slot in positions for slot in slots):
+            return slots
+
+    slots = FORMATION_SLOTS.get(formation.name.strip())
+    if slots is None:
+        raise HTTPException(status_code=400, detail="Unknown positions for formation " + formation.name)
+    return slots
+
+# Same rule as the position filter of get_players_with_filters
+def can_play(player: dict, position: str) -> bool:
+    return player["position"] == position or (player["alternate_position"] is not None and position in player["alternate_position"])
+
+# Best set of distinct players for the slots (branch and bound).
+# Players are dicts with id, cost (integer cents), position and alternate_position.
+# Returns the player id chosen for every slot (in slot order), the total cost and if the search finished.
+def find_best_lineup(slots: List[str], players: List[dict], budget: Optional[int], maximize: bool = True,
+                     time_limit: float = SOLVER_TIME_LIMIT) -> Tuple[Optional[List[int]], int, bool]:
+    # The limit covers the preparation of the candidates too
+    deadline = perf_counter() + time_limit
+    # Candidates are (key, id) tuples with key = -score, so ascending order is best first.
+    # The score is the cost when maximizing and minus the cost when minimizing.
+    sign = 1 if maximize else -1
+    eligible: Dict[str, List[Tuple[int, int]]] = {position: [] for position in slots}
+    targets: Dict[Tuple[str, Optional[str]], List[str]] = {}
+    for player in players:
+        if budget is not None and player["cost"] > budget:
+            continue
+        key = (player["position"], player["alternate_position"])
+        if key not in targets:
+            targets[key] = [position for position in eligible if can_play(player, position)]
+        for position in targets[key]:
+            eligible[position].append((-sign * player["cost"], player["id"]))
+
+    # A lineup uses at most len(slots) players, so only the len(slots) best of a position matter when
+    # minimizing or without a budget, and only len(slots) players of each cost when maximizing under a budget.
+    candidates: Dict[str, List[Tuple[int, int]]] = {}
+    for position, position_players in eligible.items():
+        if maximize and budget is not None:
+            position_players.sort()
+            candidates[position] = [player for _, group in groupby(position_players, key=itemgetter(0))
+                                    for player in islice(group, len(slots))]
+        else:
+            candidates[position] = heapq.nsmallest(len(slots), position_players)
+
+    # Most constrained positions first, equal positions next to each other to skip symmetric lineups
+    order = sorted(range(len(slots)), key=lambda index: (len(candidates[slots[index]]), slots[index]))
+    slot_candidates = [candidates[slots[index]] for index in order]
+    if any(not slot_list for slot_list in slot_candidates):
+        return None, 0, True
+
+    # Keys sorted ascending are -cost when maximizing, which lets us bisect the affordable players
+    keys = {position: [key for key, _ in slot_list] for position, slot_list in candidates.items()} if maximize else {}
+    slot_keys = [keys.get(slots[index]) for index in order]
+    cheapest = [min(abs(slot_list[0][0]), abs(slot_list[-1][0])) for slot_list in slot_candidates]
+    best_score = [-slot_list[0][0] for slot_list in slot_candidates]
+    min_cost_from = [sum(cheapest[index:]) for index in range(len(slots) + 1)]
+    best_score_from = [sum(best_score[index:]) for index in range(len(slots) + 1)]
+    if budget is None:
+        budget = sum(max(abs(slot_list[0][0]), abs(slot_list[-1][0])) for slot_list in slot_candidates)
+    # Every total is a multiple of the costs' gcd, which tightens the bound on round market values
+    step = gcd(*{abs(key) for slot_list in candidates.values() for key, _ in slot_list}) or 1
+
+    state = {"best": None, "lineup": None, "nodes": 0, "timed_out": False}
+    chosen, chosen_index, used = [None] * len(slots), [-1] * len(slots), set()
+
+    def search(depth: int, spent: int, score: int):
+        if depth == len(slots):
+            if state["best"] is None or score > state["best"]:
+                state["best"], state["lineup"] = score, list(chosen)
+            return
+
+        remaining = budget - spent
+        # Upper bound: best player of every remaining slot, and never more than the budget when maximizing cost
+        bound = min(remaining // step * step, best_score_from[depth]) if maximize else best_score_from[depth]
+        max_cost = remaining - min_cost_from[depth + 1]
+        slot_list = slot_candidates[depth]
+
+        start = bisect_left(slot_keys[depth], -max_cost) if maximize else 0
+        if depth and slots[order[depth]] == slots[order[depth - 1]]:
+            start = max(start, chosen_index[depth - 1] + 1)
+
+        for index in range(start, len(slot_list)):
+            # Every candidate is counted, those of the last slot too, so the clock is read at a steady pace
+            state["nodes"] += 1
+            if state["nodes"] % 1024 == 0 and perf_counter() > deadline:
+                state["timed_out"] = True
+            if state["timed_out"]:
+                return
+            if state["best"] is not None and score + bound <= state["best"]:
+                return
+            key, player_id = slot_list[index]
+            cost = sign * -key
+            if cost > max_cost:
+                # Minimizing walks the costs upwards, nothing after this one fits
+                return
+            if player_id in used:
+                continue
+
+            used.add(player_id)
+            chosen[depth], chosen_index[depth] = (player_id, cost), index
+            search(depth + 1, spent + cost, score - key)
+            used.discard(player_id)
+            if state["timed_out"]:
+                return
+
+    search(0, 0, 0)
+    if state["lineup"] is None:
+        return None, 0, not state["timed_out"]
+
+    lineup = [None] * len(slots)
+    for depth, slot_index in enumerate(order):
+        lineup[slot_index] = state["lineup"][depth][0]
+    return lineup, sum(cost for _, cost in state["lineup"]), not state["timed_out"]
+
+# Candidate rows of the search (costs in integer cents) and the search itself, run on the solver pool
+def _solve(slots: List[str], rows: List, budget: Optional[int], maximize: bool) -> Tuple[Optional[List[int]], int, bool]:
+    players = [
+        {"id": row.id, "cost": int(round(row.market_value * 100)), "position": row.position, "alternate_position": row.alternate_position}
+        for row in rows
+    ]
+    return find_best_lineup(slots, players, budget, maximize)
+
+# Pick the best players for a squad following its formation, budget, nationality and competition
+async def solve_squad(db: AsyncSession, squad_id: int, objective: SolveObjectiveEnum) -> Dict:
+    squad = await get_squad_by_id(db, squad_id)
+    formation = await get_formation_by_id(db, squad.formation_id)
+    slots = get_formation_slots(formation)
+
+    # Only the columns the search needs, and only players allowed by the squad limits
+    query = select(Player.id, Player.market_value, Player.position, Player.alternate_position)
+    conditions = [or_(Player.position.in_(sorted(set(slots))), Player.alternate_position.isnot(None))]
+    if squad.nationality_id is not None:
+        conditions.append(Player.nationality_id == squad.nationality_id)
+    if squad.competition_id is not None:
+        query = query.join(TeamCompetition, Player.team_id == TeamCompetition.team_id)
+        conditions.append(TeamCompetition.competition_id == squad.competition_id)
+    if squad.budget is not None:
+        conditions.append(Player.market_value <= squad.budget)
+
+    try:
+        rows = (await db.execute(query.where(and_(*conditions)))).all()
+
+        budget = int(round(squad.budget * 100)) if squad.budget is not None else None
+        lineup, cost, optimal = await _executor.run(_solve, slots, rows, budget, objective == SolveObjectiveEnum.MAX_MARKET_VALUE)
+        if lineup is None and not optimal:
+            raise HTTPException(status_code=400, detail="No lineup found within the time limit of the search")
+        if lineup is None:
+            raise HTTPException(status_code=400, detail="No lineup satisfies the limits of this squad")
+
+        result = await db.execute(select(Player).where(Player.id.in_(lineup)))
+        chosen = {player.id: player for player in result.scalars().all()}
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "squad_id": squad_id,
+        "formation": formation.name,
+        "objective": objective,
+        "objective_value": cost / 100,
+        "optimal": optimal,
+        "players": [{"position": slot, "player": chosen[player_id]} for slot, player_id in zip(slots, lineup)],
+    }
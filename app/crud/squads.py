@@ -1,16 +1,19 @@
-from sqlalchemy import and_
+from sqlalchemy import Select, and_, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy.orm import joinedload, selectinload
 from fastapi import HTTPException
 from sqlalchemy.exc import SQLAlchemyError
-from typing import List, Dict, Optional
-from models.models import Squad, SquadCreate
+from typing import List, Dict, Optional, Tuple
+from models.models import Player, Squad, SquadCreate, SquadPlayer
+from crud.pagination import DEFAULT_PAGE_SIZE, get_page
+from crud.writes import delete_row, insert_row, update_row
 
 # Get all squads
-async def get_squads(db: AsyncSession) -> List[Squad]:
+async def get_squads(db: AsyncSession, after_id: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                     fields: Optional[str] = None, as_rows: bool = False) -> Tuple[List[Squad], Optional[int]]:
     try:
-        result = await db.execute(select(Squad))
-        return result.scalars().all()
+        return await get_page(db, select(Squad), Squad, after_id, limit, fields, as_rows)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -25,20 +28,25 @@ async def get_squad_by_id(db: AsyncSession, squad_id: int) -> Squad:
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Get a squad that belongs to a user, 403 when it belongs to another one
+async def get_owned_squad(db: AsyncSession, squad_id: int, user_id: int) -> Squad:
+    squad = await get_squad_by_id(db, squad_id)
+    if squad.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Only the owner can change this squad")
+    return squad
+
 # Create a squad
 async def create_squad(db: AsyncSession, new_squad: SquadCreate) -> Dict[str, int]:
     try:
-        squad = Squad(
-            user_id=new_squad.user_id,
-            formation_id=new_squad.formation_id,
-            name=new_squad.name,
-            competition_id=new_squad.competition_id,
-            budget=new_squad.budget,
-            nationality_id=new_squad.nationality_id
-        )
-        db.add(squad)
+        squad = await insert_row(db, Squad, {
+            "user_id": new_squad.user_id,
+            "formation_id": new_squad.formation_id,
+            "name": new_squad.name,
+            "competition_id": new_squad.competition_id,
+            "budget": new_squad.budget,
+            "nationality_id": new_squad.nationality_id
+        })
         await db.commit()
-        await db.refresh(squad)
         return squad
     except SQLAlchemyError as e:
         await db.rollback()
@@ -47,19 +55,15 @@ async def create_squad(db: AsyncSession, new_squad: SquadCreate) -> Dict[str, in
 # Update a squad
 async def update_squad(db: AsyncSession, updated_squad: SquadCreate, squad_id: int) -> None:
     try:
-        squad = await get_squad_by_id(db, squad_id)
-        if squad is None:
-            raise HTTPException(status_code=404, detail="Not found squad")
-
-        squad.user_id = updated_squad.user_id
-        squad.formation_id = updated_squad.formation_id
-        squad.name = updated_squad.name
-        squad.competition_id = updated_squad.competition_id
-        squad.budget = updated_squad.budget
-        squad.nationality_id = updated_squad.nationality_id
-
+        squad = await update_row(db, Squad, Squad.id == squad_id, {
+            "user_id": updated_squad.user_id,
+            "formation_id": updated_squad.formation_id,
+            "name": updated_squad.name,
+            "competition_id": updated_squad.competition_id,
+            "budget": updated_squad.budget,
+            "nationality_id": updated_squad.nationality_id
+        }, "Not found squad")
         await db.commit()
-        await db.refresh(squad)
         return squad
     except SQLAlchemyError as e:
         await db.rollback()
@@ -68,11 +72,7 @@ async def update_squad(db: AsyncSession, updated_squad: SquadCreate, squad_id: i
 # Delete a squad
 async def delete_squad(db: AsyncSession, squad_id: int) -> None:
     try:
-        squad = await get_squad_by_id(db, squad_id)
-        if squad is None:
-            raise HTTPException(status_code=404, detail="Not found squad")
-
-        await db.delete(squad)
+        await delete_row(db, Squad, Squad.id == squad_id, "Not found squad")
         await db.commit()
         return {"detail": "Squad with id " + str(squad_id) + " deleted successfully"}
     except SQLAlchemyError as e:
@@ -82,7 +82,7 @@ async def delete_squad(db: AsyncSession, squad_id: int) -> None:
 # Get squad by name
 async def get_squad_by_name(db: AsyncSession, name: str) -> Squad:
     try:
-        result = await db.execute(select(Squad).where(Squad.name.ilike(f"%{name}%")))
+        result = await db.execute(select(Squad).where(func.f_unaccent(Squad.name).ilike(func.f_unaccent(f"%{name}%"))))
         return result.scalars().all()
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -96,7 +96,18 @@ async def get_squad_by_user(db: AsyncSession, user_id: int) -> Squad:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Get squads with filters
-async def get_squad_with_filters(db: AsyncSession, user_id: Optional[int] = None, name: Optional[str] = None, **filters):
+async def get_squad_with_filters(db: AsyncSession, user_id: Optional[int] = None, name: Optional[str] = None, after_id: Optional[int] = None,
+                                 limit: int = DEFAULT_PAGE_SIZE, fields: Optional[str] = None, as_rows: bool = False, **filters):
+    query = filter_squads_query(user_id, name, **filters)
+
+    # Execute the query as a keyset page
+    try:
+        return await get_page(db, query, Squad, after_id, limit, fields, as_rows)
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Query of the squads matching the filters (shared by the paged list and the export)
+def filter_squads_query(user_id: Optional[int] = None, name: Optional[str] = None, **filters) -> Select:
     # Start the base query
     query = select(Squad)
 
@@ -107,7 +118,7 @@ async def get_squad_with_filters(db: AsyncSession, user_id: Optional[int] = None
     if user_id is not None:
         conditions.append(Squad.user_id == user_id)
     if name is not None:
-        conditions.append(Squad.name.ilike(f"%{name}%"))
+        conditions.append(func.f_unaccent(Squad.name).ilike(func.f_unaccent(f"%{name}%")))
 
     # Add more filters if passed through **filters
     for field, value in filters.items():
@@ -118,8 +129,66 @@ async def get_squad_with_filters(db: AsyncSession, user_id: Optional[int] = None
     # Apply all conditions dynamically
     if conditions:
         query = query.where(and_(*conditions))
+    return query
+
+# Column values of a model instance, without relationships
+def get_columns(instance) -> Dict:
+    if instance is None:
+        return None
+    return {column.key: getattr(instance, column.key) for column in instance.__table__.columns}
+
+# Get a squad with its formation, limits, players (with team and nationality) and rating summary.
+# Two statements whatever the squad size: squad with its many-to-one rows (and rating aggregates),
+# and squad players with their player, team and nationality.
+async def get_squad_full(db: AsyncSession, squad_id: int) -> Dict:
+    query = (
+        select(Squad)
+        .where(Squad.id == squad_id)
+        .options(
+            joinedload(Squad.formation),
+            joinedload(Squad.competition),
+            joinedload(Squad.nationality),
+            selectinload(Squad.squad_players)
+            .joinedload(SquadPlayer.player)
+            .options(joinedload(Player.team), joinedload(Player.nationality)),
+        )
+    )
+    try:
+        result = await db.execute(query)
+        squad = result.scalar_one_or_none()
+        if squad is None:
+            raise HTTPException(status_code=404, detail="Not found squad")
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    squad_players = []
+    for squad_player in sorted(squad.squad_players, key=lambda squad_player: squad_player.id):
+        player = get_columns(squad_player.player)
+        if player is not None:
+            player["team"] = get_columns(squad_player.player.team)
+            player["nationality"] = get_columns(squad_player.player.nationality)
+        squad_players.append({**get_columns(squad_player), "player": player})
+
+    return {
+        **get_columns(squad),
+        "formation": get_columns(squad.formation),
+        "competition": get_columns(squad.competition),
+        "nationality": get_columns(squad.nationality),
+        "squad_players": squad_players,
+        "rating_average": squad.rating_sum / squad.rating_count if squad.rating_count else None,
+    }
+
+# Best rated squads (Bayesian score), served by the rating_score indexes
+async def get_squad_leaderboard(db: AsyncSession, competition_id: Optional[int] = None, nationality_id: Optional[int] = None,
+                                limit: int = 10) -> List[Squad]:
+    query = select(Squad)
+    if competition_id is not None:
+        query = query.where(Squad.competition_id == competition_id)
+    if nationality_id is not None:
+        query = query.where(Squad.nationality_id == nationality_id)
 
-    # Execute the query
-    result = await db.execute(query)
-    squads = result.scalars().all()
-    return squads
\ No newline at end of file
+    try:
+        result = await db.execute(query.order_by(Squad.rating_score.desc(), Squad.id).limit(limit))
+        return result.scalars().all()
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -2,8 +2,14 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from fastapi import HTTPException
 from sqlalchemy.exc import SQLAlchemyError
-from typing import List, Dict, Optional
-from models.models import TeamCompetition, TeamCompetitionCreate
+from typing import Any, List, Dict, Optional
+from models.models import Competition, Team, TeamCompetition, TeamCompetitionCreate
+from core.cache import reference_cache
+from core.invalidation import publish
+from crud.bulk import bulk_create
+from crud.catalog import log_changes
+from crud.player_index import player_index
+from crud.writes import delete_row, insert_row
 
 # Get all team competitions
 async def get_team_competitions(db: AsyncSession) -> List[TeamCompetition]:
@@ -47,28 +53,39 @@ async def get_team_competition_by_team_id_competition_id(db: AsyncSession, team_
 # Create a team competition
 async def create_team_competition(db: AsyncSession, new_team_competition: TeamCompetitionCreate) -> Dict[str, int]:
     try:
-        team_competition = TeamCompetition(
-            team_id=new_team_competition.team_id,
-            competition_id=new_team_competition.competition_id
-        )
-        db.add(team_competition)
+        team_competition = await insert_row(db, TeamCompetition, {
+            "team_id": new_team_competition.team_id,
+            "competition_id": new_team_competition.competition_id
+        })
+        await log_changes(db, "team_competition", [(team_competition["team_id"], team_competition["competition_id"])])
+        await publish(db, "team_competition", [(team_competition["team_id"], team_competition["competition_id"])])
         await db.commit()
-        
-        await db.refresh(team_competition)
+        reference_cache.invalidate("team_competition")
+        player_index.add_team_competition(team_competition["team_id"], team_competition["competition_id"])
         return team_competition
     except SQLAlchemyError as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+# Create many team competitions in one statement. Rows with an unknown team or competition,
+# or a link that already exists, are reported by their index.
+async def create_team_competitions(db: AsyncSession, new_team_competitions: List[Any]) -> Dict:
+    result = await bulk_create(db, TeamCompetition, TeamCompetitionCreate, new_team_competitions, key=("team_id", "competition_id"),
+                               references={"team_id": Team, "competition_id": Competition})
+    for team_competition in result["created"]:
+        player_index.add_team_competition(team_competition["team_id"], team_competition["competition_id"])
+    return result
+
 # Delete a team competition
 async def delete_team_competition(db: AsyncSession, team_id: int, competition_id: int) -> None:
     try:
-        team_competition = await get_team_competition_by_team_id_competition_id(db, team_id, competition_id)
-        if team_competition is None:
-            raise HTTPException(status_code=404, detail="Could not find information for team-competition.")
-
-        await db.delete(team_competition)
+        await delete_row(db, TeamCompetition, (TeamCompetition.team_id == team_id) & (TeamCompetition.competition_id == competition_id),
+                         "Could not find information for team-competition.")
+        await log_changes(db, "team_competition", [(team_id, competition_id)])
+        await publish(db, "team_competition", [(team_id, competition_id)])
         await db.commit()
+        reference_cache.invalidate("team_competition")
+        player_index.remove_team_competition(team_id, competition_id)
         return {"detail": "Team-Competition with team id " + str(team_id) + " and competition id " + str(competition_id) + " deleted successfully"}
     except SQLAlchemyError as e:
         await db.rollback()
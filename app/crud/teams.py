@@ -2,14 +2,21 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from fastapi import HTTPException
 from sqlalchemy.exc import SQLAlchemyError
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional, Tuple
 from models.models import Team, TeamCreate
+from core.cache import reference_cache
+from core.invalidation import publish
+from crud.bulk import bulk_create
+from crud.catalog import log_changes
+from crud.player_index import player_index
+from crud.pagination import DEFAULT_PAGE_SIZE, get_page
+from crud.writes import delete_row_detaching, insert_row, update_row
 
 # Get all teams
-async def get_teams(db: AsyncSession) -> List[Team]:
+async def get_teams(db: AsyncSession, after_id: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                    fields: Optional[str] = None) -> Tuple[List[Team], Optional[int]]:
     try:
-        result = await db.execute(select(Team))
-        return result.scalars().all()
+        return await get_page(db, select(Team), Team, after_id, limit, fields)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -27,26 +34,28 @@ async def get_team_by_id(db: AsyncSession, team_id: int) -> Team:
 # Create a team
 async def create_team(db: AsyncSession, new_team: TeamCreate) -> Dict[str, int]:
     try:
-        team = Team(name=new_team.name)
-        db.add(team)
+        team = await insert_row(db, Team, {"name": new_team.name})
+        await log_changes(db, "team", [team["id"]])
+        await publish(db, "team", [team["id"]])
         await db.commit()
-        await db.refresh(team)
+        reference_cache.invalidate("team")
         return team
     except SQLAlchemyError as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+# Create many teams in one statement, invalid rows are reported by their index
+async def create_teams(db: AsyncSession, new_teams: List[Any]) -> Dict:
+    return await bulk_create(db, Team, TeamCreate, new_teams)
+
 # Update a team
 async def update_team(db: AsyncSession, updated_team: TeamCreate, team_id: int) -> None:
     try:
-        team = await get_team_by_id(db, team_id)
-        if team is None:
-            raise HTTPException(status_code=404, detail="Not found team.")
-
-        team.name = updated_team.name
-
+        team = await update_row(db, Team, Team.id == team_id, {"name": updated_team.name}, "Not found team.")
+        await log_changes(db, "team", [team_id])
+        await publish(db, "team", [team_id])
         await db.commit()
-        await db.refresh(team)
+        reference_cache.invalidate("team")
         return team
     except SQLAlchemyError as e:
         await db.rollback()
@@ -55,12 +64,16 @@ async def update_team(db: AsyncSession, updated_team: TeamCreate, team_id: int)
 # Delete a team
 async def delete_team(db: AsyncSession, team_id: int) -> None:
     try:
-        team = await get_team_by_id(db, team_id)
-        if team is None:
-            raise HTTPException(status_code=404, detail="Not found team.")
-
-        await db.delete(team)
+        # Its players are left without a team, so they change too
+        _team, detached = await delete_row_detaching(db, Team, Team.id == team_id, "Not found team.")
+        players = detached.get("player", [])
+        await log_changes(db, "team", [team_id])
+        await log_changes(db, "player", players)
+        await publish(db, "team", [team_id])
+        await publish(db, "player", players)
         await db.commit()
+        reference_cache.invalidate("team", "player")
+        await player_index.refresh_players(db, players)
         return {"detail": "Team with id " + str(team_id) + " deleted successfully"}
     except SQLAlchemyError as e:
         await db.rollback()
@@ -68,9 +81,9 @@ async def delete_team(db: AsyncSession, team_id: int) -> None:
 
 # Other gets
 # Get teams by name
-async def get_team_by_name(db: AsyncSession, name: str) -> List[Team]:  # Changed return type to List[Team]
+async def get_team_by_name(db: AsyncSession, name: str, after_id: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                           fields: Optional[str] = None) -> Tuple[List[Team], Optional[int]]:
     try:
-        result = await db.execute(select(Team).where(Team.name.ilike(f"%{name}%")))
-        return result.scalars().all()
+        return await get_page(db, select(Team).where(Team.name.ilike(f"%{name}%")), Team, after_id, limit, fields)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -1,21 +1,21 @@
-import bcrypt
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.exc import SQLAlchemyError
 from fastapi import HTTPException
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from models.models import Usuario, UsuarioCreate
-
+from crud.pagination import DEFAULT_PAGE_SIZE, get_page
+from crud.writes import delete_row, insert_row, update_row
+from core.passwords import check_password, hash_password, needs_rehash
 
 # Obtener todos los usuarios
-async def get_users(db: AsyncSession) -> List[Usuario]:
+async def get_users(db: AsyncSession, after_id: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                    fields: Optional[str] = None) -> Tuple[List[Usuario], Optional[int]]:
     try:
-        result = await db.execute(select(Usuario))
-        return result.scalars().all()
+        return await get_page(db, select(Usuario), Usuario, after_id, limit, fields)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-
 # Obtener un usuario por ID
 async def get_user_by_id(db: AsyncSession, user_id: int) -> Usuario:
     try:
@@ -27,7 +27,6 @@ async def get_user_by_id(db: AsyncSession, user_id: int) -> Usuario:
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-
 # Obtener un usuario por username
 async def get_user_by_username(db: AsyncSession, username: str) -> Usuario:
     try:
@@ -39,17 +38,14 @@ async def get_user_by_username(db: AsyncSession, username: str) -> Usuario:
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-
 # Crear un nuevo usuario (con hasheo de la contraseña)
 async def create_user(db: AsyncSession, new_usuario: UsuarioCreate) -> Dict[str, int]:
     try:
-        # Hashear la contraseña
-        hashed_password = bcrypt.hashpw(new_usuario.password.encode('utf-8'), bcrypt.gensalt())
+        # Hashear la contraseña (en el pool de hasheo, sin bloquear el event loop)
+        hashed_password = await hash_password(new_usuario.password)
         
-        usuario = Usuario(username=new_usuario.username, password=hashed_password.decode('utf-8'), email=new_usuario.email)
-        db.add(usuario)
+        usuario = await insert_row(db, Usuario, {"username": new_usuario.username, "password": hashed_password, "email": new_usuario.email})
         await db.commit()
-        await db.refresh(usuario)
         return usuario
     except SQLAlchemyError as e:
         await db.rollback()  # Reversión en caso de error
@@ -59,18 +55,12 @@ async def create_user(db: AsyncSession, new_usuario: UsuarioCreate) -> Dict[str,
 # Actualizar un usuario existente (con hasheo si cambia la contraseña)
 async def update_user(db: AsyncSession, updatedUser: UsuarioCreate, user_id: int) -> None:
     try:
-        user = await get_user_by_id(db, user_id)
-        if user is None:
-            raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
         # Hashear la nueva contraseña si se proporciona
-        hashed_password = bcrypt.hashpw(updatedUser.password.encode('utf-8'), bcrypt.gensalt())
-        user.username = updatedUser.username
-        user.email = updatedUser.email
-        user.password = hashed_password.decode('utf-8')
-
+        hashed_password = await hash_password(updatedUser.password)
+        user = await update_row(db, Usuario, Usuario.id == user_id,
+                                {"username": updatedUser.username, "email": updatedUser.email, "password": hashed_password},
+                                "Usuario no encontrado")
         await db.commit()
-        await db.refresh(user)
         return user
     except SQLAlchemyError as e:
         await db.rollback()
@@ -79,11 +69,7 @@ async def update_user(db: AsyncSession, updatedUser: UsuarioCreate, user_id: int
 # Eliminar un usuario
 async def delete_user(db: AsyncSession, user_id: int) -> None:
     try:
-        user = await get_user_by_id(db, user_id)
-        if user is None:
-            raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
-        await db.delete(user)
+        await delete_row(db, Usuario, Usuario.id == user_id, "Usuario no encontrado")
         await db.commit()
         return {"detail": "User with id " + str(user_id) + " deleted successfully"}
     except SQLAlchemyError as e:
@@ -98,8 +84,18 @@ async def verify_user_credentials(db: AsyncSession, username: str, password: str
             return None
 
         # Verificar la contraseña
-        if bcrypt.checkpw(password.encode('utf-8'), user.password.encode('utf-8')):
-            return user.id
-        return False
+        user_id = user.id
+        if not await check_password(password, user.password):
+            return False
+
+        # Rehashear si el coste configurado ha cambiado
+        if needs_rehash(user.password):
+            try:
+                user.password = await hash_password(password)
+                await db.commit()
+            except HTTPException:
+                # Pool de hasheo lleno: se rehashea en el siguiente login
+                pass
+        return user_id
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
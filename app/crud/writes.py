@@ -0,0 +1,61 @@
+from typing import Any, Dict, List, Tuple
+from fastapi import HTTPException
+from sqlalchemy import delete, func, inspect, insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import ONETOMANY
+
+# Single statement writes: each create, update and delete is one INSERT/UPDATE/DELETE ... RETURNING instead of
+# a read, the write and a refresh. A missing row is detected from the empty result. They run in the caller's
+# transaction and return plain dicts, which the response models read like ORM objects.
+
+# Insert a row and return it with the columns filled in by the database
+async def insert_row(db: AsyncSession, model, values: Dict[str, Any]) -> Dict:
+    table = model.__table__
+    result = await db.execute(insert(table).values(values).returning(*table.columns))
+    return dict(result.mappings().one())
+
+# Update the row matching a condition and return it, 404 when there is none
+async def update_row(db: AsyncSession, model, condition, values: Dict[str, Any], not_found: str) -> Dict:
+    table = model.__table__
+    result = await db.execute(update(table).where(condition).values(values).returning(*table.columns))
+    row = result.mappings().one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail=not_found)
+    return dict(row)
+
+# Delete the row matching a condition and return it, 404 when there is none.
+# As session.delete() did, the rows of its one-to-many relationships are detached (foreign key set to NULL),
+# here by data-modifying CTEs of the same statement.
+async def delete_row(db: AsyncSession, model, condition, not_found: str) -> Dict:
+    row, _detached = await delete_row_detaching(db, model, condition, not_found)
+    return row
+
+# The same, also returning the ids of the detached rows by table, taken from the RETURNING of the CTEs
+async def delete_row_detaching(db: AsyncSession, model, condition, not_found: str) -> Tuple[Dict, Dict[str, List[Any]]]:
+    table = model.__table__
+    detaches = []
+    for relationship in inspect(model).relationships:
+        if relationship.direction is not ONETOMANY:
+            continue
+        for local, remote in relationship.local_remote_pairs:
+            # Primary key columns cannot be blanked out, the foreign key constraint decides
+            if remote.primary_key:
+                continue
+            key, = remote.table.primary_key.columns
+            detach = (update(remote.table).where(remote.in_(select(local).where(condition))).values({remote.key: None})
+                      .returning(key).cte("detach_%s_%s" % (remote.table.name, remote.key)))
+            detaches.append((remote.table.name, detach, select(func.array_agg(detach.c[key.key])).scalar_subquery()
+                             .label(detach.name)))
+
+    statement = delete(table).where(condition).returning(*table.columns, *(ids for _, _, ids in detaches))
+    for _, detach, _ in detaches:
+        statement = statement.add_cte(detach)
+
+    row = (await db.execute(statement)).mappings().one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail=not_found)
+    detached: Dict[str, List[Any]] = {}
+    for table_name, detach, _ in detaches:
+        detached.setdefault(table_name, []).extend(row[detach.name] or [])
+    return {column.key: row[column.key] for column in table.columns}, detached
@@ -0,0 +1,46 @@
+# Bulk import of the catalog from CSV or XLSX files, one table per file.
+# Run from the app folder against DATABASE_URL, referenced tables first:
+#   python import_catalog.py nationalities nationalities.csv
+#   python import_catalog.py teams teams.xlsx --sheet Teams
+#   python import_catalog.py players players.csv
+# The first row holds the column names: name for nationalities and teams, name and region for competitions,
+# team and competition for team_competitions, and name, nationality, team, market_value, position and
+# alternate_position for players. Teams, nationalities and competitions are given by name.
+# BD_SQL/inserts_equipos.xlsx is not in this layout: its sheets have no header row, and they hold formulas that
+# build INSERT statements. The Player sheet is also a pasted web page, with several rows per player. Copy the
+# names into a sheet or CSV with the columns above (e.g. Nationalities!B as name) before importing them.
+import argparse
+import asyncio
+import json
+import sys
+from fastapi import HTTPException
+from db import engine
+from models.models import ImportFormatEnum, ImportKindEnum
+from crud.imports import import_catalog
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Bulk import of catalog data")
+    parser.add_argument("kind", choices=[kind.value for kind in ImportKindEnum])
+    parser.add_argument("file")
+    parser.add_argument("--sheet", help="worksheet of an .xlsx file, the active one by default")
+    args = parser.parse_args()
+
+    file_format = ImportFormatEnum.XLSX if args.file.lower().endswith(".xlsx") else ImportFormatEnum.CSV
+    try:
+        with open(args.file, "rb") as file:
+            report = await import_catalog(ImportKindEnum(args.kind), file, file_format, args.sheet)
+    except HTTPException as e:
+        print(e.detail, file=sys.stderr)
+        return 1
+    except OSError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        await engine.dispose()
+
+    report["kind"] = report["kind"].value
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
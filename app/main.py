@@ -1,10 +1,20 @@
-from fastapi import FastAPI, Depends, HTTPException
+import time
+from time import perf_counter
+from fastapi import FastAPI, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from routers import (competitions_router, formations_router, nationalities_router, players_router,
-                     ratings_router, squad_players_router, squads_router, team_competitions_router, team_router, users_router)
+from routers import (catalog_router, competitions_router, exports_router, formations_router, imports_router, internal_router,
+                     nationalities_router, players_router, ratings_router, squad_players_router, squads_router, team_competitions_router,
+                     team_router, users_router)
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy.exc import SQLAlchemyError
+from db import LAST_WRITE_HEADER, SessionLocal, engine, read_engine
+from crud.player_index import player_index
+from core.profiling import install_sql_profiling, log_request_profile, start_request_profile
+from core import metrics
+from core.invalidation import invalidation_listener
+from core.responses import FastJSONResponse
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # Configuración de CORS
 origins = [
@@ -17,11 +27,52 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Permite todos los métodos (GET, POST, etc.)
     allow_headers=["*"],  # Permite todos los headers
+    expose_headers=[LAST_WRITE_HEADER, "Server-Timing"],
 )
 
+# Mark successful writes so the client reads them back from the primary and not from a lagging replica
+@app.middleware("http")
+async def mark_writes(request: Request, call_next):
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        response.headers[LAST_WRITE_HEADER] = str(time.time())
+    return response
+
+# Count and time the SQL statements of every request, report them in Server-Timing and log slow requests and N+1 patterns
+install_sql_profiling(engine)
+install_sql_profiling(read_engine)
+
+@app.middleware("http")
+async def profile_sql(request: Request, call_next):
+    profile = start_request_profile()
+    response = await call_next(request)
+    response.headers["Server-Timing"] = profile.server_timing()
+    log_request_profile(profile, request.method, request.url.path, response.status_code)
+    return response
+
+# Request count, latency and size per route template ("/squads/{squad_id}", not the raw path)
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    start = perf_counter()
+    metrics.inc("http_requests_in_flight")
+    status_code, size = 500, None
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        size = int(response.headers["content-length"]) if "content-length" in response.headers else None
+        return response
+    finally:
+        metrics.inc("http_requests_in_flight", value=-1)
+        route = request.scope.get("route")
+        metrics.record_request(request.method, route.path if route else "unmatched", status_code, perf_counter() - start, size)
+
 #Routers
+app.include_router(catalog_router.router)
 app.include_router(competitions_router.router)
+app.include_router(exports_router.router)
 app.include_router(formations_router.router)
+app.include_router(imports_router.router)
+app.include_router(internal_router.router)
 app.include_router(nationalities_router.router)
 app.include_router(players_router.router)
 app.include_router(ratings_router.router)
@@ -31,6 +82,33 @@ app.include_router(team_competitions_router.router)
 app.include_router(team_router.router)
 app.include_router(users_router.router)
 
+# Apply the cache invalidations of the other workers. Started before the player index is loaded,
+# so no write is missed in between.
+@app.on_event("startup")
+async def start_invalidation_listener():
+    await invalidation_listener.start()
+
+@app.on_event("shutdown")
+async def stop_invalidation_listener():
+    await invalidation_listener.stop()
+
+# Load the in-memory player index used by /players_filtered/
+@app.on_event("startup")
+async def load_player_index():
+    try:
+        async with SessionLocal() as db:
+            await player_index.load(db)
+    except (SQLAlchemyError, OSError):
+        player_index.ready = False
+
+@app.on_event("startup")
+async def start_metrics():
+    metrics.start_metrics_flush()
+
+@app.on_event("shutdown")
+async def stop_metrics():
+    metrics.stop_metrics_flush()
+
 @app.get("/")
 async def root():
     return "The FastAPI is running. For more info go to Help (http://127.0.0.1:8000/help)"
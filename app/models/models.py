@@ -1,6 +1,7 @@
-from typing import Optional
-from pydantic import BaseModel
-from sqlalchemy import Column, ForeignKey, Integer, String, DECIMAL, TIMESTAMP, Text, CheckConstraint
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field
+from sqlalchemy import BigInteger, Column, ForeignKey, Integer, Sequence, String, DECIMAL, Float, TIMESTAMP, Text, CheckConstraint, UniqueConstraint
 from enum import Enum
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -80,6 +81,10 @@ class Squad(Base):
     competition_id = Column(Integer, ForeignKey('competition.id'))
     budget = Column(DECIMAL(15, 2))
     nationality_id = Column(Integer, ForeignKey('nationality.id'))
+    # Rating aggregates, kept up to date by the rating crud
+    rating_count = Column(Integer, nullable=False, server_default="0")
+    rating_sum = Column(Integer, nullable=False, server_default="0")
+    rating_score = Column(Float, nullable=False, server_default="3")
 
     user = relationship("Usuario", back_populates="squads")
     formation = relationship("Formation", back_populates="squads")
@@ -93,6 +98,8 @@ class SquadPlayer(Base):
     squad_id = Column(Integer, ForeignKey('squad.id'))
     player_id = Column(Integer, ForeignKey('player.id'))
     position = Column(String(50), nullable=False)
+    # A player can only be once in a squad
+    __table_args__ = (UniqueConstraint('squad_id', 'player_id', name='uq_squad_player_squad_player'),)
 
     squad = relationship("Squad", back_populates="squad_players")
     player = relationship("Player", back_populates="squad_players")
@@ -109,20 +116,41 @@ class Rating(Base):
     user = relationship("Usuario", back_populates="ratings")
     squad = relationship("Squad")
 
+catalog_change_version = Sequence("catalog_change_version_seq", metadata=Base.metadata)
+
+# Change log of the catalog read by /catalog/changes: one row per changed key with the version of its last change.
+# Whether the change is an upsert or a deletion is read from the catalog table itself.
+class CatalogChange(Base):
+    __tablename__ = 'catalog_change'
+    table_name = Column(String(50), primary_key=True)
+    row_id = Column(Integer, primary_key=True)
+    # Second key column: competition_id of the team_competition links, 0 for the other tables
+    related_id = Column(Integer, primary_key=True, server_default="0")
+    version = Column(BigInteger, catalog_change_version, server_default=catalog_change_version.next_value(), nullable=False, unique=True)
+
+# Version of every table cached in process, bumped by each write together with its invalidation NOTIFY.
+# The row lock serializes the writers of a table, so committed versions have no gaps.
+class CacheVersion(Base):
+    __tablename__ = 'cache_version'
+    table_name = Column(String(50), primary_key=True)
+    version = Column(BigInteger, nullable=False)
+
+# Request schemas. Text lengths are those of the columns, so a value too long is rejected by validation
+# (a 422, or a row error of a bulk request) instead of failing the INSERT.
 class UsuarioCreate(BaseModel):
-    username: str
-    email: str
+    username: str = Field(max_length=50)
+    email: str = Field(max_length=100)
     password: str
 
 class NationalityCreate(BaseModel):
-    name: str
+    name: str = Field(max_length=50)
 
 class CompetitionCreate(BaseModel):
-    name: str
-    region: str
+    name: str = Field(max_length=100)
+    region: str = Field(max_length=100)
 
 class TeamCreate(BaseModel):
-    name: str
+    name: str = Field(max_length=100)
 
 
 # Posible positions.
@@ -141,7 +169,7 @@ class PositionEnum(str, Enum):
     LW = "LW"
 
 class PlayerCreate(BaseModel):
-    name: str
+    name: str = Field(max_length=100)
     position: PositionEnum
     alternate_position: Optional[PositionEnum]
     team_id: int
@@ -149,20 +177,50 @@ class PlayerCreate(BaseModel):
     market_value: Optional[float]
 
 class SquadCreate(BaseModel):
-    name: str
+    name: str = Field(max_length=50)
     formation_id: int
     user_id: int
     competition_id: Optional[int]
     nationality_id: Optional[int]
     budget: Optional[float]
 
+# What the squad solver optimizes.
+class SolveObjectiveEnum(str, Enum):
+    MAX_MARKET_VALUE = "max_market_value"
+    MIN_MARKET_VALUE = "min_market_value"
+
+class SquadSolve(BaseModel):
+    objective: SolveObjectiveEnum = SolveObjectiveEnum.MAX_MARKET_VALUE
+
+# Formats of the /export/ endpoints.
+class ExportFormatEnum(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+# Catalog tables and file formats of the bulk import.
+class ImportKindEnum(str, Enum):
+    NATIONALITIES = "nationalities"
+    COMPETITIONS = "competitions"
+    TEAMS = "teams"
+    TEAM_COMPETITIONS = "team_competitions"
+    PLAYERS = "players"
+
+class ImportFormatEnum(str, Enum):
+    CSV = "csv"
+    XLSX = "xlsx"
+
 class SquadPlayerCreate(BaseModel):
     squad_id: int
     player_id: int
-    position: str
+    position: str = Field(max_length=50)
+
+# One player of a full squad lineup (PUT /squads/{squad_id}/players)
+class SquadLineupPlayer(BaseModel):
+    player_id: int
+    position: str = Field(max_length=50)
 
 class TeamCreate(BaseModel):
-    name: str
+    name: str = Field(max_length=100)
 
 class TeamCompetitionCreate(BaseModel):
     team_id: int
@@ -170,15 +228,15 @@ class TeamCompetitionCreate(BaseModel):
 
 
 class CompetitionCreate(BaseModel):
-    name: str
-    region: str
+    name: str = Field(max_length=100)
+    region: str = Field(max_length=100)
 
 class FormationCreate(BaseModel):
-    name: str
+    name: str = Field(max_length=50)
     description: Optional[str]
 
 class NationalityCreate(BaseModel):
-    name: str
+    name: str = Field(max_length=50)
 
 class RatingCreate(BaseModel):
     user_id: int
@@ -190,4 +248,198 @@ class UserCredentials(BaseModel):
     username: str
     password: str
 
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
+
+# Response models. They read ORM objects directly (from_attributes), and every field but the id is
+# optional so the "fields" projection of the list endpoints validates too (unset fields are left out).
+class ORMModel(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+class UsuarioRead(ORMModel):
+    id: int
+    username: Optional[str] = None
+    email: Optional[str] = None
+    created_at: Optional[datetime] = None
 
+class NationalityRead(ORMModel):
+    id: int
+    name: Optional[str] = None
+
+class CompetitionRead(ORMModel):
+    id: int
+    name: Optional[str] = None
+    region: Optional[str] = None
+
+class TeamRead(ORMModel):
+    id: int
+    name: Optional[str] = None
+
+class PlayerRead(ORMModel):
+    id: int
+    name: Optional[str] = None
+    nationality_id: Optional[int] = None
+    team_id: Optional[int] = None
+    market_value: Optional[float] = None
+    position: Optional[str] = None
+    alternate_position: Optional[str] = None
+
+class TeamCompetitionRead(ORMModel):
+    team_id: int
+    competition_id: int
+
+class FormationRead(ORMModel):
+    id: int
+    name: Optional[str] = None
+    description: Optional[str] = None
+
+class SquadRead(ORMModel):
+    id: int
+    user_id: Optional[int] = None
+    formation_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+    name: Optional[str] = None
+    competition_id: Optional[int] = None
+    budget: Optional[float] = None
+    nationality_id: Optional[int] = None
+    rating_count: Optional[int] = None
+    rating_sum: Optional[int] = None
+    rating_score: Optional[float] = None
+
+class SquadPlayerRead(ORMModel):
+    id: int
+    squad_id: Optional[int] = None
+    player_id: Optional[int] = None
+    position: Optional[str] = None
+
+class RatingRead(ORMModel):
+    id: int
+    user_id: Optional[int] = None
+    squad_id: Optional[int] = None
+    rating: Optional[int] = None
+    comment: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+# Keyset pages of the list endpoints
+class UsuarioPage(BaseModel):
+    users: List[UsuarioRead]
+    next_cursor: Optional[int]
+
+class NationalityPage(BaseModel):
+    nationalities: List[NationalityRead]
+    next_cursor: Optional[int]
+
+class CompetitionPage(BaseModel):
+    competitions: List[CompetitionRead]
+    next_cursor: Optional[int]
+
+class TeamPage(BaseModel):
+    teams: List[TeamRead]
+    next_cursor: Optional[int]
+
+class PlayerPage(BaseModel):
+    players: List[PlayerRead]
+    next_cursor: Optional[int]
+
+class FormationPage(BaseModel):
+    formations: List[FormationRead]
+    next_cursor: Optional[int]
+
+class SquadPage(BaseModel):
+    squads: List[SquadRead]
+    next_cursor: Optional[int]
+
+class SquadPlayerPage(BaseModel):
+    squad_players: List[SquadPlayerRead]
+    next_cursor: Optional[int]
+
+class RatingPage(BaseModel):
+    ratings: List[RatingRead]
+    next_cursor: Optional[int]
+
+# Bulk create endpoints: the created rows in request order and the rejected ones by their index in the request
+class BulkError(BaseModel):
+    index: int
+    detail: str
+
+class NationalityBulk(BaseModel):
+    created: List[NationalityRead]
+    errors: List[BulkError]
+
+class CompetitionBulk(BaseModel):
+    created: List[CompetitionRead]
+    errors: List[BulkError]
+
+class TeamBulk(BaseModel):
+    created: List[TeamRead]
+    errors: List[BulkError]
+
+class TeamCompetitionBulk(BaseModel):
+    created: List[TeamCompetitionRead]
+    errors: List[BulkError]
+
+class FormationBulk(BaseModel):
+    created: List[FormationRead]
+    errors: List[BulkError]
+
+class PlayerSearchResult(BaseModel):
+    players: List[PlayerRead]
+
+class SquadLeaderboard(BaseModel):
+    squads: List[SquadRead]
+
+class SquadLineup(BaseModel):
+    squad_players: List[SquadPlayerRead]
+
+class TeamCompetitionList(BaseModel):
+    team_competitions: List[TeamCompetitionRead]
+
+# GET /squads/{squad_id}/full
+class PlayerDetail(PlayerRead):
+    team: Optional[TeamRead] = None
+    nationality: Optional[NationalityRead] = None
+
+class SquadPlayerDetail(SquadPlayerRead):
+    player: Optional[PlayerDetail] = None
+
+class SquadFull(SquadRead):
+    formation: Optional[FormationRead] = None
+    competition: Optional[CompetitionRead] = None
+    nationality: Optional[NationalityRead] = None
+    squad_players: List[SquadPlayerDetail] = []
+    rating_average: Optional[float] = None
+
+# POST /squads/{squad_id}/solve
+class SolvedSlot(BaseModel):
+    position: str
+    player: PlayerRead
+
+class SquadSolution(BaseModel):
+    squad_id: int
+    formation: str
+    objective: SolveObjectiveEnum
+    objective_value: float
+    optimal: bool
+    players: List[SolvedSlot]
+
+class TokenPair(BaseModel):
+    user_id: int
+    access_token: str
+    refresh_token: str
+    token_type: str
+    expires_in: int
+
+# POST /admin/import/{kind}: rows read, rows written and the first errors of the rejected rows
+class ImportReport(BaseModel):
+    kind: ImportKindEnum
+    rows: int
+    inserted: int
+    updated: int
+    rejected: int
+    errors: List[str] = []
+    seconds: float
+
+# Message returned by deletes and logout
+class Detail(BaseModel):
+    detail: str
@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from crud.catalog import catalog_snapshot, get_catalog, get_catalog_changes
+from db import get_read_db
+from core.cache import snapshot_response
+from core.responses import FastJSONResponse
+
+router=APIRouter()
+
+# Catalog Endpoints
+# Players, nationalities, teams, competitions and team-competition links in one bundle, for the front end to load
+# at start up. It is served pre-encoded (brotli or gzip when accepted) and only rebuilt after a catalog write.
+@router.get("/catalog/snapshot")
+async def read_catalog_snapshot(request: Request, db: AsyncSession = Depends(get_read_db)):
+    return await snapshot_response(request, catalog_snapshot, lambda: get_catalog(db))
+
+# Players, teams and team-competition links changed after a version (the one of the snapshot or of the last call)
+@router.get("/catalog/changes")
+async def read_catalog_changes(since: int = Query(..., ge=0), db: AsyncSession = Depends(get_read_db)):
+    return FastJSONResponse(await get_catalog_changes(db, since))
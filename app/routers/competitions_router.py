@@ -1,38 +1,52 @@
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Any, List, Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from crud.competitions import create_competition, delete_competition, get_competition_by_id, get_competition_by_name, get_competitions, update_competition
-from db import get_db
-from models.models import CompetitionCreate
+from crud.competitions import create_competition, create_competitions, delete_competition, get_competition_by_id, get_competition_by_name, get_competitions, update_competition
+from db import get_db, get_read_db
+from core.cache import cached_response
+from crud.bulk import BULK_MAX_ROWS
+from crud.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from models.models import CompetitionBulk, CompetitionCreate, CompetitionPage, CompetitionRead, Detail
 
 router=APIRouter()
 
 # Competitions Endpoints
-@router.get("/competitions/")
-async def read_competitions(db: AsyncSession = Depends(get_db)):
-    return {"competitions": await get_competitions(db)}
-
-@router.get("/competitions/{competition_id}")
-async def read_competition(competition_id: int, db: AsyncSession = Depends(get_db)):
-    return await get_competition_by_id(db, competition_id)
-
-@router.post("/competitions/")
+@router.get("/competitions/", response_model=CompetitionPage, response_model_exclude_unset=True)
+async def read_competitions(request: Request, after_id: Optional[int] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                            fields: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    async def load():
+        competitions, next_cursor = await get_competitions(db, after_id, limit, fields)
+        return {"competitions": competitions, "next_cursor": next_cursor}
+    return await cached_response(request, ("competition",), CompetitionPage, load)
+
+@router.get("/competitions/{competition_id}", response_model=CompetitionRead)
+async def read_competition(request: Request, competition_id: int, db: AsyncSession = Depends(get_read_db)):
+    return await cached_response(request, ("competition",), CompetitionRead, lambda: get_competition_by_id(db, competition_id))
+
+@router.post("/competitions/", response_model=CompetitionRead)
 async def create_competition_route(competition: CompetitionCreate, db: AsyncSession = Depends(get_db)):
     return await create_competition(db, competition)
 
-@router.put("/competitions/{competition_id}")
+@router.post("/competitions/bulk", response_model=CompetitionBulk)
+async def create_competitions_route(competitions: List[Any] = Body(..., max_length=BULK_MAX_ROWS), db: AsyncSession = Depends(get_db)):
+    return await create_competitions(db, competitions)
+
+@router.put("/competitions/{competition_id}", response_model=CompetitionRead)
 async def update_competition_route(competition_id: int, competition: CompetitionCreate, db: AsyncSession = Depends(get_db)):
     return await update_competition(db, competition, competition_id)
     
 
-@router.delete("/competitions/{competition_id}")
+@router.delete("/competitions/{competition_id}", response_model=Detail)
 async def delete_competition_route(competition_id: int, db: AsyncSession = Depends(get_db)):
     return await delete_competition(db, competition_id)
 
 
-@router.get("/competitions_filtered/")
-async def read_competition_name(name: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+@router.get("/competitions_filtered/", response_model=CompetitionPage, response_model_exclude_unset=True)
+async def read_competition_name(name: Optional[str] = None, after_id: Optional[int] = None,
+                                limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), fields: Optional[str] = None,
+                                db: AsyncSession = Depends(get_read_db)):
     if name:
-        return await get_competition_by_name(db, name)
+        competitions, next_cursor = await get_competition_by_name(db, name, after_id, limit, fields)
+        return {"competitions": competitions, "next_cursor": next_cursor}
     else:
         raise HTTPException(status_code=400, detail="Please provide a filter parameter: name")
\ No newline at end of file
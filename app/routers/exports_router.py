@@ -0,0 +1,36 @@
+from typing import Optional
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+from core.cache import accepted_encodings
+from crud.exports import MEDIA_TYPES, encode_export, get_export_columns, stream_rows
+from crud.players import filter_players_query
+from crud.squads import filter_squads_query
+from db import read_session_factory
+from models.models import ExportFormatEnum, Player, Squad
+
+router=APIRouter()
+
+# Streamed NDJSON or CSV body, gzip compressed when the client accepts it
+def export_response(request: Request, query, model, fields: Optional[str], export_format: ExportFormatEnum, name: str) -> StreamingResponse:
+    columns = get_export_columns(model, fields)
+    compress = "gzip" in accepted_encodings(request)
+    headers = {"Content-Disposition": 'attachment; filename="%s.%s"' % (name, export_format.value), "Vary": "Accept-Encoding"}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+
+    chunks = stream_rows(read_session_factory(request), query, model, columns)
+    return StreamingResponse(encode_export(chunks, columns, export_format, compress), media_type=MEDIA_TYPES[export_format], headers=headers)
+
+# Export Endpoints
+@router.get("/export/players")
+async def export_players(request: Request, format: ExportFormatEnum = ExportFormatEnum.NDJSON, nationality_id: Optional[int] = None,
+                         competition_id: Optional[int] = None, team_id: Optional[int] = None, market_value: Optional[float] = None,
+                         position: Optional[str] = None, name: Optional[str] = None, fields: Optional[str] = None):
+    query = filter_players_query(nationality_id, name, team_id, competition_id, market_value, position)
+    return export_response(request, query, Player, fields, format, "players")
+
+@router.get("/export/squads")
+async def export_squads(request: Request, format: ExportFormatEnum = ExportFormatEnum.NDJSON, user_id: Optional[int] = None,
+                        name: Optional[str] = None, fields: Optional[str] = None):
+    query = filter_squads_query(user_id, name)
+    return export_response(request, query, Squad, fields, format, "squads")
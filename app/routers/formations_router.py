@@ -1,29 +1,41 @@
-from fastapi import APIRouter, Depends
+from typing import Any, List, Optional
+from fastapi import APIRouter, Body, Depends, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from crud.formations import create_formation, delete_formation, get_formation_by_id, get_formations, update_formation
-from db import get_db
-from models.models import FormationCreate
+from crud.formations import create_formation, create_formations, delete_formation, get_formation_by_id, get_formations, update_formation
+from db import get_db, get_read_db
+from core.cache import cached_response
+from crud.bulk import BULK_MAX_ROWS
+from crud.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from models.models import Detail, FormationBulk, FormationCreate, FormationPage, FormationRead
 
 router=APIRouter()
 
 # Formations Endpoints
-@router.get("/formations/")
-async def read_formations(db: AsyncSession = Depends(get_db)):
-    return {"formations": await get_formations(db)}
+@router.get("/formations/", response_model=FormationPage, response_model_exclude_unset=True)
+async def read_formations(request: Request, after_id: Optional[int] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                          fields: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    async def load():
+        formations, next_cursor = await get_formations(db, after_id, limit, fields)
+        return {"formations": formations, "next_cursor": next_cursor}
+    return await cached_response(request, ("formation",), FormationPage, load)
 
-@router.get("/formations/{formation_id}")
-async def read_formation(formation_id: int, db: AsyncSession = Depends(get_db)):
-    return await get_formation_by_id(db, formation_id)
+@router.get("/formations/{formation_id}", response_model=FormationRead)
+async def read_formation(request: Request, formation_id: int, db: AsyncSession = Depends(get_read_db)):
+    return await cached_response(request, ("formation",), FormationRead, lambda: get_formation_by_id(db, formation_id))
 
-@router.post("/formations/")
+@router.post("/formations/", response_model=FormationRead)
 async def create_formation_route(formation: FormationCreate, db: AsyncSession = Depends(get_db)):
     return await create_formation(db, formation)
 
-@router.put("/formations/{formation_id}")
+@router.post("/formations/bulk", response_model=FormationBulk)
+async def create_formations_route(formations: List[Any] = Body(..., max_length=BULK_MAX_ROWS), db: AsyncSession = Depends(get_db)):
+    return await create_formations(db, formations)
+
+@router.put("/formations/{formation_id}", response_model=FormationRead)
 async def update_formation_route(formation: FormationCreate, formation_id: int, db: AsyncSession = Depends(get_db)):
     return await update_formation(db, formation, formation_id)
     
 
-@router.delete("/formations/{formation_id}")
+@router.delete("/formations/{formation_id}", response_model=Detail)
 async def delete_formation_route(formation_id: int, db: AsyncSession = Depends(get_db)):
     return await delete_formation(db, formation_id)
\ No newline at end of file
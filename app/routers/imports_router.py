@@ -0,0 +1,23 @@
+import os
+import tempfile
+from typing import Optional
+from fastapi import APIRouter, Depends, Request
+from crud.imports import import_catalog
+from models.models import ImportFormatEnum, ImportKindEnum, ImportReport
+from core.tokens import get_admin_user_id
+
+# Uploads are kept in memory up to this many bytes and spooled to a temporary file after
+IMPORT_SPOOL_SIZE = int(os.getenv("IMPORT_SPOOL_SIZE", str(16 * 1024 * 1024)))
+
+router=APIRouter()
+
+# Admin Endpoints
+# The file is the raw request body (not a multipart form), e.g. curl --data-binary @players.csv
+@router.post("/admin/import/{kind}", response_model=ImportReport)
+async def import_catalog_route(kind: ImportKindEnum, request: Request, format: ImportFormatEnum = ImportFormatEnum.CSV,
+                               sheet: Optional[str] = None, user_id: int = Depends(get_admin_user_id)):
+    with tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_SIZE) as file:
+        async for chunk in request.stream():
+            file.write(chunk)
+        file.seek(0)
+        return await import_catalog(kind, file, format, sheet)
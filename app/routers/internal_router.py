@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from db import engine, get_pool_status, read_engine
+from core.metrics import render_metrics
+
+router=APIRouter()
+
+# Internal Endpoints
+@router.get("/internal/db/pool")
+async def read_db_pool():
+    status = get_pool_status()
+    if read_engine is not engine:
+        status["replica"] = get_pool_status(read_engine)
+    return status
+
+# Prometheus text format metrics of all the workers
+@router.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
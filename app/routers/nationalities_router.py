@@ -1,38 +1,52 @@
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Any, List, Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from crud.nationalities import create_nationality, delete_nationality, get_nationalities, get_nationalities_by_name, get_nationality_by_id, update_nationality
-from db import get_db
-from models.models import NationalityCreate
+from crud.nationalities import create_nationalities, create_nationality, delete_nationality, get_nationalities, get_nationalities_by_name, get_nationality_by_id, update_nationality
+from db import get_db, get_read_db
+from core.cache import cached_response
+from crud.bulk import BULK_MAX_ROWS
+from crud.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from models.models import Detail, NationalityBulk, NationalityCreate, NationalityPage, NationalityRead
 
 router=APIRouter()
 
 # Nationalities Endpoints
-@router.get("/nationalities/")
-async def read_nationalities(db: AsyncSession = Depends(get_db)):
-    return {"nationalities": await get_nationalities(db)}
-
-@router.get("/nationalities/{nationality_id}")
-async def read_nationality(nationality_id: int, db: AsyncSession = Depends(get_db)):
-    return await get_nationality_by_id(db, nationality_id)
-
-@router.post("/nationalities/")
+@router.get("/nationalities/", response_model=NationalityPage, response_model_exclude_unset=True)
+async def read_nationalities(request: Request, after_id: Optional[int] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                             fields: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    async def load():
+        nationalities, next_cursor = await get_nationalities(db, after_id, limit, fields)
+        return {"nationalities": nationalities, "next_cursor": next_cursor}
+    return await cached_response(request, ("nationality",), NationalityPage, load)
+
+@router.get("/nationalities/{nationality_id}", response_model=NationalityRead)
+async def read_nationality(request: Request, nationality_id: int, db: AsyncSession = Depends(get_read_db)):
+    return await cached_response(request, ("nationality",), NationalityRead, lambda: get_nationality_by_id(db, nationality_id))
+
+@router.post("/nationalities/", response_model=NationalityRead)
 async def create_nationality_route(nationality: NationalityCreate, db: AsyncSession = Depends(get_db)):
     return await create_nationality(db, nationality)
 
-@router.put("/nationalities/{nationality_id}")
+@router.post("/nationalities/bulk", response_model=NationalityBulk)
+async def create_nationalities_route(nationalities: List[Any] = Body(..., max_length=BULK_MAX_ROWS), db: AsyncSession = Depends(get_db)):
+    return await create_nationalities(db, nationalities)
+
+@router.put("/nationalities/{nationality_id}", response_model=NationalityRead)
 async def update_nationality_route(nationality: NationalityCreate, nationality_id: int, db: AsyncSession = Depends(get_db)):
     return await update_nationality(db, nationality, nationality_id)
     
 
-@router.delete("/nationalities/{nationality_id}")
+@router.delete("/nationalities/{nationality_id}", response_model=Detail)
 async def delete_nationality_route(nationality_id: int, db: AsyncSession = Depends(get_db)):
     return await delete_nationality(db, nationality_id)
 
-@router.get("/nationalities_filtered/")
-async def read_nationalities_name(name: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+@router.get("/nationalities_filtered/", response_model=NationalityPage, response_model_exclude_unset=True)
+async def read_nationalities_name(name: Optional[str] = None, after_id: Optional[int] = None,
+                                  limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), fields: Optional[str] = None,
+                                  db: AsyncSession = Depends(get_read_db)):
     if name:
-        return await get_nationalities_by_name(db, name)
+        nationalities, next_cursor = await get_nationalities_by_name(db, name, after_id, limit, fields)
+        return {"nationalities": nationalities, "next_cursor": next_cursor}
     else:
         raise HTTPException(status_code=400, detail="Please provide a filter parameter: name")
 
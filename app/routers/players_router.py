@@ -1,38 +1,55 @@
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from crud.players import create_player, delete_player, get_player_by_id, get_players, get_players_with_filters, update_player
-from db import get_db
-from models.models import PlayerCreate
+from crud.players import create_player, delete_player, get_player_by_id, get_players, get_players_with_filters, search_players, update_player
+from db import get_db, get_read_db
+from core.cache import coalesced_response
+from crud.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from models.models import Detail, PlayerCreate, PlayerPage, PlayerRead, PlayerSearchResult
 
 router=APIRouter()
 
 #Players Endpoints
-@router.get("/players/")
-async def read_players(db: AsyncSession = Depends(get_db)):
-    return {"players": await get_players(db)}
+@router.get("/players/", response_model=PlayerPage, response_model_exclude_unset=True)
+async def read_players(request: Request, after_id: Optional[int] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                       fields: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    async def load():
+        players, next_cursor = await get_players(db, after_id, limit, fields, as_rows=True)
+        return {"players": players, "next_cursor": next_cursor}
+    return await coalesced_response(request, PlayerPage, load, exclude_unset=True)
 
-@router.get("/players/{player_id}")
-async def read_player(player_id: int, db: AsyncSession = Depends(get_db)):
-    return await get_player_by_id(db, player_id)
+# Declared before /players/{player_id} so "search" is not read as an id
+@router.get("/players/search", response_model=PlayerSearchResult)
+async def search_players_route(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=50), db: AsyncSession = Depends(get_read_db)):
+    return {"players": await search_players(db, q, limit)}
 
-@router.post("/players/")
+@router.get("/players/{player_id}", response_model=PlayerRead)
+async def read_player(request: Request, player_id: int, db: AsyncSession = Depends(get_read_db)):
+    return await coalesced_response(request, PlayerRead, lambda: get_player_by_id(db, player_id))
+
+@router.post("/players/", response_model=PlayerRead)
 async def create_player_route(player: PlayerCreate, db: AsyncSession = Depends(get_db)):
     return await create_player(db, player)
 
-@router.put("/players/{player_id}")
+@router.put("/players/{player_id}", response_model=PlayerRead)
 async def update_player_route(player: PlayerCreate, player_id: int, db: AsyncSession = Depends(get_db)):
     return await update_player(db, player, player_id)
     
-@router.delete("/players/{player_id}")
+@router.delete("/players/{player_id}", response_model=Detail)
 async def delete_player_route(player_id: int, db: AsyncSession = Depends(get_db)):
     return await delete_player(db, player_id)
 
-@router.get("/players_filtered/")
-async def read_players_filtered(nationality_id: Optional[int] = None, competition_id: Optional[int] = None, team_id: Optional[int] = None, market_value: Optional[float] = None,
-                                position: Optional[str] = None,name: Optional[str] = None, db: AsyncSession = Depends(get_db)):
-    if nationality_id or name or competition_id or team_id or market_value or position:
-        return await get_players_with_filters(db, nationality_id, name, team_id, competition_id, market_value, position)
-    else:
-        return await get_players(db)
+@router.get("/players_filtered/", response_model=PlayerPage, response_model_exclude_unset=True)
+async def read_players_filtered(request: Request, nationality_id: Optional[int] = None, competition_id: Optional[int] = None, team_id: Optional[int] = None, market_value: Optional[float] = None,
+                                position: Optional[str] = None,name: Optional[str] = None, after_id: Optional[int] = None,
+                                limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), fields: Optional[str] = None,
+                                db: AsyncSession = Depends(get_read_db)):
+    async def load():
+        if nationality_id or name or competition_id or team_id or market_value or position:
+            players, next_cursor = await get_players_with_filters(db, nationality_id, name, team_id, competition_id, market_value, position,
+                                                                  after_id, limit, fields, as_rows=True)
+        else:
+            players, next_cursor = await get_players(db, after_id, limit, fields, as_rows=True)
+        return {"players": players, "next_cursor": next_cursor}
+    return await coalesced_response(request, PlayerPage, load, exclude_unset=True)
 
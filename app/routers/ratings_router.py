@@ -1,37 +1,50 @@
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from crud.ratings import create_rating, delete_rating, get_rating_by_id, get_rating_for_squad, get_ratings, update_rating
-from db import get_db
-from models.models import RatingCreate
+from crud.ratings import create_rating, delete_rating, get_owned_rating, get_rating_by_id, get_rating_for_squad, get_ratings, update_rating
+from db import get_db, get_read_db
+from crud.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from models.models import Detail, RatingCreate, RatingPage, RatingRead
+from core.tokens import get_current_user_id
 
 router=APIRouter()
 
 # Ratings Endpoints
-@router.get("/ratings/")
-async def read_ratings(db: AsyncSession = Depends(get_db)):
-    return {"ratings": await get_ratings(db)}
-
-@router.get("/ratings/{rating_id}")
-async def read_rating(rating_id: int, db: AsyncSession = Depends(get_db)):
+@router.get("/ratings/", response_model=RatingPage, response_model_exclude_unset=True)
+async def read_ratings(after_id: Optional[int] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                       fields: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    ratings, next_cursor = await get_ratings(db, after_id, limit, fields, as_rows=True)
+    return {"ratings": ratings, "next_cursor": next_cursor}
+
+@router.get("/ratings/{rating_id}", response_model=RatingRead)
+async def read_rating(rating_id: int, db: AsyncSession = Depends(get_read_db)):
     return await get_rating_by_id(db, rating_id)
 
-@router.post("/ratings/")
-async def create_rating_route(rating: RatingCreate, db: AsyncSession = Depends(get_db)):
+@router.post("/ratings/", response_model=RatingRead)
+async def create_rating_route(rating: RatingCreate, user_id: int = Depends(get_current_user_id), db: AsyncSession = Depends(get_db)):
+    if rating.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Ratings can only be created for the logged in user")
     return await create_rating(db, rating)
 
-@router.put("/ratings/{rating_id}")
-async def update_rating_route(rating: RatingCreate, rating_id: int, db: AsyncSession = Depends(get_db)):
+@router.put("/ratings/{rating_id}", response_model=RatingRead)
+async def update_rating_route(rating: RatingCreate, rating_id: int, user_id: int = Depends(get_current_user_id),
+                              db: AsyncSession = Depends(get_db)):
+    if rating.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Ratings cannot be given to another user")
+    await get_owned_rating(db, rating_id, user_id)
     return await update_rating(db, rating, rating_id)
 
-@router.delete("/ratings/{rating_id}")
-async def delete_rating_route(rating_id: int, db: AsyncSession = Depends(get_db)):
+@router.delete("/ratings/{rating_id}", response_model=Detail)
+async def delete_rating_route(rating_id: int, user_id: int = Depends(get_current_user_id), db: AsyncSession = Depends(get_db)):
+    await get_owned_rating(db, rating_id, user_id)
     return await delete_rating(db, rating_id)
 
-
-@router.get("/ratings_filtered/")
-async def read_competition_name(squad_id: Optional[int] = None, db: AsyncSession = Depends(get_db)):
+@router.get("/ratings_filtered/", response_model=RatingPage, response_model_exclude_unset=True)
+async def read_ratings_filtered(squad_id: Optional[int] = None, after_id: Optional[int] = None,
+                                limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), fields: Optional[str] = None,
+                                db: AsyncSession = Depends(get_read_db)):
     if squad_id:
-        return await get_rating_for_squad(db, squad_id)
+        ratings, next_cursor = await get_rating_for_squad(db, squad_id, after_id, limit, fields, as_rows=True)
+        return {"ratings": ratings, "next_cursor": next_cursor}
     else:
         raise HTTPException(status_code=400, detail="Please provide a filter parameter: squad_id")
\ No newline at end of file
@@ -1,33 +1,45 @@
-from fastapi import APIRouter, Depends
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from crud.squad_players import create_squad_player, delete_squad_player, get_squad_player_by_id, get_squad_player_by_squad_id, get_squad_players, update_squad_player
-from db import get_db
-from models.models import SquadPlayerCreate
+from db import get_db, get_read_db
+from crud.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from crud.squads import get_owned_squad
+from models.models import Detail, SquadPlayerCreate, SquadPlayerPage, SquadPlayerRead
+from core.tokens import get_current_user_id
 
 router=APIRouter()
 
 # SquadPlayers Endpoints
-@router.get("/squad_players/")
-async def read_squad_players(db: AsyncSession = Depends(get_db)):
-    return {"squad_players": await get_squad_players(db)}
+@router.get("/squad_players/", response_model=SquadPlayerPage, response_model_exclude_unset=True)
+async def read_squad_players(after_id: Optional[int] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                             fields: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    squad_players, next_cursor = await get_squad_players(db, after_id, limit, fields, as_rows=True)
+    return {"squad_players": squad_players, "next_cursor": next_cursor}
 
-@router.get("/squad_players/{squad_player_id}")
-async def read_squad_player(squad_player_id: int, db: AsyncSession = Depends(get_db)):
+@router.get("/squad_players/{squad_player_id}", response_model=SquadPlayerRead)
+async def read_squad_player(squad_player_id: int, db: AsyncSession = Depends(get_read_db)):
     return await get_squad_player_by_id(db, squad_player_id)
 
-@router.post("/squad_players/")
-async def create_squad_player_route(squad_player: SquadPlayerCreate, db: AsyncSession = Depends(get_db)):
+@router.post("/squad_players/", response_model=SquadPlayerRead)
+async def create_squad_player_route(squad_player: SquadPlayerCreate, user_id: int = Depends(get_current_user_id),
+                                    db: AsyncSession = Depends(get_db)):
+    await get_owned_squad(db, squad_player.squad_id, user_id)
     return await create_squad_player(db, squad_player)
 
-@router.put("/squad_players/{squad_player_id}")
-async def update_squad_player_route(squad_player: SquadPlayerCreate, squad_player_id: int, db: AsyncSession = Depends(get_db)):
+# Both the squad the player is in and the one it is moved to must belong to the user
+@router.put("/squad_players/{squad_player_id}", response_model=SquadPlayerRead)
+async def update_squad_player_route(squad_player: SquadPlayerCreate, squad_player_id: int, user_id: int = Depends(get_current_user_id),
+                                    db: AsyncSession = Depends(get_db)):
+    await get_owned_squad(db, (await get_squad_player_by_id(db, squad_player_id)).squad_id, user_id)
+    await get_owned_squad(db, squad_player.squad_id, user_id)
     return await update_squad_player(db, squad_player, squad_player_id)
-    
 
-@router.delete("/squad_players/{squad_player_id}")
-async def delete_squad_player_route(squad_player_id: int, db: AsyncSession = Depends(get_db)):
+@router.delete("/squad_players/{squad_player_id}", response_model=Detail)
+async def delete_squad_player_route(squad_player_id: int, user_id: int = Depends(get_current_user_id), db: AsyncSession = Depends(get_db)):
+    await get_owned_squad(db, (await get_squad_player_by_id(db, squad_player_id)).squad_id, user_id)
     return await delete_squad_player(db, squad_player_id)
 
-@router.get("/players_in_squad/{squad_id}")
-async def read_squad_player(squad_id: int, db: AsyncSession = Depends(get_db)):
+@router.get("/players_in_squad/{squad_id}", response_model=List[SquadPlayerRead])
+async def read_squad_player(squad_id: int, db: AsyncSession = Depends(get_read_db)):
     return await get_squad_player_by_squad_id(db, squad_id)
\ No newline at end of file
@@ -1,37 +1,78 @@
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from crud.squads import create_squad, delete_squad, get_squad_by_id, get_squad_with_filters, get_squads, update_squad
-from db import get_db
-from models.models import SquadCreate
+from crud.squads import create_squad, delete_squad, get_owned_squad, get_squad_by_id, get_squad_full, get_squad_leaderboard, get_squad_with_filters, get_squads, update_squad
+from crud.squad_solver import solve_squad
+from crud.squad_players import set_squad_lineup
+from db import get_db, get_read_db
+from core.cache import coalesced_response
+from crud.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from models.models import Detail, SquadCreate, SquadFull, SquadLeaderboard, SquadLineup, SquadLineupPlayer, SquadPage, SquadRead, SquadSolution, SquadSolve
+from core.tokens import get_current_user_id
 
 router=APIRouter()
 
 # Squads Endpoints
-@router.get("/squads/")
-async def read_squads(db: AsyncSession = Depends(get_db)):
-    return {"squads": await get_squads(db)}
+@router.get("/squads/", response_model=SquadPage, response_model_exclude_unset=True)
+async def read_squads(after_id: Optional[int] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                      fields: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    squads, next_cursor = await get_squads(db, after_id, limit, fields, as_rows=True)
+    return {"squads": squads, "next_cursor": next_cursor}
 
-@router.get("/squads/{squad_id}")
-async def read_squad(squad_id: int, db: AsyncSession = Depends(get_db)):
-    return await get_squad_by_id(db, squad_id)
+# Declared before /squads/{squad_id} so "leaderboard" is not read as an id
+@router.get("/squads/leaderboard", response_model=SquadLeaderboard)
+async def read_squad_leaderboard(request: Request, competition_id: Optional[int] = None, nationality_id: Optional[int] = None,
+                                 limit: int = Query(10, ge=1, le=100), db: AsyncSession = Depends(get_read_db)):
+    async def load():
+        return {"squads": await get_squad_leaderboard(db, competition_id, nationality_id, limit)}
+    return await coalesced_response(request, SquadLeaderboard, load)
 
-@router.post("/squads/")
-async def create_squad_route(squad: SquadCreate, db: AsyncSession = Depends(get_db)):
+@router.get("/squads/{squad_id}", response_model=SquadRead)
+async def read_squad(request: Request, squad_id: int, db: AsyncSession = Depends(get_read_db)):
+    return await coalesced_response(request, SquadRead, lambda: get_squad_by_id(db, squad_id))
+
+# Squad with formation, limits, players and rating summary in one request
+@router.get("/squads/{squad_id}/full", response_model=SquadFull)
+async def read_squad_full(request: Request, squad_id: int, db: AsyncSession = Depends(get_read_db)):
+    return await coalesced_response(request, SquadFull, lambda: get_squad_full(db, squad_id))
+
+@router.post("/squads/", response_model=SquadRead)
+async def create_squad_route(squad: SquadCreate, user_id: int = Depends(get_current_user_id), db: AsyncSession = Depends(get_db)):
+    if squad.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Squads can only be created for the logged in user")
     return await create_squad(db, squad)
 
-@router.put("/squads/{squad_id}")
-async def update_squad_route(squad: SquadCreate, squad_id: int, db: AsyncSession = Depends(get_db)):
+@router.put("/squads/{squad_id}", response_model=SquadRead)
+async def update_squad_route(squad: SquadCreate, squad_id: int, user_id: int = Depends(get_current_user_id),
+                             db: AsyncSession = Depends(get_db)):
+    if squad.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Squads cannot be given to another user")
+    await get_owned_squad(db, squad_id, user_id)
     return await update_squad(db, squad, squad_id)
-    
 
-@router.delete("/squads/{squad_id}")
-async def delete_squad_route(squad_id: int, db: AsyncSession = Depends(get_db)):
+@router.delete("/squads/{squad_id}", response_model=Detail)
+async def delete_squad_route(squad_id: int, user_id: int = Depends(get_current_user_id), db: AsyncSession = Depends(get_db)):
+    await get_owned_squad(db, squad_id, user_id)
     return await delete_squad(db, squad_id)
 
-@router.get("/squads_filtered/")
-async def read_squads_filtered(user_id: Optional[int] = None, name: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+@router.get("/squads_filtered/", response_model=SquadPage, response_model_exclude_unset=True)
+async def read_squads_filtered(user_id: Optional[int] = None, name: Optional[str] = None, after_id: Optional[int] = None,
+                               limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), fields: Optional[str] = None,
+                               db: AsyncSession = Depends(get_read_db)):
     if user_id or name:
-        return await get_squad_with_filters(db, user_id, name)
+        squads, next_cursor = await get_squad_with_filters(db, user_id, name, after_id, limit, fields, as_rows=True)
+        return {"squads": squads, "next_cursor": next_cursor}
     else:
-        raise HTTPException(status_code=400, detail="Please provide a filter parameter: name or user")
\ No newline at end of file
+        raise HTTPException(status_code=400, detail="Please provide a filter parameter: name or user")
+
+@router.post("/squads/{squad_id}/solve", response_model=SquadSolution)
+async def solve_squad_route(squad_id: int, options: Optional[SquadSolve] = None, db: AsyncSession = Depends(get_db)):
+    options = options or SquadSolve()
+    return await solve_squad(db, squad_id, options.objective)
+
+# Save the whole lineup of a squad in one request
+@router.put("/squads/{squad_id}/players", response_model=SquadLineup)
+async def set_squad_lineup_route(squad_id: int, lineup: List[SquadLineupPlayer], user_id: int = Depends(get_current_user_id),
+                                 db: AsyncSession = Depends(get_db)):
+    await get_owned_squad(db, squad_id, user_id)
+    return {"squad_players": await set_squad_lineup(db, squad_id, lineup)}
@@ -1,32 +1,41 @@
-from fastapi import APIRouter, Depends
+from typing import Any, List
+from fastapi import APIRouter, Body, Depends, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from crud.team_competitions import create_team_competition, delete_team_competition, get_competition_participants_by_competition_id, get_team_competition_by_team_id_competition_id, get_team_competitions, get_team_in_competitions_by_team_id
-from db import get_db
-from models.models import TeamCompetitionCreate
+from crud.bulk import BULK_MAX_ROWS
+from crud.team_competitions import create_team_competition, create_team_competitions, delete_team_competition, get_competition_participants_by_competition_id, get_team_competition_by_team_id_competition_id, get_team_competitions, get_team_in_competitions_by_team_id
+from db import get_db, get_read_db
+from core.cache import cached_response
+from models.models import Detail, TeamCompetitionBulk, TeamCompetitionCreate, TeamCompetitionList, TeamCompetitionRead
 
 router=APIRouter()
 
 # TeamCompetitions Endpoints
-@router.get("/teams_competitions/")
-async def read_team_competitions(db: AsyncSession = Depends(get_db)):
-    return {"team_competitions": await get_team_competitions(db)}
+@router.get("/teams_competitions/", response_model=TeamCompetitionList)
+async def read_team_competitions(request: Request, db: AsyncSession = Depends(get_read_db)):
+    async def load():
+        return {"team_competitions": await get_team_competitions(db)}
+    return await cached_response(request, ("team_competition",), TeamCompetitionList, load)
 
-@router.get("/teams_competitions/{team_id}/{competition_id}")
-async def read_team_competition(team_id: int, competition_id: int, db: AsyncSession = Depends(get_db)):
-    return await get_team_competition_by_team_id_competition_id(db, team_id, competition_id)
+@router.get("/teams_competitions/{team_id}/{competition_id}", response_model=TeamCompetitionRead)
+async def read_team_competition(request: Request, team_id: int, competition_id: int, db: AsyncSession = Depends(get_read_db)):
+    return await cached_response(request, ("team_competition",), TeamCompetitionRead, lambda: get_team_competition_by_team_id_competition_id(db, team_id, competition_id))
 
-@router.get("/team_competitions/{team_id}")
-async def read_team_in_competitions(team_id: int, db: AsyncSession = Depends(get_db)):
-    return await get_team_in_competitions_by_team_id(db, team_id)
+@router.get("/team_competitions/{team_id}", response_model=List[TeamCompetitionRead])
+async def read_team_in_competitions(request: Request, team_id: int, db: AsyncSession = Depends(get_read_db)):
+    return await cached_response(request, ("team_competition",), List[TeamCompetitionRead], lambda: get_team_in_competitions_by_team_id(db, team_id))
 
-@router.get("/competition_participants/{competition_id}")
-async def read_competition_participants(competition_id: int, db: AsyncSession = Depends(get_db)):
-    return await get_competition_participants_by_competition_id(db, competition_id)
+@router.get("/competition_participants/{competition_id}", response_model=List[TeamCompetitionRead])
+async def read_competition_participants(request: Request, competition_id: int, db: AsyncSession = Depends(get_read_db)):
+    return await cached_response(request, ("team_competition",), List[TeamCompetitionRead], lambda: get_competition_participants_by_competition_id(db, competition_id))
 
-@router.post("/teams_competitions/")
+@router.post("/teams_competitions/", response_model=TeamCompetitionRead)
 async def create_team_competition_route(team_competition: TeamCompetitionCreate, db: AsyncSession = Depends(get_db)):
     return await create_team_competition(db, team_competition)
 
-@router.delete("/teams_competitions/{team_id}/{competition_id}")
+@router.post("/teams_competitions/bulk", response_model=TeamCompetitionBulk)
+async def create_team_competitions_route(team_competitions: List[Any] = Body(..., max_length=BULK_MAX_ROWS), db: AsyncSession = Depends(get_db)):
+    return await create_team_competitions(db, team_competitions)
+
+@router.delete("/teams_competitions/{team_id}/{competition_id}", response_model=Detail)
 async def delete_team_competition_route(team_id: int, competition_id: int, db: AsyncSession = Depends(get_db)):
     return await delete_team_competition(db, team_id, competition_id)
\ No newline at end of file
@@ -1,37 +1,51 @@
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Any, List, Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from crud.teams import create_team, delete_team, get_team_by_id, get_team_by_name, get_teams, update_team
-from db import get_db
-from models.models import TeamCreate
+from crud.teams import create_team, create_teams, delete_team, get_team_by_id, get_team_by_name, get_teams, update_team
+from db import get_db, get_read_db
+from core.cache import cached_response
+from crud.bulk import BULK_MAX_ROWS
+from crud.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from models.models import Detail, TeamBulk, TeamCreate, TeamPage, TeamRead
 
 router=APIRouter()
 
 # Teams Endpoints
-@router.get("/teams/")
-async def read_teams(db: AsyncSession = Depends(get_db)):
-    return {"teams": await get_teams(db)}
+@router.get("/teams/", response_model=TeamPage, response_model_exclude_unset=True)
+async def read_teams(request: Request, after_id: Optional[int] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                     fields: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    async def load():
+        teams, next_cursor = await get_teams(db, after_id, limit, fields)
+        return {"teams": teams, "next_cursor": next_cursor}
+    return await cached_response(request, ("team",), TeamPage, load)
 
-@router.get("/teams/{team_id}")
-async def read_team(team_id: int, db: AsyncSession = Depends(get_db)):
-    return await get_team_by_id(db, team_id)
+@router.get("/teams/{team_id}", response_model=TeamRead)
+async def read_team(request: Request, team_id: int, db: AsyncSession = Depends(get_read_db)):
+    return await cached_response(request, ("team",), TeamRead, lambda: get_team_by_id(db, team_id))
 
-@router.post("/teams/")
+@router.post("/teams/", response_model=TeamRead)
 async def create_team_route(team: TeamCreate, db: AsyncSession = Depends(get_db)):
     return await create_team(db, team)
 
-@router.put("/teams/{team_id}")
+@router.post("/teams/bulk", response_model=TeamBulk)
+async def create_teams_route(teams: List[Any] = Body(..., max_length=BULK_MAX_ROWS), db: AsyncSession = Depends(get_db)):
+    return await create_teams(db, teams)
+
+@router.put("/teams/{team_id}", response_model=TeamRead)
 async def update_team_route(team: TeamCreate, team_id: int, db: AsyncSession = Depends(get_db)):
     return await update_team(db, team, team_id)
     
 
-@router.delete("/teams/{team_id}")
+@router.delete("/teams/{team_id}", response_model=Detail)
 async def delete_team_route(team_id: int, db: AsyncSession = Depends(get_db)):
     return await delete_team(db, team_id)
 
-@router.get("/teams_filtered/")
-async def read_team_name(name: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+@router.get("/teams_filtered/", response_model=TeamPage, response_model_exclude_unset=True)
+async def read_team_name(name: Optional[str] = None, after_id: Optional[int] = None,
+                         limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), fields: Optional[str] = None,
+                         db: AsyncSession = Depends(get_read_db)):
     if name:
-        return await get_team_by_name(db, name)
+        teams, next_cursor = await get_team_by_name(db, name, after_id, limit, fields)
+        return {"teams": teams, "next_cursor": next_cursor}
     else:
         raise HTTPException(status_code=400, detail="Please provide a filter parameter: name")
\ No newline at end of file
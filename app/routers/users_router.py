@@ -1,35 +1,57 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from db import get_db
+from db import get_db, get_read_db
+from crud.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 from crud.usuarios import create_user, delete_user, get_user_by_id, get_users, update_user, verify_user_credentials
-from models.models import UserCredentials, UsuarioCreate
+from models.models import Detail, TokenPair, TokenRefresh, UserCredentials, UsuarioCreate, UsuarioPage, UsuarioRead
+from core.tokens import REFRESH_TOKEN, create_token_pair, decode_token, get_current_user_id, revoke_token
 
 router=APIRouter()
 
 # Users Endpoints
-@router.get("/users/")
-async def read_users(db: AsyncSession = Depends(get_db)):
-    return {"users": await get_users(db)}
+@router.get("/users/", response_model=UsuarioPage, response_model_exclude_unset=True)
+async def read_users(after_id: Optional[int] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                     fields: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    users, next_cursor = await get_users(db, after_id, limit, fields)
+    return {"users": users, "next_cursor": next_cursor}
 
-@router.get("/users/{user_id}")
-async def read_user(user_id: int, db: AsyncSession = Depends(get_db)):
+@router.get("/users/{user_id}", response_model=UsuarioRead)
+async def read_user(user_id: int, db: AsyncSession = Depends(get_read_db)):
     return await get_user_by_id(db, user_id)
 
-@router.post("/users/")
+@router.post("/users/", response_model=UsuarioRead)
 async def create_user_route(usuario: UsuarioCreate, db: AsyncSession = Depends(get_db)):
     return await create_user(db, usuario)
 
-@router.put("/users/{user_id}")
-async def update_user_route(usuario: UsuarioCreate, user_id: int, db: AsyncSession = Depends(get_db)):
+@router.put("/users/{user_id}", response_model=UsuarioRead)
+async def update_user_route(usuario: UsuarioCreate, user_id: int, current_user_id: int = Depends(get_current_user_id),
+                            db: AsyncSession = Depends(get_db)):
+    if current_user_id != user_id:
+        raise HTTPException(status_code=403, detail="Solo puedes modificar tu propio usuario")
     return await update_user(db, usuario, user_id)
 
-@router.delete("/users/{user_id}")
-async def delete_user_route(user_id: int, db: AsyncSession = Depends(get_db)):
+@router.delete("/users/{user_id}", response_model=Detail)
+async def delete_user_route(user_id: int, current_user_id: int = Depends(get_current_user_id), db: AsyncSession = Depends(get_db)):
+    if current_user_id != user_id:
+        raise HTTPException(status_code=403, detail="Solo puedes eliminar tu propio usuario")
     return await delete_user(db, user_id)
 
-@router.post("/users/verify/")
+@router.post("/users/verify/", response_model=TokenPair)
 async def verify_user_route(credentials: UserCredentials, db: AsyncSession = Depends(get_db)):
     is_valid = await verify_user_credentials(db, credentials.username, credentials.password)
     if not is_valid:
         raise HTTPException(status_code=401, detail="Credenciales inválidas")
-    return is_valid
\ No newline at end of file
+    return create_token_pair(is_valid)
+
+# Nuevo par de tokens a partir de un refresh token (el anterior queda revocado)
+@router.post("/users/refresh/", response_model=TokenPair)
+async def refresh_token_route(token: TokenRefresh):
+    claims = decode_token(token.refresh_token, REFRESH_TOKEN)
+    revoke_token(claims)
+    return create_token_pair(claims["sub"])
+
+@router.post("/users/logout/", response_model=Detail)
+async def logout_route(token: TokenRefresh):
+    revoke_token(decode_token(token.refresh_token, REFRESH_TOKEN))
+    return {"detail": "Logged out"}
\ No newline at end of file
@@ -1,7 +1,7 @@
 import React, { useState, useEffect, useMemo } from 'react';
 import '../App.css';
 import { Link } from 'react-router-dom';
-import { postSquad, postSquadPlayers, putSquadPlayers, deleteSquadPlayers } from '../services/api';
+import { postSquad, putSquadLineup } from '../services/api';
 
 const SquadBuilder = ({ selectedCompetition, playersList, selectedNationality, budget, user_id, players_in_squad, squad_id }) => {
   const [players, setPlayers] = useState(playersList);
@@ -10,7 +10,6 @@ const SquadBuilder = ({ selectedCompetition, playersList, selectedNationality, b
   const [budgetLimit, setBudget] = useState(budget);
   const [filteredPlayers, setFilteredPlayers] = useState([]);
   const [squad, setSquad] = useState(players_in_squad || []);
-  const [savedPlayers, setSavedPlayers] = useState([]);
   const [filterName, setFilterName] = useState('');
   const [selectedPlayer, setSelectedPlayer] = useState(null);
   const [selectedPosition, setSelectedPosition] = useState('');
@@ -89,12 +88,11 @@ const SquadBuilder = ({ selectedCompetition, playersList, selectedNationality, b
     if (players_in_squad) {
       // Map players
       const mappedSquad = players_in_squad.map((squadPlayer) => {
-        const fullPlayer = playersList.find((player) => player.id === squadPlayer.player_id);
+        const fullPlayer = squadPlayer.player || playersList.find((player) => player.id === squadPlayer.player_id);
         return fullPlayer ? { ...fullPlayer, position: squadPlayer.position, id: squadPlayer.id, player_id: squadPlayer.player_id } : null;
       }).filter(player => player !== null);
       
       setSquad(mappedSquad);
-      setSavedPlayers(mappedSquad);
     }
   }, [players_in_squad, playersList]);
 
@@ -162,102 +160,8 @@ const SquadBuilder = ({ selectedCompetition, playersList, selectedNationality, b
 
   const saveSquadPlayers = async (squadId) => {
     try {
-      // Get which players of the squad are new, which one has not been changed, which one were changed of position and which ones where deleted.
-      const newPlayers = squad.filter(
-        (player) => !savedPlayers.some((sp) => sp.player_id === player.player_id)
-      );
-
-      const modifiedPlayers = savedPlayers
-        .filter((savedPlayer) =>
-          squad.some(
-            (player) =>
-              player.player_id === savedPlayer.player_id &&
-              player.position !== savedPlayer.position
-          )
-        )
-        .map((savedPlayer) => {
-          const matchingPlayer = squad.find(
-            (player) => player.player_id === savedPlayer.player_id
-          );
-
-          return {
-            ...savedPlayer,
-            position: matchingPlayer.position
-          };
-        });
-
-
-      const removedPlayers = savedPlayers.filter(
-        (savedPlayer) =>
-          !squad.some((player) => player.player_id === savedPlayer.player_id)
-      );
-
-      // POST new players
-      if (newPlayers.length > 0) {
-        try {
-          const postResponses = await Promise.all(
-            newPlayers.map((player) => postSquadPlayers([player], squadId))
-          );
-
-          const newSavedPlayers = postResponses.flatMap((responseArray) => {
-            if (Array.isArray(responseArray) && responseArray.length > 0) {
-              const response = responseArray[0];
-              if (response && response.data) {
-                return response.data;
-              }
-            }
-            console.warn('Unexpected response structure:', responseArray);
-            return null;
-          }).filter((item) => item !== null);
-
-          setSavedPlayers((prev) => [...prev, ...newSavedPlayers]);
-        } catch (error) {
-          console.error('Error en postSquadPlayers:', error);
-        }
-      }
-
-      // PUT changed players
-      if (modifiedPlayers.length > 0) {
-        await putSquadPlayers(modifiedPlayers, squadId);
-
-        setSavedPlayers((prev) => {
-          const unmodifiedPlayers = prev.filter(
-            (savedPlayer) =>
-              !modifiedPlayers.some(
-                (modifiedPlayer) =>
-                  modifiedPlayer.player_id === savedPlayer.player_id
-              )
-          );
-
-          const updatedPlayers = modifiedPlayers.map((modifiedPlayer) => {
-            const updatedSquadPlayer = squad.find(
-              (player) => player.player_id === modifiedPlayer.player_id
-            );
-
-            return {
-              ...modifiedPlayer,
-              position: updatedSquadPlayer.position,
-            };
-          });
-
-          return [...unmodifiedPlayers, ...updatedPlayers];
-        });
-      }
-
-      // DELETE deleted players
-      if (removedPlayers.length > 0) {
-        await deleteSquadPlayers(
-          removedPlayers.map((player) => player.id),
-          squadId
-        );
-
-        setSavedPlayers((prev) =>
-          prev.filter(
-            (savedPlayer) =>
-              !removedPlayers.some((rp) => rp.id === savedPlayer.id)
-          )
-        );
-      }
+      // The API computes which players are new, moved or removed and saves the whole lineup at once.
+      await putSquadLineup(squad, squadId);
 
       alert('Squad saved successfully!');
     } catch (error) {
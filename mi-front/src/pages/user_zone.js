@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { Routes, Route, Link, useNavigate } from 'react-router-dom';
-import { getUserSquads, getFilteredPlayers, getSquadPlayers, getCompetitions, getNationalities } from '../services/api';
+import { getUserSquads, getFilteredPlayers, getSquadFull, getCompetitions, getNationalities } from '../services/api';
 import SquadBuilder from './squad_builder';
 
 const UserZone = ({ user_id }) => {
@@ -62,8 +62,12 @@ const UserZone = ({ user_id }) => {
   
   const handleSelectSquad = async (squad_id, competition_id, budget, nationality_id) => {
     try {
-      const playersList = await getFilteredPlayers(competition_id, nationality_id, budget);
-      const players_in_squad = await getSquadPlayers(squad_id);
+      // The squad players come with their player data, the filtered list is only for searching new ones
+      const [squadFull, playersList] = await Promise.all([
+        getSquadFull(squad_id),
+        getFilteredPlayers(competition_id, nationality_id, budget),
+      ]);
+      const players_in_squad = squadFull.squad_players;
       setSelectedSquad({
         selectedCompetition: competition_id,
         playersList,
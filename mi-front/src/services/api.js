@@ -8,10 +8,85 @@ const apiClient = axios.create({
   },
 });
 
+// Catalog tables of /catalog/snapshot, loaded once and shared by every page until we write something
+let catalog = null;
+
+// Session tokens returned by /users/verify/
+let accessToken = null;
+let refreshToken = null;
+// Server time of our last write, sent back so our reads are served by the primary database
+let lastWrite = null;
+
+apiClient.interceptors.request.use((config) => {
+  if (accessToken) {
+    config.headers.Authorization = 'Bearer ' + accessToken;
+  }
+  if (lastWrite) {
+    config.headers['X-Last-Write'] = lastWrite;
+  }
+  return config;
+});
+
+// When the access token expires, get a new pair with the refresh token and retry once.
+apiClient.interceptors.response.use(
+  (response) => {
+    if (response.headers['x-last-write']) {
+      lastWrite = response.headers['x-last-write'];
+      catalog = null;
+    }
+    return response;
+  },
+  async (error) => {
+    const request = error.config;
+    if (error.response && error.response.status === 401 && refreshToken && !request._retried) {
+      request._retried = true;
+      const response = await axios.post(apiClient.defaults.baseURL + '/users/refresh/', { refresh_token: refreshToken });
+      accessToken = response.data.access_token;
+      refreshToken = response.data.refresh_token;
+      return apiClient(request);
+    }
+    throw error;
+  }
+);
+
+// Lists are paginated by the API: follow next_cursor until every page has been read.
+const getAllPages = async (url, key, params = {}) => {
+  let items = [];
+  let after_id = null;
+  do {
+    const pageParams = after_id === null ? params : { ...params, after_id };
+    const response = await apiClient.get(url, { params: { ...pageParams, limit: 1000 } });
+    items = items.concat(response.data[key]);
+    after_id = response.data.next_cursor;
+  } while (after_id !== null && after_id !== undefined);
+  return items;
+};
+
+// Players, nationalities, teams, competitions and team_competitions in a single request.
+// Each table comes as column names and value rows, turned back into objects here.
+const getCatalog = () => {
+  if (catalog === null) {
+    catalog = apiClient.get('/catalog/snapshot').then((response) => {
+      // "version" is the change log version of the bundle (see /catalog/changes), kept as it is
+      const tables = { version: response.data.version };
+      Object.entries(response.data).forEach(([key, table]) => {
+        if (key === 'version') {
+          return;
+        }
+        tables[key] = table.rows.map((row) => Object.fromEntries(table.columns.map((column, index) => [column, row[index]])));
+      });
+      return tables;
+    });
+    catalog.catch(() => {
+      catalog = null;
+    });
+  }
+  return catalog;
+};
+
 export const getPlayers = async () => {
   try {
-    const response = await apiClient.get('/players/');
-    return response.data;
+    return { players: (await getCatalog()).players };
   } catch (error) {
     console.error('Error fetching data:', error);
     throw error;
@@ -20,8 +95,7 @@ export const getPlayers = async () => {
 
 export const getNationalities = async () => {
   try {
-    const response = await apiClient.get('/nationalities/');
-    return response.data;
+    return { nationalities: (await getCatalog()).nationalities };
   } catch (error) {
     console.error('Error fetching nationalities:', error);
     throw error;
@@ -30,8 +104,7 @@ export const getNationalities = async () => {
 
 export const getTeams = async () => {
   try {
-    const response = await apiClient.get('/teams/');
-    return response.data;
+    return { teams: (await getCatalog()).teams };
   } catch (error) {
     console.error('Error fetching teams:', error);
     throw error;
@@ -40,8 +113,7 @@ export const getTeams = async () => {
 
 export const getCompetitions = async () => {
   try {
-    const response = await apiClient.get('/competitions/');
-    return response.data;
+    return { competitions: (await getCatalog()).competitions };
   } catch (error) {
     console.error('Error fetching competitions:', error);
     throw error;
@@ -64,8 +136,7 @@ export const getFilteredPlayers = async (competition_id = null, nationality_id =
       params.market_value = market_value;
     }
 
-    const response = await apiClient.get('/players_filtered/', { params });
-    return response.data;
+    return await getAllPages('/players_filtered/', 'players', params);
   } catch (error) {
     console.error('Error fetching filtered players:', error);
     throw error;
@@ -103,64 +174,27 @@ export const postSquad = async (competition_id = null, nationality_id = null, bu
   }
 };
 
-export const postSquadPlayers = async (players = [], squad_id) => {
+export const putSquadLineup = async (players = [], squad_id) => {
   try {
-    const savedPlayers = []
-    for (const player of players) {
-      const dataPlayer = {
-        squad_id: squad_id,
-        player_id: player.player_id,
-        position: player.position,
-      };
+    const lineup = players.map((player) => ({
+      player_id: player.player_id,
+      position: player.position,
+    }));
 
-      savedPlayers.push(await apiClient.post('/squad_players/', dataPlayer));
-      
-    }
-    return savedPlayers;
-  } catch (error) {
-    console.error('Error posting squad players:', error);
-    throw error;
-  }
-}
-
-export const putSquadPlayers = async (players = [], squad_id) => {
-  try {
-    for (const player of players) {
-      const dataPlayer = {
-        squad_id: squad_id,
-        player_id: player.player_id,
-        position: player.position,
-      };
-
-      await apiClient.put('/squad_players/' + player.id, dataPlayer);
-      
-    }
+    const response = await apiClient.put('/squads/' + squad_id + '/players', lineup);
+    return response.data.squad_players;
   } catch (error) {
-    console.error('Error putting squad players:', error);
+    console.error('Error saving squad lineup:', error);
     throw error;
   }
-  
 }
 
-export const deleteSquadPlayers = async (players = []) => {
-    try {
-      for (const player of players) {
-        await apiClient.delete('/squad_players/' + player);
-      }
-    } catch (error) {
-      console.error('Error deleting squad players:', error);
-      throw error;
-    }
-    
-  }
-
   export const getUserSquads = async (user_id) => {
     try {
       const params = {};
       params.user_id = parseInt(user_id);
 
-      const response = await apiClient.get('/squads_filtered/', {params});
-      return response.data;
+      return await getAllPages('/squads_filtered/', 'squads', params);
     } catch (error) {
       console.error('Error fetching competitions:', error);
       throw error;
@@ -173,17 +207,20 @@ export const deleteSquadPlayers = async (players = []) => {
     params.username = username;
     params.password = password;
     const response = await apiClient.post('/users/verify/', params);
-    return response.data;
+    accessToken = response.data.access_token;
+    refreshToken = response.data.refresh_token;
+    return response.data.user_id;
   };
 
 
 
-export const getSquadPlayers = async (squad_id = null) => {
+// Squad with its limits, formation, players (with team and nationality) and rating summary.
+export const getSquadFull = async (squad_id = null) => {
   try {
-    const response = await apiClient.get('/players_in_squad/' + parseInt(squad_id));
+    const response = await apiClient.get('/squads/' + parseInt(squad_id) + '/full');
     return response.data;
   } catch (error) {
-    console.error('Error fetching filtered players:', error);
+    console.error('Error fetching squad:', error);
     throw error;
   }
 };